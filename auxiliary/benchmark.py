@@ -0,0 +1,200 @@
+# Benchmarks every pipeline stage on synthetic images of several sizes and colour profiles and writes the results as
+# JSON. Each stage/profile pair runs in a fresh process with an empty Numba cache, so the cold time includes JIT
+# compilation; the warm time is the median of the repeats that follow. Peak memory is the tracemalloc peak of one
+# extra warm run, which includes arrays allocated inside Numba kernels.
+# Run from the repository root, e.g.
+#     python auxiliary/benchmark.py --output bench.json
+#     python auxiliary/benchmark.py --megapixels 1 --profiles noisy --stages equalize reverse --compare old.json
+import argparse
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numba
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import models  # noqa: E402
+
+PROCESSING_PARAMS = {models.ParamType.EQUALIZE: 10.,
+                     models.ParamType.BRIGHTNESS: 1.2,
+                     models.ParamType.CONTRAST: 1.1,
+                     models.ParamType.SATURATION: 1.2,
+                     models.ParamType.WARMTH: .1,
+                     models.ParamType.TINT: -.1,
+                     models.ParamType.TWO_TONE_HUE: 10.,
+                     models.ParamType.TWO_TONE_SATURATION: 1.1}
+PROFILES = ('flat', 'smooth', 'noisy')
+# the pipeline stages as _ImageProcessor runs them, each mapped to whether it is fused and its name there; equalize
+# is shared by both modes
+PIPELINE_STAGES = {'equalize': (False, 'equalize'),
+                   'lsrgb2lms': (False, 'lsrgb2lms'),
+                   'brightness_contrast_wb': (False, 'brightnessContrastWb'),
+                   'hue_saturation': (False, 'hueSaturation'),
+                   'fused_color': (True, 'color')}
+STAGES = ('unique_pixel_data', 'reverse', *PIPELINE_STAGES, 'change_processing_params', 'save_image')
+
+
+def synthetic_image(megapixels, profile, seed=0):
+    # flat: a few dozen colours as in graphics, smooth: gradients with mild noise, noisy: high ISO photo
+    width = max(int(np.sqrt(megapixels*1e6*1.5)), 1)
+    height = max(int(megapixels*1e6/width), 1)
+    rng = np.random.default_rng(seed)
+    if profile == 'flat':
+        palette = rng.integers(256, size=(32, 3), dtype=np.uint8)
+        blockIndices = rng.integers(32, size=((height+63)//64, (width+63)//64))
+        blockIndices = np.kron(blockIndices, np.ones((64, 64), dtype=np.int64))[:height, :width]
+        return np.ascontiguousarray(palette[blockIndices])
+    noiseLevel = {'smooth': 2., 'noisy': 24.}[profile]
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.stack([255*x/width, 255*y/height, 255*(x+y)/(width+height)], axis=2)
+    image += rng.normal(0, noiseLevel, image.shape).astype(np.float32)
+    return np.clip(image+.5, 0, 255).astype(np.uint8)
+
+
+def _stage_runner(stage, image, workDir):
+    # returns a setup function and a run function taking the setup's result; only run is timed
+    if stage == 'unique_pixel_data':
+        return lambda i: None, lambda _: models._UniquePixelData(image)
+    uniquePixels = models._UniquePixelData(image)
+    if stage == 'reverse':
+        uniquePixels.values = uniquePixels.values.astype(np.float32)/255
+        return lambda i: None, lambda _: uniquePixels.reverse()
+    if stage in PIPELINE_STAGES:
+        fused, pipelineStage = PIPELINE_STAGES[stage]
+        imageProcessor = models._ImageProcessor(uniquePixels, fused=fused)
+        params = {**imageProcessor.default_processing_params(), **PROCESSING_PARAMS}
+        stages = imageProcessor._stages
+        # the stage's input comes from running the stages before it once; stages never modify their input
+        values = uniquePixels.values
+        for earlierStage in stages[:stages.index(pipelineStage)]:
+            values = imageProcessor._run_stage(earlierStage, values, params, imageProcessor._modifiers)
+        return lambda i: None, lambda _: imageProcessor._run_stage(pipelineStage, values, params,
+                                                                   imageProcessor._modifiers)
+    imagePath = os.path.join(workDir, 'input.png')
+    cv2.imwrite(imagePath, image[:, :, [2, 1, 0]])
+    if stage == 'change_processing_params':
+        model = models.Model(imagePath, maxDisplayImageSize=image.shape[:2])
+        # the brightness changes on every run so that the stage cache can't skip the work
+        return (lambda i: {**PROCESSING_PARAMS, models.ParamType.BRIGHTNESS: 1.2+.01*i},
+                model.change_processing_params)
+    if stage == 'save_image':
+        model = models.Model(imagePath, maxDisplayImageSize=(64, 64))
+        model._get_true_image_pixels()
+        outputPath = os.path.join(workDir, 'output.png')
+        return lambda i: None, lambda _: model.save_image(outputPath, PROCESSING_PARAMS)
+    raise ValueError('Unknown stage '+str(stage))
+
+
+def run_case(stage, megapixels, profile, repeats):
+    # runs in its own process
+    image = synthetic_image(megapixels, profile)
+    pixelCount = image.shape[0]*image.shape[1]
+    with tempfile.TemporaryDirectory() as workDir:
+        setup, run = _stage_runner(stage, image, workDir)
+        times = []
+        for i in range(repeats+1):
+            argument = setup(i)
+            startTime = time.perf_counter()
+            run(argument)
+            times.append(time.perf_counter()-startTime)
+        argument = setup(repeats+1)
+        tracemalloc.start()
+        run(argument)
+        peakBytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    uniqueColours = models._UniquePixelData(image).values.shape[0]
+    warmTime = statistics.median(times[1:])
+    return {'stage': stage,
+            'profile': profile,
+            'megapixels': pixelCount/1e6,
+            'uniqueColours': uniqueColours,
+            'coldSeconds': times[0],
+            'warmSeconds': warmTime,
+            'warmMinSeconds': min(times[1:]),
+            'throughputMpxPerSecond': pixelCount/1e6/warmTime,
+            'peakTracedBytes': peakBytes}
+
+
+def run_suite(stages, megapixelsList, profiles, repeats, progressCallback=None):
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for megapixels in megapixelsList:
+        for profile in profiles:
+            for stage in stages:
+                with tempfile.TemporaryDirectory() as cacheDir:
+                    os.environ['NUMBA_CACHE_DIR'] = cacheDir
+                    with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+                        result = executor.submit(run_case, stage, megapixels, profile, repeats).result()
+                results.append(result)
+                if progressCallback is not None:
+                    progressCallback(result)
+    return results
+
+
+def compare(results, previousResults, threshold):
+    # flags cases whose warm time grew by more than threshold (a fraction) relative to a previous run
+    previousByCase = {(r['stage'], r['profile'], round(r['megapixels'], 3)): r for r in previousResults}
+    regressions = []
+    for result in results:
+        previous = previousByCase.get((result['stage'], result['profile'], round(result['megapixels'], 3)))
+        if previous is not None and result['warmSeconds'] > previous['warmSeconds']*(1+threshold):
+            regressions.append({'stage': result['stage'],
+                                'profile': result['profile'],
+                                'megapixels': result['megapixels'],
+                                'previousWarmSeconds': previous['warmSeconds'],
+                                'warmSeconds': result['warmSeconds']})
+    return regressions
+
+
+def _print_result(result):
+    print('{:26s} {:7s} {:6.2f} MP {:9d} colours  cold {:8.3f}s  warm {:8.4f}s  {:8.1f} Mpx/s  peak {:8.1f} MB'.format(
+        result['stage'], result['profile'], result['megapixels'], result['uniqueColours'], result['coldSeconds'],
+        result['warmSeconds'], result['throughputMpxPerSecond'], result['peakTracedBytes']/2**20), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the image processing pipeline.')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--megapixels', nargs='+', type=float, default=[.5, 2., 8.])
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=PROFILES)
+    parser.add_argument('--repeats', type=int, default=5, help='warm runs per case')
+    parser.add_argument('--output', help='JSON file to write, defaults to stdout')
+    parser.add_argument('--compare', help='previous JSON output to check for regressions')
+    parser.add_argument('--threshold', type=float, default=.1, help='allowed slowdown before flagging a regression')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.stages, args.megapixels, args.profiles, args.repeats, _print_result)
+    report = {'timestamp': datetime.datetime.now().isoformat(),
+              'platform': platform.platform(),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'numba': numba.__version__,
+              'cpuCount': os.cpu_count(),
+              'results': results}
+    exitCode = 0
+    if args.compare:
+        with open(args.compare) as file:
+            report['regressions'] = compare(results, json.load(file)['results'], args.threshold)
+        for regression in report['regressions']:
+            print('REGRESSION {stage} {profile} {megapixels:.2f} MP: {previousWarmSeconds:.4f}s -> '
+                  '{warmSeconds:.4f}s'.format(**regression), file=sys.stderr)
+        exitCode = 1 if report['regressions'] else 0
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    return exitCode
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+# Compares the cost of the high bit depth path with the 8-bit path on the same synthetic photo-like image.
+# Run from the repository root: python auxiliary/bit_depth_benchmark.py [megapixels]
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import models  # noqa: E402
+
+PROCESSING_PARAMS = {models.ParamType.EQUALIZE: 10.,
+                     models.ParamType.BRIGHTNESS: 1.2,
+                     models.ParamType.CONTRAST: 1.1,
+                     models.ParamType.SATURATION: 1.2}
+
+
+def synthetic_image(megapixels, dtype, seed=0):
+    # smooth gradients plus sensor-like noise, so that 16-bit values are nearly all unique
+    width = int(np.sqrt(megapixels*1e6*1.5))
+    height = int(megapixels*1e6/width)
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.stack([x/width, y/height, (x+y)/(width+height)], axis=2)
+    image += rng.normal(0, .01, image.shape).astype(np.float32)
+    return models._convert_pixels(np.clip(image, 0, 1), dtype)
+
+
+def time_processing(image, outputDtype):
+    startTime = time.perf_counter()
+    uniquePixels = models._UniquePixelData(image)
+    dedupeTime = time.perf_counter()-startTime
+    imageProcessor = models._ImageProcessor(uniquePixels, outputDtype=outputDtype)
+    startTime = time.perf_counter()
+    imageProcessor.change_processing_params(PROCESSING_PARAMS)
+    processingTime = time.perf_counter()-startTime
+    return {'dedupe': dedupeTime, 'process': processingTime, 'uniqueColours': uniquePixels.values.shape[0]}
+
+
+def main(megapixels=4.):
+    # a small run first so that JIT compilation isn't timed
+    models._UniquePixelData(synthetic_image(.01, np.uint8), 'counting')
+    for dtype in (np.uint8, np.uint16, np.float32):
+        time_processing(synthetic_image(.01, dtype), np.uint8 if dtype == np.uint8 else np.uint16)
+    results = {}
+    for dtype in (np.uint8, np.uint16, np.float32):
+        image = synthetic_image(megapixels, dtype)
+        results[np.dtype(dtype).name] = time_processing(image, np.uint8 if dtype == np.uint8 else np.uint16)
+    baseline = results['uint8']['dedupe']+results['uint8']['process']
+    for name, result in results.items():
+        total = result['dedupe']+result['process']
+        print('{:8s} dedupe {:7.3f}s  process {:7.3f}s  unique colours {:9d}  {:5.2f}x 8-bit'.format(
+            name, result['dedupe'], result['process'], result['uniqueColours'], total/baseline))
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
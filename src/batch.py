@@ -0,0 +1,244 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import sys
+import time
+import models
+
+PARAM_NAMES = {paramType.name.lower(): paramType for paramType in models.ParamType}
+
+
+def load_preset(presetPath):
+    # presets map lower case ParamType names to model values, e.g. {"brightness": 1.2, "saturation": 1.1}
+    if presetPath.endswith('.toml'):
+        import tomllib
+        with open(presetPath, 'rb') as file:
+            preset = tomllib.load(file)
+    else:
+        with open(presetPath) as file:
+            preset = json.load(file)
+    return parse_params(preset)
+
+
+def parse_params(paramValues):
+    processingParams = {}
+    for name, value in paramValues.items():
+        if name.lower() not in PARAM_NAMES:
+            raise ValueError('Unknown parameter '+str(name))
+        processingParams[PARAM_NAMES[name.lower()]] = float(value)
+    return processingParams
+
+
+def find_input_files(inputs):
+    filePaths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = sorted(os.path.join(pattern, name) for name in os.listdir(pattern))
+            matches = [match for match in matches if os.path.isfile(match)]
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True))
+        for match in matches:
+            if match not in filePaths:
+                filePaths.append(match)
+    return filePaths
+
+
+def output_path(inputPath, outputDir, suffix='', extension=None, inputRoot=None):
+    # with inputRoot, the input's directory relative to it is mirrored under outputDir
+    name, inputExtension = os.path.splitext(os.path.basename(inputPath))
+    if extension is None:
+        extension = inputExtension
+    elif not extension.startswith('.'):
+        extension = '.'+extension
+    if inputRoot is not None:
+        outputDir = os.path.join(outputDir, os.path.relpath(os.path.dirname(os.path.abspath(inputPath)), inputRoot))
+    return os.path.normpath(os.path.join(outputDir, name+suffix+extension))
+
+
+def plan_outputs(filePaths, outputDir, suffix='', extension=None):
+    # maps each input to its output path and an error, which is None unless the output would overwrite an input or
+    # the output of an earlier input. Directories are mirrored relative to the deepest one holding every input, so
+    # inputs with the same name in different directories don't overwrite each other
+    if not filePaths:
+        return {}
+    inputRoot = os.path.commonpath([os.path.dirname(os.path.abspath(filePath)) for filePath in filePaths])
+    inputs = {os.path.realpath(filePath) for filePath in filePaths}
+    claimedOutputs = {}
+    plan = {}
+    for filePath in filePaths:
+        outputPath = output_path(filePath, outputDir, suffix, extension, inputRoot)
+        realOutputPath = os.path.realpath(outputPath)
+        if realOutputPath in inputs:
+            error = 'Refusing to overwrite input '+outputPath
+        elif realOutputPath in claimedOutputs:
+            error = 'Same output {} as {}'.format(outputPath, claimedOutputs[realOutputPath])
+        else:
+            claimedOutputs[realOutputPath] = filePath
+            error = None
+        plan[filePath] = (outputPath, error)
+    return plan
+
+
+def _initialize_worker(numbaThreads):
+    # runs once per worker process so JIT compilation (or loading the on disk cache) is paid once, not per file
+    import numba
+    numba.set_num_threads(numbaThreads)
+    models.compile_kernels()
+
+
+def process_file(inputPath, outputPath, processingParams, memoryBudget=None, exportOptions=None):
+    # failures are returned rather than raised so that one bad file doesn't stop the batch
+    startTime = time.perf_counter()
+    encodeSeconds = None
+    try:
+        if memoryBudget is None:
+            encodeSeconds = models.export_image(inputPath, outputPath, processingParams, exportOptions=exportOptions)
+        else:
+            encodeSeconds = models.export_image_streaming(inputPath, outputPath, processingParams, memoryBudget,
+                                                          exportOptions=exportOptions)
+        error = None
+    except Exception as exception:
+        error = '{}: {}'.format(type(exception).__name__, exception)
+    return {'input': inputPath,
+            'output': outputPath,
+            'seconds': time.perf_counter()-startTime,
+            'encodeSeconds': encodeSeconds,
+            'error': error}
+
+
+def run_batch(filePaths, outputDir, processingParams, workers=None, suffix='', extension=None,
+              progressCallback=None, memoryBudget=None, exportOptions=None):
+    workers = workers or os.cpu_count() or 1
+    numbaThreads = max(1, (os.cpu_count() or 1)//workers)
+    results = []
+
+    def finish(result):
+        results.append(result)
+        if progressCallback is not None:
+            progressCallback(result)
+
+    jobs = []
+    for filePath, (outputPath, error) in plan_outputs(filePaths, outputDir, suffix, extension).items():
+        if error is None:
+            os.makedirs(os.path.dirname(outputPath) or '.', exist_ok=True)
+            jobs.append((filePath, outputPath, processingParams, memoryBudget, exportOptions))
+        else:
+            finish(_failure(filePath, outputPath, error))
+    # a worker process that dies, e.g. out of memory or in native code, breaks the pool and with it every file that
+    # hadn't finished. Those are run again in a fresh pool, and only a file that was started in two pools that broke
+    # is run in a process of its own, so that just the file responsible fails
+    startedJobIds = set()
+    while jobs:
+        poolSize = min(workers, len(jobs))
+        lostJobs = _process_in_pool(jobs, poolSize, numbaThreads, finish)
+        # workers take jobs in order and one at a time, so only the first poolSize lost ones can have been started
+        retriedJobs = []
+        for job in lostJobs[:poolSize]:
+            if id(job) not in startedJobIds:
+                startedJobIds.add(id(job))
+                retriedJobs.append(job)
+                continue
+            for crashedJob in _process_in_pool([job], 1, numbaThreads, finish):
+                finish(_failure(crashedJob[0], crashedJob[1], 'BrokenProcessPool: the worker process died'))
+        jobs = retriedJobs+lostJobs[poolSize:]
+    return results
+
+
+def _process_in_pool(jobs, workers, numbaThreads, finish):
+    # calls finish with the result of each job, returning the jobs that were lost to a broken pool in their order
+    lostIndices = []
+    if not jobs:
+        return []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                initializer=_initialize_worker,
+                                                initargs=(numbaThreads,)) as executor:
+        futures = {executor.submit(process_file, *job): i for i, job in enumerate(jobs)}
+        for future in concurrent.futures.as_completed(futures):
+            job = jobs[futures[future]]
+            try:
+                finish(future.result())
+            except concurrent.futures.process.BrokenProcessPool:
+                lostIndices.append(futures[future])
+            except Exception as exception:
+                finish(_failure(job[0], job[1], '{}: {}'.format(type(exception).__name__, exception)))
+    return [jobs[i] for i in sorted(lostIndices)]
+
+
+def _failure(inputPath, outputPath, error):
+    return {'input': inputPath,
+            'output': outputPath,
+            'seconds': None,
+            'encodeSeconds': None,
+            'error': error}
+
+
+def _print_result(result):
+    if result['error'] is None:
+        print('{:8.2f}s  (encode {:.2f}s)  {} -> {}'.format(result['seconds'], result['encodeSeconds'] or 0.,
+                                                           result['input'], result['output']))
+    else:
+        print('  FAILED  {}: {}'.format(result['input'], result['error']), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply a set of adjustments to many images without the GUI.')
+    parser.add_argument('inputs', nargs='+', help='image files, directories or glob patterns')
+    parser.add_argument('-o', '--output-dir', required=True)
+    parser.add_argument('-p', '--preset', help='JSON or TOML file mapping parameter names to values')
+    for name in PARAM_NAMES:
+        parser.add_argument('--'+name.replace('_', '-'), type=float, dest=name, help='overrides the preset')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes, defaults to CPU count')
+    parser.add_argument('--suffix', default='', help='appended to each output file name')
+    parser.add_argument('--format', default=None, help='output extension, defaults to the input extension')
+    parser.add_argument('--report', help='write per-file timings and errors to this JSON file')
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help='process each image in strips within this many MB of memory per worker; inputs must be '
+                             '.npy or binary .ppm/.pnm files and outputs .npy, .ppm, .pnm or .png')
+    parser.add_argument('--jpeg-quality', type=int, default=None, help='0 to 100')
+    parser.add_argument('--jpeg-subsampling', choices=models.ExportOptions.JPEG_SUBSAMPLINGS, default=None)
+    parser.add_argument('--progressive', action='store_true', help='write progressive JPEGs')
+    parser.add_argument('--png-compression', type=int, default=None, help='0 (fastest) to 9 (smallest)')
+    parser.add_argument('--png-strategy', choices=models.ExportOptions.PNG_STRATEGIES, default=None)
+    parser.add_argument('--png-strips', type=int, default=1,
+                        help='encode PNGs in this many strips in parallel, 0 for one per CPU')
+    parser.add_argument('--webp-quality', type=int, default=None, help='1 to 100')
+    args = parser.parse_args(argv)
+
+    processingParams = load_preset(args.preset) if args.preset else {}
+    processingParams.update(parse_params({name: getattr(args, name) for name in PARAM_NAMES
+                                          if getattr(args, name) is not None}))
+    filePaths = find_input_files(args.inputs)
+    if not filePaths:
+        parser.error('no input files found')
+    if args.memory_budget is not None:
+        # other formats can only be decoded or encoded whole, which would quietly exceed the budget
+        for filePath in filePaths:
+            extension = os.path.splitext(filePath)[1].lower()
+            if extension not in models.STREAMING_SOURCE_EXTENSIONS:
+                parser.error('--memory-budget can\'t read {}, only {} files'.format(
+                    filePath, ', '.join(models.STREAMING_SOURCE_EXTENSIONS)))
+            outputExtension = '.'+args.format.lstrip('.').lower() if args.format else extension
+            if outputExtension not in models.STREAMING_OUTPUT_EXTENSIONS:
+                parser.error('--memory-budget can\'t write {} files, only {} files'.format(
+                    outputExtension, ', '.join(models.STREAMING_OUTPUT_EXTENSIONS)))
+    startTime = time.perf_counter()
+    memoryBudget = None if args.memory_budget is None else int(args.memory_budget*2**20)
+    exportOptions = models.ExportOptions(jpegQuality=args.jpeg_quality, jpegSubsampling=args.jpeg_subsampling,
+                                         jpegProgressive=args.progressive, pngCompression=args.png_compression,
+                                         pngStrategy=args.png_strategy, pngStripCount=args.png_strips,
+                                         webpQuality=args.webp_quality)
+    results = run_batch(filePaths, args.output_dir, processingParams, args.workers, args.suffix, args.format,
+                        _print_result, memoryBudget, exportOptions)
+    failures = [result for result in results if result['error'] is not None]
+    print('{} of {} images processed in {:.2f}s'.format(len(results)-len(failures), len(results),
+                                                       time.perf_counter()-startTime))
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
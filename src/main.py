@@ -1,3 +1,6 @@
+import startup
+import settings as stg
 from presenters import MasterPresenter
 
+startup.configure_jit_cache(stg.JIT_CACHE_DIR)
 MasterPresenter()
@@ -1,11 +1,23 @@
 from typing import Generic, TypeVar, Optional, Callable, Any
 from numpy.typing import NDArray
-import cv2
 import numpy as np
 import enum
-from numba import njit, prange
 import copy
-from scipy import fft
+import functools
+import os
+import re
+import struct
+import threading
+import time
+import types
+import json
+import collections
+import shutil
+import tempfile
+import zlib
+
+# numba, cv2 and scipy are only imported by the code that first needs them, so that importing this module stays
+# cheap for consumers that never process an image
 
 
 class ParamType(enum.Enum):
@@ -22,6 +34,51 @@ class ParamType(enum.Enum):
 T = TypeVar('T')
 
 
+class _LazyKernel:
+    # stands in for numba.njit(**options)(func), creating the dispatcher (and importing numba) on first use
+    _dispatcherLock = threading.Lock()
+
+    def __init__(self, func, options):
+        functools.update_wrapper(self, func)
+        self._func = func
+        self._options = options
+        self._dispatcher = None
+
+    @property
+    def dispatcher(self):
+        if self._dispatcher is None:
+            with self._dispatcherLock:
+                if self._dispatcher is None:
+                    import numba
+                    # kernels refer to prange as a global, which Numba only parallelizes if it is numba.prange; the
+                    # kernel is compiled from a copy of the function whose globals bind it so, leaving the module's
+                    # prange alone
+                    func = self._func
+                    kernel = types.FunctionType(func.__code__, dict(func.__globals__, prange=numba.prange),
+                                                func.__name__, func.__defaults__, func.__closure__)
+                    functools.update_wrapper(kernel, func)
+                    self._dispatcher = numba.njit(**self._options)(kernel)
+        return self._dispatcher
+
+    @property
+    def signatures(self):
+        return self.dispatcher.signatures
+
+    def compile(self, signature):
+        return self.dispatcher.compile(signature)
+
+    def __call__(self, *args):
+        return self.dispatcher(*args)
+
+
+def _lazy_njit(**options):
+    return lambda func: _LazyKernel(func, options)
+
+
+# range as far as Python is concerned; kernels are compiled with numba.prange in its place, see _LazyKernel
+prange = range
+
+
 class _Observable(Generic[T]):
     def __init__(self, initialValue: Optional[T] = None) -> None:
         self._data: Optional[T] = initialValue
@@ -44,41 +101,354 @@ class _Observable(Generic[T]):
             func(self._data)
 
 
+class _Instrumentation:
+    # keeps the latest historyLength samples of every (operation, stage) pair, e.g. ('render', 'equalize'); callers
+    # check enabled before timing anything, so a disabled instance costs one attribute lookup per render
+    def __init__(self, historyLength=512):
+        self.enabled = False
+        self.historyLength = historyLength
+        self._samples: dict[tuple[str, str], collections.deque] = {}
+        self._samplesLock = threading.Lock()
+        self._lastSample: _Observable[dict] = _Observable()
+
+    def record(self, operation, stage, seconds, uniqueColours=0, bytesAllocated=0, cacheHit=False):
+        sample = {'timestamp': time.time(),
+                  'operation': operation,
+                  'stage': stage,
+                  'seconds': seconds,
+                  'uniqueColours': int(uniqueColours),
+                  'bytesAllocated': int(bytesAllocated),
+                  'cacheHit': cacheHit}
+        with self._samplesLock:
+            key = (operation, stage)
+            if key not in self._samples:
+                self._samples[key] = collections.deque(maxlen=self.historyLength)
+            self._samples[key].append(sample)
+        self._lastSample.data = sample
+
+    def add_callback(self, func):
+        # func is called with every new sample, on the thread that recorded it
+        self._lastSample.add_callback(func)
+
+    def samples(self, operation=None, stage=None):
+        with self._samplesLock:
+            samples = [sample for (op, st), deque in self._samples.items() for sample in deque
+                       if (operation is None or op == operation) and (stage is None or st == stage)]
+        return sorted(samples, key=lambda sample: sample['timestamp'])
+
+    def histogram(self, operation, stage, field='seconds', bins=20):
+        values = [sample[field] for sample in self.samples(operation, stage)]
+        return np.histogram(values, bins)
+
+    def summary(self):
+        summary = {}
+        for sample in self.samples():
+            summary.setdefault(sample['operation'], {}).setdefault(sample['stage'], []).append(sample)
+        for stages in summary.values():
+            for stage, samples in stages.items():
+                seconds = np.array([sample['seconds'] for sample in samples])
+                stages[stage] = {'count': len(samples),
+                                 'meanSeconds': float(seconds.mean()),
+                                 'medianSeconds': float(np.median(seconds)),
+                                 'p95Seconds': float(np.percentile(seconds, 95)),
+                                 'maxSeconds': float(seconds.max()),
+                                 'meanUniqueColours': float(np.mean([sample['uniqueColours'] for sample in samples])),
+                                 'meanBytesAllocated': float(np.mean([sample['bytesAllocated'] for sample in samples])),
+                                 'cacheHitRate': float(np.mean([sample['cacheHit'] for sample in samples]))}
+        return summary
+
+    def dump(self, filePath):
+        # one JSON object per line, oldest first
+        with open(filePath, 'w') as file:
+            for sample in self.samples():
+                file.write(json.dumps(sample)+'\n')
+
+    def clear(self):
+        with self._samplesLock:
+            self._samples.clear()
+
+
+def _max_pixel_value(dtype):
+    return 1. if np.issubdtype(dtype, np.floating) else np.iinfo(dtype).max
+
+
+def _convert_pixels(values, dtype):
+    # rescales between uint8, uint16 and [0, 1] float pixel values
+    if values.dtype == dtype:
+        return values
+    scale = _max_pixel_value(dtype)/_max_pixel_value(values.dtype)
+    if np.issubdtype(dtype, np.integer):
+        return np.clip(values*scale+.5, 0, _max_pixel_value(dtype)).astype(dtype)
+    return (values*scale).astype(dtype)
+
+
+def _resident_bytes(*arrays):
+    # bytes held in memory by the distinct arrays, leaving out memory mapped ones and None; broadcast views only hold
+    # the elements they repeat
+    distinctArrays = {id(array): array for array in arrays if array is not None and not isinstance(array, np.memmap)}
+    return sum(array.itemsize if 0 in array.strides else array.nbytes for array in distinctArrays.values())
+
+
+def _srgb_decode(values):
+    # 0-255 scale sRGB to linear sRGB in [0, 1], for building tables
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(values <= 10.31475, values/3294.6, ((values+14.025)/269.025)**2.4).astype(np.float32)
+
+
+@functools.lru_cache(maxsize=None)
+def _srgb_encoding_table(size=16384):
+    # linear sRGB in [0, 1] to sRGB in [0, 1] at evenly spaced nodes; interpolating it is accurate to a few ten
+    # thousandths of an 8-bit level, the worst case being next to the knee of the curve
+    values = np.linspace(0, 1, size)
+    return np.where(values <= .0031308, values*12.92, 1.055*values**(1/2.4)-.055).astype(np.float32)
+
+
+DOWNSCALE_FILTERS = ('box', 'area', 'cubic')
+
+
+def downscale_image(image, shape, resampleFilter='box'):
+    # resizes image to shape, (height, width), keeping its type; 'box' averages the area each output pixel covers in
+    # linear light, 'area' does the same on the encoded values and 'cubic' is bicubic interpolation without any
+    # anti-aliasing
+    height, width = shape
+    if resampleFilter == 'box':
+        if image.dtype == np.uint8:
+            decodingTable = _srgb_decode(np.arange(256))
+        else:
+            # float images are looked up at 16 bits, which is more than enough for display
+            if image.dtype != np.uint16:
+                image = _convert_pixels(image, np.uint16)
+            decodingTable = _srgb_decode(np.arange(65536)*(255/65535))
+        rowStarts, rowWeights = _area_weights(image.shape[0], height)
+        columnStarts, columnWeights = _area_weights(image.shape[1], width)
+        output = _jit_box_downscale(image, decodingTable, rowStarts, rowWeights, columnStarts, columnWeights,
+                                    _srgb_encoding_table())
+        return _convert_pixels(output, image.dtype)
+    import cv2
+    if resampleFilter == 'area':
+        return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    if resampleFilter == 'cubic':
+        return cv2.resize(image, (width, height), interpolation=cv2.INTER_CUBIC)
+    raise ValueError('Unknown filter '+str(resampleFilter))
+
+
+def _area_weights(inputSize, outputSize):
+    # for each output pixel, the first input pixel it overlaps and the fractions of it covered by that input pixel
+    # and the ones after it
+    ratio = inputSize/outputSize
+    starts = np.floor(np.arange(outputSize)*ratio).astype(np.int64)
+    positions = starts[:, np.newaxis]+np.arange(int(np.ceil(ratio))+1)
+    lower = np.arange(outputSize)[:, np.newaxis]*ratio
+    overlap = np.clip(np.minimum(positions+1, lower+ratio)-np.maximum(positions, lower), 0, None)
+    overlap[positions >= inputSize] = 0
+    return starts, (overlap/overlap.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+@_lazy_njit(parallel=True, cache=True, nogil=True)
+def _jit_box_downscale(image, decodingTable, rowStarts, rowWeights, columnStarts, columnWeights, encodingTable):
+    # each output row accumulates the linear values of the input rows it overlaps, each of which is filtered
+    # horizontally first
+    encodingScale = encodingTable.shape[0]-1
+    output = np.empty((rowStarts.shape[0], columnStarts.shape[0], 3), dtype=np.float32)
+    for i in prange(rowStarts.shape[0]):
+        accumulator = np.zeros((columnStarts.shape[0], 3), dtype=np.float32)
+        for a in range(rowWeights.shape[1]):
+            rowWeight = rowWeights[i, a]
+            if rowWeight == 0:
+                continue
+            y = rowStarts[i]+a
+            for j in range(columnStarts.shape[0]):
+                for b in range(columnWeights.shape[1]):
+                    weight = rowWeight*columnWeights[j, b]
+                    if weight == 0:
+                        continue
+                    x = columnStarts[j]+b
+                    for c in range(3):
+                        accumulator[j, c] += weight*decodingTable[image[y, x, c]]
+        for j in range(columnStarts.shape[0]):
+            # clamp and encode, as in _OklabModifier._lsrgb2srgb
+            for c in range(3):
+                v = accumulator[j, c]
+                scaled = min(v, 1)*encodingScale if v > 0 else 0.
+                e = min(int(scaled), encodingScale-1)
+                output[i, j, c] = encodingTable[e]+(encodingTable[e+1]-encodingTable[e])*(scaled-e)
+    return output
+
+
 class _UniquePixelData:
     # consider emulating matlab structure arrays
-    def __init__(self, pixels):
-        uniquePixels, ind, counts = self._find_unique_rows(pixels.reshape((-1, 3)))
+    # 8-bit images with at least this many pixels are deduplicated with a counting table over all 2**24 colours,
+    # which is linear in the pixel count but has a fixed cost that isn't worth paying for small images
+    countingEngineMinPixels = 2**21
+    # High bit depth images are checked on a sample of this many pixels, and if at least identityEngineMinUniqueRatio
+    # of the sample is unique the rows are used as they are. In 16-bit photos almost every pixel is unique, so
+    # deduplicating them costs a sort and saves nothing.
+    uniqueRatioSampleSize = 2**16
+    identityEngineMinUniqueRatio = .9
+    # the reverse mapping and counts are never modified after construction, so views made with with_values share them
+    __slots__ = ('values', '_reverseMapping', 'counts', '_inputShape')
+
+    def __init__(self, pixels, engine=None):
+        # engine is 'counting', 'lexsort' or 'identity', or None to choose based on the size and type of pixels
+        if engine is None:
+            engine = self._select_engine(pixels)
+        if engine == 'counting':
+            rows = pixels.reshape((-1, 3))
+            uniquePixels, table, counts = self._jit_find_unique_rows_counting(rows)
+            ind = np.empty(rows.shape[0], dtype=self._index_dtype(uniquePixels.shape[0]))
+            self._jit_map_rows_counting(rows, table, ind)
+        elif engine == 'identity':
+            # a reverse mapping of None stands for the identity, and the counts are a read-only view of a single one
+            # rather than eight bytes per pixel
+            uniquePixels = pixels.reshape((-1, 3))
+            ind = None
+            counts = np.broadcast_to(np.int64(1), (uniquePixels.shape[0],))
+        elif engine == 'lexsort':
+            uniquePixels, ind, counts = self._find_unique_rows(pixels.reshape((-1, 3)))
+        else:
+            raise ValueError('Unknown engine '+str(engine))
         self.values = uniquePixels
         self._reverseMapping = ind
         self.counts = counts
         self._inputShape = pixels.shape
 
-    def reverse(self, asUint8=True):
+    @classmethod
+    def from_unique_values(cls, values, counts=None):
+        # wraps rows that are already known to be unique, e.g. LUT lattice points
+        uniquePixelData = cls.__new__(cls)
+        uniquePixelData.values = values
+        uniquePixelData._reverseMapping = None
+        if counts is None:
+            counts = np.ones(values.shape[0], dtype=np.int64)
+        uniquePixelData.counts = counts
+        uniquePixelData._inputShape = values.shape
+        return uniquePixelData
+
+    def with_values(self, values):
+        # a view of the same pixels with other values for the unique colours, sharing the reverse mapping and counts
+        uniquePixelData = self.__new__(type(self))
+        uniquePixelData.values = values
+        uniquePixelData._reverseMapping = self._reverseMapping
+        uniquePixelData.counts = self.counts
+        uniquePixelData._inputShape = self._inputShape
+        return uniquePixelData
+
+    def memory_usage(self):
+        # bytes held by each array; the reverse mapping and counts may be shared with other views
+        return {'values': self.values.nbytes,
+                'reverseMapping': 0 if self._reverseMapping is None else self._reverseMapping.nbytes,
+                'counts': _resident_bytes(self.counts)}
+
+    def reverse(self, outputDtype=np.uint8, out=None):
+        # outputDtype=None returns the values as they are; out, if given, is a C contiguous array of the input shape
+        # and type outputDtype that the pixels are written to instead of a new array
         values = self.values
-        if values.dtype != np.uint8 and asUint8:
-            values = (values*255+.5).astype(np.uint8)
-        return self._jit_reverse(values, self._reverseMapping, self._inputShape)
+        if outputDtype is not None:
+            values = _convert_pixels(values, outputDtype)
+        if out is None:
+            out = np.empty(self._inputShape, dtype=values.dtype)
+        if self._reverseMapping is None:
+            out.reshape((-1, 3))[:] = values
+        else:
+            self._jit_reverse(values, self._reverseMapping, out.reshape((-1, 3)))
+        return out
+
+    @staticmethod
+    def _index_dtype(uniqueCount):
+        # the narrowest type that can index uniqueCount colours
+        if uniqueCount <= 2**16:
+            return np.uint16
+        if uniqueCount <= 2**32:
+            return np.uint32
+        return np.int64
 
     @staticmethod
-    @njit(cache=True)
-    def _jit_reverse(values, reverseMapping, shape):
+    @_lazy_njit(parallel=True, cache=True, nogil=True)
+    def _jit_reverse(values, reverseMapping, output):
         # JIT'd methods must be made static
-        return values[reverseMapping].reshape(shape)
+        for i in prange(reverseMapping.shape[0]):
+            for j in range(3):
+                output[i, j] = values[reverseMapping[i], j]
+
+    @classmethod
+    def _select_engine(cls, pixels):
+        pixelCount = pixels.size//3
+        if pixels.dtype == np.uint8:
+            return 'counting' if pixelCount >= cls.countingEngineMinPixels else 'lexsort'
+        if pixelCount > cls.uniqueRatioSampleSize:
+            rows = pixels.reshape((-1, 3))
+            sample = rows[np.random.default_rng(0).choice(pixelCount, cls.uniqueRatioSampleSize, replace=False)]
+            sampleUniqueCount = cls(sample, 'lexsort').values.shape[0]
+            if sampleUniqueCount >= cls.identityEngineMinUniqueRatio*cls.uniqueRatioSampleSize:
+                return 'identity'
+        return 'lexsort'
+
+    @staticmethod
+    @_lazy_njit(cache=True, nogil=True)
+    def _jit_find_unique_rows_counting(inputArr):
+        # the table first holds the count of each packed 24-bit colour and is then overwritten with its unique index;
+        # serial, since threads would need a table each to count into. The mapping pass is the parallel one
+        table = np.zeros(1 << 24, dtype=np.int32)
+        for i in range(inputArr.shape[0]):
+            table[(np.int32(inputArr[i, 0]) << 16) | (np.int32(inputArr[i, 1]) << 8) | np.int32(inputArr[i, 2])] += 1
+        uniqueCount = 0
+        for key in range(table.shape[0]):
+            if table[key] != 0:
+                uniqueCount += 1
+        uniqueRows = np.empty((uniqueCount, 3), dtype=np.uint8)
+        counts = np.empty(uniqueCount, dtype=np.int64)
+        uniqueRowIndex = 0
+        for key in range(table.shape[0]):
+            if table[key] != 0:
+                uniqueRows[uniqueRowIndex, 0] = key >> 16
+                uniqueRows[uniqueRowIndex, 1] = (key >> 8) & 255
+                uniqueRows[uniqueRowIndex, 2] = key & 255
+                counts[uniqueRowIndex] = table[key]
+                table[key] = uniqueRowIndex
+                uniqueRowIndex += 1
+        return uniqueRows, table, counts
+
+    @staticmethod
+    @_lazy_njit(parallel=True, cache=True, nogil=True)
+    def _jit_map_rows_counting(inputArr, table, reverseMap):
+        # reverseMap is allocated by the caller so that its type can depend on the number of unique colours
+        for i in prange(inputArr.shape[0]):
+            reverseMap[i] = table[(np.int32(inputArr[i, 0]) << 16) |
+                                  (np.int32(inputArr[i, 1]) << 8) |
+                                  np.int32(inputArr[i, 2])]
 
     def _find_unique_rows(self, inputArr):
         # This function is necessary because numpy.unique is not fully compatible with tkinter and multithreading.
         # It's also several times faster.
         sortInd = np.lexsort(inputArr.T)
-        return self._jit_find_unique_rows(inputArr, sortInd)
+        # the unique rows are counted first so that nothing is allocated at the full length of inputArr
+        uniqueCount = self._jit_count_unique_rows(inputArr, sortInd)
+        uniqueRows = np.empty((uniqueCount, 3), dtype=inputArr.dtype)
+        counts = np.ones(uniqueCount, dtype=np.int64)
+        reverseMap = np.empty(inputArr.shape[0], dtype=self._index_dtype(uniqueCount))
+        self._jit_find_unique_rows(inputArr, sortInd, uniqueRows, reverseMap, counts)
+        return uniqueRows, reverseMap, counts
 
     @staticmethod
-    @njit(cache=True)
-    def _jit_find_unique_rows(inputArr, sortInd):
-        uniqueRows = inputArr.copy()
+    @_lazy_njit(cache=True, nogil=True)
+    def _jit_count_unique_rows(inputArr, sortInd):
+        uniqueCount = 1
+        for i in range(1, inputArr.shape[0]):
+            row = sortInd[i]
+            previousRow = sortInd[i-1]
+            for j in range(inputArr.shape[1]):
+                if inputArr[row, j] != inputArr[previousRow, j]:
+                    uniqueCount += 1
+                    break
+        return uniqueCount
+
+    @staticmethod
+    @_lazy_njit(cache=True, nogil=True)
+    def _jit_find_unique_rows(inputArr, sortInd, uniqueRows, reverseMap, counts):
+        # fills uniqueRows, reverseMap and counts, which are sized with _jit_count_unique_rows
         uniqueRows[0] = inputArr[sortInd[0]]
         uniqueRowIndex = 0
-        counts = np.ones(inputArr.shape[0], dtype=np.int64)
-        reverseMap = np.zeros(inputArr.shape[0], dtype=np.int64)
+        reverseMap[sortInd[0]] = 0
         for i in range(1, inputArr.shape[0]):
             row = sortInd[i]
             for j in range(inputArr.shape[1]):
@@ -89,30 +459,81 @@ class _UniquePixelData:
             else:
                 counts[uniqueRowIndex] += 1
             reverseMap[row] = uniqueRowIndex
-        uniqueRowIndex += 1
-        return uniqueRows[:uniqueRowIndex], reverseMap, counts[:uniqueRowIndex]
 
 
 class _RgbModifier:
-    def __init__(self, modifiedPixels):
+    def __init__(self, modifiedPixels, histogram=None):
         self._modifiedPixels = modifiedPixels
-        histogram = self._generate_image_histogram(self._modifiedPixels.values, self._modifiedPixels.counts)
+        if histogram is None:
+            histogram = self._generate_image_histogram(self.histogram_bins(self._modifiedPixels.values),
+                                                       self._modifiedPixels.counts)
         self.cdf = np.cumsum(histogram)
-        self.histogramFrequencies = fft.dct(histogram)
+        self._histogram = histogram
+        self._histogramFrequencies = None
         self.x = np.arange(256)
         self.xSqr = (np.pi/256*self.x)**2
 
     def equalize(self, t):
+        new_pixels = self.equalization_table(t)
+        self._modifiedPixels.values = self.apply_equalization_table(new_pixels, self._modifiedPixels.values)
+
+    def equalize_and_linearize(self, t):
+        # equalize followed by the sRGB decode, leaving linear sRGB values
+        table = None if t == 0 else self.equalization_table(t)
+        self._modifiedPixels.values = self.apply_linearization_table(table, self._modifiedPixels.values)
+
+    @staticmethod
+    def histogram_bins(values):
+        # high bit depth values share the 256 bins of 8-bit values so that equalization behaves the same
+        if values.dtype == np.uint8:
+            return values
+        return np.clip(np.rint(values*(255/_max_pixel_value(values.dtype))), 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def apply_equalization_table(table, values):
+        # returns values on the 0-255 scale as float32; table=None only rescales them
+        if values.dtype == np.uint8:
+            if table is None:
+                return values.astype(np.float32)
+            return table[values]
+        scale = 255/_max_pixel_value(values.dtype)
+        if table is None:
+            return (values*scale).astype(np.float32)
+        if values.dtype == np.uint16:
+            table = np.interp(np.arange(65536)*scale, np.arange(256), table).astype(np.float32)
+            return table[values]
+        return np.interp(values*scale, np.arange(256), table).astype(np.float32)
+
+    @staticmethod
+    def apply_linearization_table(table, values):
+        # apply_equalization_table followed by the sRGB decode, returning linear sRGB as float32; integer values are
+        # mapped with a single gather from a table that composes both
+        if table is None:
+            table = np.arange(256, dtype=np.float32)
+        if values.dtype == np.uint8:
+            return _srgb_decode(table)[values]
+        scale = 255/_max_pixel_value(values.dtype)
+        if values.dtype == np.uint16:
+            return _srgb_decode(np.interp(np.arange(65536)*scale, np.arange(256), table))[values]
+        return _srgb_decode(np.interp(values*scale, np.arange(256), table))
+
+    @property
+    def histogramFrequencies(self):
+        # computed on first use since scipy is slow to import and equalization is often never used
+        if self._histogramFrequencies is None:
+            from scipy import fft
+            self._histogramFrequencies = fft.dct(self._histogram)
+        return self._histogramFrequencies
+
+    def equalization_table(self, t):
+        from scipy import fft
         diffusedHistogram = fft.idct(self.histogramFrequencies*np.exp(-self.xSqr*t**2))
         if t >= 0:
-            new_pixels = np.interp(self.cdf, np.cumsum(diffusedHistogram), self.x).astype(np.float32)
-        else:
-            new_pixels = np.interp(np.cumsum(diffusedHistogram), self.cdf, self.x).astype(np.float32)
-        self._modifiedPixels.values = np.reshape(new_pixels[self._modifiedPixels.values.ravel()],
-                                                 self._modifiedPixels.values.shape)
+            return np.interp(self.cdf, np.cumsum(diffusedHistogram), self.x).astype(np.float32)
+        return np.interp(np.cumsum(diffusedHistogram), self.cdf, self.x).astype(np.float32)
 
     @staticmethod
-    @njit(parallel=True, cache=True)
+    @_lazy_njit(parallel=True, cache=True)
     def _generate_image_histogram(values, counts):
         y = np.zeros(256, dtype=np.int64)
         for m in range(values.shape[0]):
@@ -135,29 +556,71 @@ class _LmsModifier:
         self.lms2lsrgbMatrix = np.linalg.inv(self.lsrgb2xyzMatrix@self.Ma).astype(np.float32)
 
     @staticmethod
-    @njit(parallel=True, cache=True)
+    @_lazy_njit(parallel=True, cache=True)
     def _srgb2lms(pixels, lsrgb2lmsMatrix):
+        # input is left unmodified so that it can be cached by _ImageProcessor
+        linearPixels = np.empty_like(pixels)
         for m in prange(pixels.shape[0]):
             for n in prange(pixels.shape[1]):
                 subPixel = pixels[m, n]
                 if subPixel <= 10.31475:
-                    pixels[m, n] = subPixel/3294.6
+                    linearPixels[m, n] = subPixel/3294.6
                 else:
-                    pixels[m, n] = ((subPixel+14.025)/269.025)**2.4
-        pixels = pixels@lsrgb2lmsMatrix
-        return pixels
+                    linearPixels[m, n] = ((subPixel+14.025)/269.025)**2.4
+        return linearPixels@lsrgb2lmsMatrix
 
-    def modify_brightness_contrast_wb(self, brightness, contrast, warmth, tintFactor):
-        brightness **= 2.2
+    def modify_brightness_contrast_wb(self, brightness, contrast, warmth, tintFactor, inflectionPoint=None):
+        # inflectionPoint may be supplied when the statistics come from pixels other than the ones being modified
+        self.srgb2lms()
+        self.adjust_brightness_contrast_wb(brightness, contrast, warmth, tintFactor, inflectionPoint)
+
+    def srgb2lms(self):
         self._modifiedPixels.values = self._srgb2lms(self._modifiedPixels.values, self.lsrgb2lmsMatrix)
-        inflectionPoint = self._determine_inflection_point(
-            self._modifiedPixels.values, self._modifiedPixels.counts, brightness)
+
+    def lsrgb2lms(self):
+        # for values already decoded, e.g. by _RgbModifier.equalize_and_linearize
+        self._modifiedPixels.values = self._modifiedPixels.values@self.lsrgb2lmsMatrix
+
+    def adjust_brightness_contrast_wb(self, brightness, contrast, warmth, tintFactor, inflectionPoint=None):
+        # expects values already converted with srgb2lms
+        brightness **= 2.2
+        if inflectionPoint is None:
+            inflectionPoint = self._determine_inflection_point(
+                self._modifiedPixels.values, self._modifiedPixels.counts, brightness)
         whiteBalanceScale = self._determine_white_balance_scale(warmth, tintFactor)
         self._bezier_transform(self._modifiedPixels.values,
                                inflectionPoint, brightness*whiteBalanceScale, contrast)
 
+    def inflection_point_sums(self, lsrgbValues, counts, brightness):
+        # partial sums of the inflection point estimate so that it can be accumulated over several images or strips
+        lms = lsrgbValues.astype(np.float32, copy=False)@self.lsrgb2lmsMatrix
+        return self._jit_inflection_point_sums(lms, counts, brightness**2.2)
+
+    @staticmethod
+    def inflection_point_from_sums(valueSum, countSum):
+        return max(min(valueSum/countSum, .9), .1)**3
+
     @staticmethod
-    @njit(parallel=True, cache=True)
+    @_lazy_njit(parallel=True, cache=True)
+    def _jit_inflection_point_sums(values, counts, brightness):
+        brightness = brightness**(1/3)
+        valueAccumulator = 0.
+        countAccumulator = 0
+        for m in prange(values.shape[0]):
+            for n in range(values.shape[1]):
+                brightnessAdjustedValue = brightness*values[m, n]**(1/3)
+                if brightnessAdjustedValue > 1:
+                    brightnessAdjustedValue = 1
+                valueAccumulator += brightnessAdjustedValue*counts[m]
+                countAccumulator += counts[m]
+        return valueAccumulator, countAccumulator
+
+    def estimate_inflection_point(self, srgbValues, counts, brightness):
+        lms = self._srgb2lms(srgbValues.astype(np.float32, copy=False), self.lsrgb2lmsMatrix)
+        return self._determine_inflection_point(lms, counts, brightness**2.2)
+
+    @staticmethod
+    @_lazy_njit(parallel=True, cache=True)
     def _determine_inflection_point(values, counts, brightness):
         brightness = brightness**(1/3)
         valueAccumulator = 0
@@ -217,7 +680,7 @@ class _LmsModifier:
         return np.array([X, 1., Z])
 
     @staticmethod
-    @njit(parallel=True, cache=True)
+    @_lazy_njit(parallel=True, cache=True)
     def _bezier_transform(pixels, inflectionPoint, brightness, contrast):
         invBc = 1/(brightness*contrast)
         for m in prange(pixels.shape[0]):
@@ -265,21 +728,34 @@ class _OklabModifier:
                                            [-3.30771159, 2.6097574, -0.70341861],
                                            [0.23096993, -0.3413194, 1.7076147]], dtype=np.float32)
 
-    def modify_hue_saturation(self, saturationFactor, twoToneHue, twoToneSaturation):
+    def modify_hue_saturation(self, saturationFactor, twoToneHue, twoToneSaturation, encode=True):
+        # with encode=False the values are left as unclipped linear sRGB
         lmsPrime = self._lms2lmsPrime(self._modifiedPixels.values, self.lms2oklmsMatrix)
-        theta = twoToneHue*np.pi/180+np.pi/2
-        a = twoToneSaturation-1
-        b = saturationFactor*a*np.sin(2*theta)/2
-        adjustmentMatrix = np.array([[1., 0., 0.],
-                                     [0., saturationFactor*(1+a*np.cos(theta)**2), b],
-                                     [0., b, saturationFactor*(1+a*np.sin(theta)**2)]])
+        adjustmentMatrix = self.saturation_adjustment_matrix(saturationFactor, twoToneHue, twoToneSaturation)
         adjustedLmsPrime = lmsPrime@(self.lmsPrime2oklabMatrix @
                                      adjustmentMatrix @
                                      self.oklab2lmsPrimeMatrix).astype(np.float32)
-        self._modifiedPixels.values = self._lmsPrime2srgb(adjustedLmsPrime, self.oklms2lsrgbMatrix)
+        lsrgb = self._lmsPrime2lsrgb(adjustedLmsPrime, self.oklms2lsrgbMatrix)
+        self._modifiedPixels.values = self._lsrgb2srgb(lsrgb, _srgb_encoding_table()) if encode else lsrgb
 
     @staticmethod
-    @njit(parallel=True, cache=True)
+    def saturation_adjustment_matrix(saturationFactor, twoToneHue, twoToneSaturation):
+        # acts on OKLAB values
+        theta = twoToneHue*np.pi/180+np.pi/2
+        a = twoToneSaturation-1
+        b = saturationFactor*a*np.sin(2*theta)/2
+        return np.array([[1., 0., 0.],
+                         [0., saturationFactor*(1+a*np.cos(theta)**2), b],
+                         [0., b, saturationFactor*(1+a*np.sin(theta)**2)]])
+
+    def lms2srgb(self):
+        # equivalent to modify_hue_saturation(1, 0, 1) without the round trip through LMS'
+        lms2lsrgbMatrix = (self.lms2oklmsMatrix@self.oklms2lsrgbMatrix).astype(np.float32)
+        self._modifiedPixels.values = self._lsrgb2srgb(self._modifiedPixels.values@lms2lsrgbMatrix,
+                                                       _srgb_encoding_table())
+
+    @staticmethod
+    @_lazy_njit(parallel=True, cache=True)
     def _lms2lmsPrime(lms, lms2oklmsMatrix):
         lmsPrime = lms@lms2oklmsMatrix
         for m in prange(lmsPrime.shape[0]):
@@ -291,42 +767,306 @@ class _OklabModifier:
         return lmsPrime
 
     @staticmethod
-    @njit(parallel=True, cache=True)
-    def _lmsPrime2srgb(oklms, oklms2lsrgbMatrix):
+    @_lazy_njit(parallel=True, cache=True)
+    def _lmsPrime2lsrgb(oklms, oklms2lsrgbMatrix):
         for m in prange(oklms.shape[0]):
             for n in prange(oklms.shape[1]):
                 oklms[m, n] **= 3
-        srgb = oklms@oklms2lsrgbMatrix
+        return oklms@oklms2lsrgbMatrix
+
+    @staticmethod
+    @_lazy_njit(parallel=True, cache=True)
+    def _lsrgb2srgb(srgb, encodingTable):
+        # clamps to [0, 1] and encodes by interpolating encodingTable
+        scale = encodingTable.shape[0]-1
         for m in prange(srgb.shape[0]):
             for n in prange(srgb.shape[1]):
-                subPixel = srgb[m, n]
-                if subPixel < 0:
-                    srgb[m, n] = 0
-                elif subPixel > 1:
-                    srgb[m, n] = 1
-                elif subPixel <= .0031308:
-                    srgb[m, n] = subPixel*12.92
-                else:
-                    srgb[m, n] = 1.055*subPixel**(1/2.4)-.055
+                x = min(srgb[m, n], 1)*scale if srgb[m, n] > 0 else 0.
+                i = min(int(x), scale-1)
+                srgb[m, n] = encodingTable[i]+(encodingTable[i+1]-encodingTable[i])*(x-i)
         return srgb
 
 
+class _FusedModifier:
+    # lsrgb2lms, adjust_brightness_contrast_wb and modify_hue_saturation in a single pass over the unique colours,
+    # taking linear sRGB values from _RgbModifier.equalize_and_linearize to sRGB in [0, 1]
+    def __init__(self, modifiedPixels):
+        self._modifiedPixels = modifiedPixels
+        self._lmsModifier = _LmsModifier(modifiedPixels)
+        self._oklabModifier = _OklabModifier(modifiedPixels)
+        # reused by every call with the same number of unique colours, so callers must not keep the previous output
+        self._output: Optional[NDArray[np.float32]] = None
+
+    def inflection_point(self, brightness):
+        return self._jit_inflection_point(self._modifiedPixels.values, self._modifiedPixels.counts,
+                                          self._lmsModifier.lsrgb2lmsMatrix, brightness**2.2)
+
+    def modify(self, brightness, contrast, warmth, tintFactor, saturationFactor, twoToneHue, twoToneSaturation,
+               inflectionPoint=None, encode=True):
+        # with encode=False the values are left as unclipped linear sRGB
+        values = self._modifiedPixels.values
+        adjustBrightnessContrastWb = not (brightness == 1 and contrast == 1 and warmth == 0 and tintFactor == 0)
+        whiteBalancedBrightness = np.ones(3)
+        if adjustBrightnessContrastWb:
+            if inflectionPoint is None:
+                inflectionPoint = self.inflection_point(brightness)
+            whiteBalanceScale = self._lmsModifier._determine_white_balance_scale(warmth, tintFactor)
+            whiteBalancedBrightness = brightness**2.2*whiteBalanceScale
+        adjustSaturation = not (saturationFactor == 1 and twoToneSaturation == 1)
+        oklabModifier = self._oklabModifier
+        adjustmentMatrix = (oklabModifier.lmsPrime2oklabMatrix @
+                            oklabModifier.saturation_adjustment_matrix(saturationFactor, twoToneHue,
+                                                                       twoToneSaturation) @
+                            oklabModifier.oklab2lmsPrimeMatrix).astype(np.float32)
+        lms2lsrgbMatrix = (oklabModifier.lms2oklmsMatrix@oklabModifier.oklms2lsrgbMatrix).astype(np.float32)
+        if self._output is None or self._output.shape != values.shape:
+            self._output = np.empty(values.shape, dtype=np.float32)
+        self._jit_fused_pipeline(values, self._output, self._lmsModifier.lsrgb2lmsMatrix, adjustBrightnessContrastWb,
+                                 0. if inflectionPoint is None else float(inflectionPoint), whiteBalancedBrightness,
+                                 float(contrast), adjustSaturation, oklabModifier.lms2oklmsMatrix, adjustmentMatrix,
+                                 oklabModifier.oklms2lsrgbMatrix, lms2lsrgbMatrix, encode, _srgb_encoding_table())
+        self._modifiedPixels.values = self._output
+
+    @staticmethod
+    @_lazy_njit(parallel=True, cache=True)
+    def _jit_inflection_point(lsrgb, counts, lsrgb2lmsMatrix, brightness):
+        # _LmsModifier._determine_inflection_point on the LMS values of lsrgb, without materializing them
+        oneThird = np.float32(1/3)
+        brightness = brightness**(1/3)
+        valueAccumulator = 0.
+        countAccumulator = 0
+        for m in prange(lsrgb.shape[0]):
+            lms0 = lsrgb[m, 0]*lsrgb2lmsMatrix[0, 0]+lsrgb[m, 1]*lsrgb2lmsMatrix[1, 0]+lsrgb[m, 2]*lsrgb2lmsMatrix[2, 0]
+            lms1 = lsrgb[m, 0]*lsrgb2lmsMatrix[0, 1]+lsrgb[m, 1]*lsrgb2lmsMatrix[1, 1]+lsrgb[m, 2]*lsrgb2lmsMatrix[2, 1]
+            lms2 = lsrgb[m, 0]*lsrgb2lmsMatrix[0, 2]+lsrgb[m, 1]*lsrgb2lmsMatrix[1, 2]+lsrgb[m, 2]*lsrgb2lmsMatrix[2, 2]
+            valueAccumulator += (min(brightness*lms0**oneThird, 1.)+min(brightness*lms1**oneThird, 1.) +
+                                 min(brightness*lms2**oneThird, 1.))*counts[m]
+            countAccumulator += 3*counts[m]
+        meanEstimate = valueAccumulator/countAccumulator
+        return max(min(meanEstimate, .9), .1)**3
+
+    @staticmethod
+    @_lazy_njit(parallel=True, cache=True)
+    def _jit_fused_pipeline(lsrgb, output, lsrgb2lmsMatrix, adjustBrightnessContrastWb, inflectionPoint, brightness,
+                            contrast, adjustSaturation, lms2oklmsMatrix, adjustmentMatrix, oklms2lsrgbMatrix,
+                            lms2lsrgbMatrix, encode, encodingTable):
+        # cube roots are taken in float32, which is several times faster than in float64, while the Bezier curve is
+        # solved in float64 as it loses precision otherwise
+        oneThird = np.float32(1/3)
+        encodingScale = encodingTable.shape[0]-1
+        # coefficients of _LmsModifier._bezier_transform for each channel and each side of the inflection point,
+        # leaving only the terms that depend on the value in the loop
+        a = np.empty((3, 2))
+        b = np.empty((3, 2))
+        dOffset = np.empty((3, 2))
+        delta0 = np.empty((3, 2))
+        delta1Offset = np.empty((3, 2))
+        x1 = np.empty((3, 2))
+        x2 = np.empty((3, 2))
+        y0 = np.empty((3, 2))
+        y3 = np.empty((3, 2))
+        for n in range(3):
+            invBc = 1/(brightness[n]*contrast)
+            for side in range(2):
+                if side == 0:
+                    x0 = inflectionPoint*(1-contrast)
+                    x1[n, side] = max(inflectionPoint*(2-contrast)/2, 0)
+                    x2[n, side] = (3*x1[n, side]+inflectionPoint)/4
+                    x3 = inflectionPoint
+                    y0[n, side] = 0
+                    y3[n, side] = x3
+                else:
+                    x0 = inflectionPoint
+                    x2[n, side] = min(contrast*(brightness[n]-inflectionPoint)/2+inflectionPoint, 1)
+                    x1[n, side] = (3*x2[n, side]+inflectionPoint)/4
+                    x3 = brightness[n]*contrast+inflectionPoint*(1-contrast)
+                    y0[n, side] = inflectionPoint
+                    y3[n, side] = 1
+                a[n, side] = (-x0+3*x1[n, side]-3*x2[n, side]+x3)*invBc
+                b[n, side] = (3*x0-6*x1[n, side]+3*x2[n, side])*invBc
+                c = (-3*x0+3*x1[n, side])*invBc
+                dOffset[n, side] = inflectionPoint/brightness[n]+(x0-inflectionPoint)*invBc
+                delta0[n, side] = b[n, side]**2-3*a[n, side]*c
+                delta1Offset[n, side] = 2*b[n, side]**3-9*a[n, side]*b[n, side]*c
+        for m in prange(lsrgb.shape[0]):
+            lms0 = lsrgb[m, 0]*lsrgb2lmsMatrix[0, 0]+lsrgb[m, 1]*lsrgb2lmsMatrix[1, 0]+lsrgb[m, 2]*lsrgb2lmsMatrix[2, 0]
+            lms1 = lsrgb[m, 0]*lsrgb2lmsMatrix[0, 1]+lsrgb[m, 1]*lsrgb2lmsMatrix[1, 1]+lsrgb[m, 2]*lsrgb2lmsMatrix[2, 1]
+            lms2 = lsrgb[m, 0]*lsrgb2lmsMatrix[0, 2]+lsrgb[m, 1]*lsrgb2lmsMatrix[1, 2]+lsrgb[m, 2]*lsrgb2lmsMatrix[2, 2]
+            if adjustBrightnessContrastWb:
+                # brightness, contrast and white balance, as in _LmsModifier._bezier_transform
+                for n in range(3):
+                    value = np.float64(lms0 if n == 0 else lms1 if n == 1 else lms2)
+                    side = 0 if value <= inflectionPoint/brightness[n] else 1
+                    d = dOffset[n, side]-value
+                    delta1 = delta1Offset[n, side]+27*a[n, side]**2*d
+                    bigC = np.cbrt((delta1+np.sqrt(delta1**2-4*delta0[n, side]**3))*.5)
+                    t = -1/(3*a[n, side])*(b[n, side]+bigC+delta0[n, side]/bigC)
+                    adjusted = np.float32((1-t)**3*y0[n, side]+3*(1-t)**2*t*x1[n, side]+3*(1-t)*t**2*x2[n, side] +
+                                          t**3*y3[n, side])
+                    if n == 0:
+                        lms0 = adjusted
+                    elif n == 1:
+                        lms1 = adjusted
+                    else:
+                        lms2 = adjusted
+            if adjustSaturation:
+                # saturation in OKLAB, as in _OklabModifier.modify_hue_saturation
+                lmsPrime0 = max(lms0*lms2oklmsMatrix[0, 0]+lms1*lms2oklmsMatrix[1, 0]+lms2*lms2oklmsMatrix[2, 0],
+                                np.float32(0))**oneThird
+                lmsPrime1 = max(lms0*lms2oklmsMatrix[0, 1]+lms1*lms2oklmsMatrix[1, 1]+lms2*lms2oklmsMatrix[2, 1],
+                                np.float32(0))**oneThird
+                lmsPrime2 = max(lms0*lms2oklmsMatrix[0, 2]+lms1*lms2oklmsMatrix[1, 2]+lms2*lms2oklmsMatrix[2, 2],
+                                np.float32(0))**oneThird
+                oklms0 = (lmsPrime0*adjustmentMatrix[0, 0]+lmsPrime1*adjustmentMatrix[1, 0] +
+                          lmsPrime2*adjustmentMatrix[2, 0])**3
+                oklms1 = (lmsPrime0*adjustmentMatrix[0, 1]+lmsPrime1*adjustmentMatrix[1, 1] +
+                          lmsPrime2*adjustmentMatrix[2, 1])**3
+                oklms2 = (lmsPrime0*adjustmentMatrix[0, 2]+lmsPrime1*adjustmentMatrix[1, 2] +
+                          lmsPrime2*adjustmentMatrix[2, 2])**3
+                for n in range(3):
+                    output[m, n] = (oklms0*oklms2lsrgbMatrix[0, n]+oklms1*oklms2lsrgbMatrix[1, n] +
+                                    oklms2*oklms2lsrgbMatrix[2, n])
+            else:
+                # as in _OklabModifier.lms2srgb
+                for n in range(3):
+                    output[m, n] = lms0*lms2lsrgbMatrix[0, n]+lms1*lms2lsrgbMatrix[1, n]+lms2*lms2lsrgbMatrix[2, n]
+            if encode:
+                # clamp and encode, as in _OklabModifier._lsrgb2srgb
+                for n in range(3):
+                    x = min(output[m, n], 1)*encodingScale if output[m, n] > 0 else 0.
+                    i = min(int(x), encodingScale-1)
+                    output[m, n] = encodingTable[i]+(encodingTable[i+1]-encodingTable[i])*(x-i)
+
+
+class _ScopeCalculator:
+    # count weighted RGB and luma histograms and an OKLAB a/b vectorscope of unique sRGB colours, so that the cost
+    # depends on the number of unique colours rather than pixels
+    def __init__(self, histogramBins=256, vectorscopeSize=96, vectorscopeRange=.4):
+        self.histogramBins = histogramBins
+        self.vectorscopeSize = vectorscopeSize
+        # largest |a| and |b| shown, colours beyond it are counted at the edge
+        self.vectorscopeRange = vectorscopeRange
+        oklabModifier = _OklabModifier(None)
+        self._lsrgb2oklmsMatrix = np.linalg.inv(oklabModifier.oklms2lsrgbMatrix).astype(np.float32)
+        self._lmsPrime2oklabMatrix = oklabModifier.lmsPrime2oklabMatrix.astype(np.float32)
+
+    def compute(self, uniquePixels):
+        values = uniquePixels.values
+        if not np.issubdtype(values.dtype, np.floating):
+            values = _convert_pixels(values, np.float32)
+        values = np.ascontiguousarray(values, dtype=np.float32)
+        # each chunk fills its own histograms, which are summed afterwards
+        chunkCount = max(min(os.cpu_count() or 1, values.shape[0]//4096), 1)
+        rgb, luma, vectorscope = self._jit_scopes(values, uniquePixels.counts, self._lsrgb2oklmsMatrix,
+                                                  self._lmsPrime2oklabMatrix, self.histogramBins, self.vectorscopeSize,
+                                                  self.vectorscopeRange, chunkCount)
+        return {'rgb': rgb, 'luma': luma, 'vectorscope': vectorscope}
+
+    @staticmethod
+    @_lazy_njit(parallel=True, cache=True, nogil=True)
+    def _jit_scopes(srgb, counts, lsrgb2oklmsMatrix, lmsPrime2oklabMatrix, histogramBins, vectorscopeSize,
+                    vectorscopeRange, chunkCount):
+        decodeExponent = np.float32(2.4)
+        oneThird = np.float32(1/3)
+        rgb = np.zeros((chunkCount, 3, histogramBins), dtype=np.int64)
+        luma = np.zeros((chunkCount, histogramBins), dtype=np.int64)
+        vectorscope = np.zeros((chunkCount, vectorscopeSize, vectorscopeSize), dtype=np.int64)
+        chunkSize = (srgb.shape[0]+chunkCount-1)//chunkCount
+        for k in prange(chunkCount):
+            for m in range(k*chunkSize, min((k+1)*chunkSize, srgb.shape[0])):
+                count = counts[m]
+                oklms0 = np.float32(0)
+                oklms1 = np.float32(0)
+                oklms2 = np.float32(0)
+                for n in range(3):
+                    subPixel = min(max(srgb[m, n], np.float32(0)), np.float32(1))
+                    rgb[k, n, min(int(subPixel*histogramBins), histogramBins-1)] += count
+                    if subPixel <= .04045:
+                        linear = subPixel/np.float32(12.92)
+                    else:
+                        linear = ((subPixel+np.float32(.055))/np.float32(1.055))**decodeExponent
+                    oklms0 += linear*lsrgb2oklmsMatrix[n, 0]
+                    oklms1 += linear*lsrgb2oklmsMatrix[n, 1]
+                    oklms2 += linear*lsrgb2oklmsMatrix[n, 2]
+                # Rec. 709 luma of the encoded values, as shown by most editors
+                y = .2126*srgb[m, 0]+.7152*srgb[m, 1]+.0722*srgb[m, 2]
+                luma[k, min(max(int(y*histogramBins), 0), histogramBins-1)] += count
+                lmsPrime0 = max(oklms0, np.float32(0))**oneThird
+                lmsPrime1 = max(oklms1, np.float32(0))**oneThird
+                lmsPrime2 = max(oklms2, np.float32(0))**oneThird
+                a = (lmsPrime0*lmsPrime2oklabMatrix[0, 1]+lmsPrime1*lmsPrime2oklabMatrix[1, 1] +
+                     lmsPrime2*lmsPrime2oklabMatrix[2, 1])
+                b = (lmsPrime0*lmsPrime2oklabMatrix[0, 2]+lmsPrime1*lmsPrime2oklabMatrix[1, 2] +
+                     lmsPrime2*lmsPrime2oklabMatrix[2, 2])
+                # +b is up
+                column = int((a/vectorscopeRange+1)/2*vectorscopeSize)
+                row = int((1-b/vectorscopeRange)/2*vectorscopeSize)
+                vectorscope[k, min(max(row, 0), vectorscopeSize-1), min(max(column, 0), vectorscopeSize-1)] += count
+        return rgb.sum(axis=0), luma.sum(axis=0), vectorscope.sum(axis=0)
+
+
+class _StageModifiers:
+    # the modifiers _ImageProcessor runs its stages with, all working on one view of the unique colours
+    def __init__(self, originalPixels, histogram=None):
+        self.pixels = originalPixels.with_values(originalPixels.values)
+        self.rgb = _RgbModifier(self.pixels, histogram)
+        self.lms = _LmsModifier(self.pixels)
+        self.oklab = _OklabModifier(self.pixels)
+        self.fused = _FusedModifier(self.pixels)
+
+
 class _ImageProcessor:
-    def __init__(self, image):
-        self._originalPixels = _UniquePixelData(image)
-        self._modifiedPixels = copy.deepcopy(self._originalPixels)
-        self._rgbModifier = _RgbModifier(self._modifiedPixels)
-        self._lmsModifier = _LmsModifier(self._modifiedPixels)
-        self._oklabModifier = _OklabModifier(self._modifiedPixels)
-        self._processedImage = _Observable(self._modifiedPixels.reverse())
-        self.processingParams = {ParamType.EQUALIZE: 0.,
-                                 ParamType.BRIGHTNESS: 1.,
-                                 ParamType.CONTRAST: 1.,
-                                 ParamType.SATURATION: 1.,
-                                 ParamType.WARMTH: 0.,
-                                 ParamType.TINT: 0.,
-                                 ParamType.TWO_TONE_HUE: 0.,
-                                 ParamType.TWO_TONE_SATURATION: 1.}
+    def __init__(self, image, histogram=None, outputDtype=np.uint8, instrumentation=None, operation='render',
+                 fused=False, frameBufferCount=0, frameCacheBudget=0):
+        # accepts either an image or its precomputed _UniquePixelData, which is left unmodified
+        # histogram and inflectionPoint override the statistics otherwise taken from the image, e.g. when the image
+        # is one strip of a larger image
+        # every stage of every processing run is recorded in instrumentation, if given and enabled, under operation
+        # with fused, everything after equalization runs as a single _FusedModifier pass, which is faster for one-off
+        # processing; otherwise each colour space conversion and adjustment is its own stage whose cached output lets
+        # a change to a later stage's parameters skip the earlier stages
+        # with frameBufferCount > 0, processed images are written to that many persistent frames in turn rather than
+        # to a new array each time, so a processed image stays valid until frameBufferCount more have been processed
+        # with frameCacheBudget > 0, the modified unique values of the most recent renders are kept in outputDtype, up
+        # to that many bytes, so rendering any of their parameters again only repeats the reverse mapping
+        self.outputDtype = outputDtype
+        self.fused = fused
+        self.instrumentation: Optional[_Instrumentation] = instrumentation
+        self.operation = operation
+        if isinstance(image, _UniquePixelData):
+            self._originalPixels = image
+        else:
+            self._originalPixels = _UniquePixelData(image)
+        self._modifiers = _StageModifiers(self._originalPixels, histogram)
+        self._modifiedPixels = self._modifiers.pixels
+        self.inflectionPoint = None
+        # prerender works on its own pixels and modifiers so that the current parameters and processed image stay
+        # valid for the threads reading them meanwhile; created on first use
+        self._prerenderModifiers: Optional[_StageModifiers] = None
+        self._frameBuffers = [np.empty(self._originalPixels._inputShape, dtype=outputDtype)
+                              for _ in range(frameBufferCount if outputDtype is not None else 0)]
+        self._nextFrameBuffer = 0
+        self._processedImage = _Observable(self._reverse_into_frame())
+        # maps each stage to the parameter key its cached output was computed with
+        self._stageCache: dict[str, tuple[tuple, NDArray]] = {}
+        self.frameCacheBudget = frameCacheBudget if outputDtype is not None else 0
+        # maps the key of the last stage to the values it rendered, least recently used first
+        self._frameCache: collections.OrderedDict[tuple, NDArray] = collections.OrderedDict()
+        self._frameCacheBytes = 0
+        # clear_frame_cache may be called from another thread than the renders
+        self._frameCacheLock = threading.Lock()
+        self.processingParams = self.default_processing_params()
+
+    @staticmethod
+    def default_processing_params():
+        return {ParamType.EQUALIZE: 0.,
+                ParamType.BRIGHTNESS: 1.,
+                ParamType.CONTRAST: 1.,
+                ParamType.SATURATION: 1.,
+                ParamType.WARMTH: 0.,
+                ParamType.TINT: 0.,
+                ParamType.TWO_TONE_HUE: 0.,
+                ParamType.TWO_TONE_SATURATION: 1.}
 
     @property
     def processedImage(self):
@@ -340,47 +1080,937 @@ class _ImageProcessor:
     def add_processedImage_callback(self, func):
         self._processedImage.add_callback(func)
 
+    def has_cached_frame(self, processingParams):
+        with self._frameCacheLock:
+            return self._stage_keys(processingParams)[-1] in self._frameCache
+
+    def clear_frame_cache(self):
+        with self._frameCacheLock:
+            self._frameCache.clear()
+            self._frameCacheBytes = 0
+
     def _process_image(self):
-        self._modifiedPixels.values = self._originalPixels.values.copy()
-        self._rgbModifier.equalize(self.processingParams[ParamType.EQUALIZE])
-        self._lmsModifier.modify_brightness_contrast_wb(self.processingParams[ParamType.BRIGHTNESS],
-                                                        self.processingParams[ParamType.CONTRAST],
-                                                        self.processingParams[ParamType.WARMTH],
-                                                        self.processingParams[ParamType.TINT])
-        self._oklabModifier.modify_hue_saturation(self.processingParams[ParamType.SATURATION],
-                                                  self.processingParams[ParamType.TWO_TONE_HUE],
-                                                  self.processingParams[ParamType.TWO_TONE_SATURATION])
-        self._processedImage.data = self._modifiedPixels.reverse()
+        instrumentation = self.instrumentation
+        measuring = instrumentation is not None and instrumentation.enabled
+        stageKeys = self._stage_keys(self.processingParams)
+        frameKey = stageKeys[-1]
+        with self._frameCacheLock:
+            cachedFrame = self._frameCache.get(frameKey)
+            if cachedFrame is not None:
+                self._frameCache.move_to_end(frameKey)
+        if cachedFrame is not None:
+            # a cached frame skips every stage
+            values = cachedFrame
+            firstStageToRun = len(self._stages)
+        else:
+            firstStageToRun, values = self._first_stage_to_run(stageKeys)
+        if measuring:
+            for stage in self._stages[:firstStageToRun]:
+                instrumentation.record(self.operation, stage, 0., values.shape[0], 0, True)
+        for i in range(firstStageToRun, len(self._stages)):
+            if measuring:
+                startTime = time.perf_counter()
+                inputValues = values
+            values = self._run_stage(self._stages[i], values, self.processingParams, self._modifiers)
+            if measuring:
+                # identity stages return their input, so they allocate nothing
+                instrumentation.record(self.operation, self._stages[i], time.perf_counter()-startTime,
+                                       values.shape[0], 0 if values is inputValues else values.nbytes, False)
+            self._stageCache[self._stages[i]] = (stageKeys[i], values)
+        if self.frameCacheBudget and cachedFrame is None:
+            values = self._cache_frame(frameKey, values)
+        self._modifiedPixels.values = values
+        if measuring:
+            startTime = time.perf_counter()
+        processedImage = self._reverse_into_frame()
+        if measuring:
+            instrumentation.record(self.operation, 'reverse', time.perf_counter()-startTime, values.shape[0],
+                                   0 if self._frameBuffers else processedImage.nbytes, False)
+        self._processedImage.data = processedImage
+
+    def prerender(self, paramDict, isCancelled=None):
+        # renders the parameter updates in paramDict into the frame cache without changing the current parameters or
+        # processed image, giving up between stages once isCancelled returns True; returns whether a frame was added
+        if not self.frameCacheBudget:
+            return False
+        params = {**self.processingParams, **paramDict}
+        if self.has_cached_frame(params):
+            return False
+        if self._prerenderModifiers is None:
+            self._prerenderModifiers = _StageModifiers(self._originalPixels, self._modifiers.rgb._histogram)
+        modifiers = self._prerenderModifiers
+        try:
+            stageKeys = self._stage_keys(params)
+            firstStageToRun, values = self._first_stage_to_run(stageKeys)
+            for i in range(firstStageToRun, len(self._stages)):
+                if isCancelled is not None and isCancelled():
+                    return False
+                values = self._run_stage(self._stages[i], values, params, modifiers)
+                # the last output only goes to the frame cache since the fused stage writes it to a buffer that the
+                # next prerender overwrites
+                if i < len(self._stages)-1:
+                    self._stageCache[self._stages[i]] = (stageKeys[i], values)
+            self._cache_frame(stageKeys[-1], values)
+            return True
+        finally:
+            modifiers.pixels.values = self._originalPixels.values
+
+    def _first_stage_to_run(self, stageKeys):
+        # the first stage whose cached output is out of date and the values it starts from
+        for i in reversed(range(len(self._stages))):
+            key, cachedValues = self._stageCache.get(self._stages[i], (None, None))
+            if key == stageKeys[i]:
+                return i+1, cachedValues
+        return 0, self._originalPixels.values
+
+    def memory_usage(self):
+        # bytes held by the decomposition, the cached stage outputs and frames, and the processed images
+        stageOutputs = [values for _, values in self._stageCache.values()]
+        with self._frameCacheLock:
+            cachedFrames = list(self._frameCache.values())
+        fusedOutputs = [modifiers.fused._output for modifiers in (self._modifiers, self._prerenderModifiers)
+                        if modifiers is not None]
+        originalUsage = self._originalPixels.memory_usage()
+        return (originalUsage['reverseMapping']+originalUsage['counts'] +
+                _resident_bytes(self._originalPixels.values, self._modifiedPixels.values, *fusedOutputs,
+                                self.processedImage, *self._frameBuffers, *stageOutputs, *cachedFrames))
+
+    def _cache_frame(self, key, values):
+        # the values are stored as they will be reversed, which for 8-bit output is a quarter of their float size and
+        # makes the conversion in reverse a no-op; a copy is taken since fused values are overwritten by the next run
+        cachedValues = _convert_pixels(values, self.outputDtype)
+        if cachedValues is values:
+            cachedValues = values.copy()
+        if cachedValues.nbytes > self.frameCacheBudget:
+            return cachedValues
+        with self._frameCacheLock:
+            self._frameCache[key] = cachedValues
+            self._frameCacheBytes += cachedValues.nbytes
+            while self._frameCacheBytes > self.frameCacheBudget:
+                self._frameCacheBytes -= self._frameCache.popitem(last=False)[1].nbytes
+        return cachedValues
+
+    def _reverse_into_frame(self):
+        if not self._frameBuffers:
+            return self._modifiedPixels.reverse(self.outputDtype)
+        frame = self._frameBuffers[self._nextFrameBuffer]
+        self._nextFrameBuffer = (self._nextFrameBuffer+1) % len(self._frameBuffers)
+        return self._modifiedPixels.reverse(self.outputDtype, frame)
+
+    _stagedStages = ('equalize', 'lsrgb2lms', 'brightnessContrastWb', 'hueSaturation')
+    _fusedStages = ('equalize', 'color')
+
+    @property
+    def _stages(self):
+        return self._fusedStages if self.fused else self._stagedStages
+
+    def _stage_keys(self, params):
+        # each key contains the keys of the stages before it, so a matching key means every earlier stage is valid
+        equalizeKey = (params[ParamType.EQUALIZE],)
+        brightnessContrastWbKey = equalizeKey+(params[ParamType.BRIGHTNESS],
+                                               params[ParamType.CONTRAST],
+                                               params[ParamType.WARMTH],
+                                               params[ParamType.TINT])
+        hueSaturationKey = brightnessContrastWbKey+(params[ParamType.SATURATION],
+                                                    params[ParamType.TWO_TONE_HUE],
+                                                    params[ParamType.TWO_TONE_SATURATION])
+        if self.fused:
+            return equalizeKey, hueSaturationKey
+        return equalizeKey, equalizeKey, brightnessContrastWbKey, hueSaturationKey
+
+    def _run_stage(self, stage, values, params, modifiers):
+        # stages never modify their input in place since it may be another stage's cached output
+        if stage == 'equalize':
+            # leaves linear sRGB
+            modifiers.pixels.values = values
+            modifiers.rgb.equalize_and_linearize(params[ParamType.EQUALIZE])
+        elif stage == 'color':
+            modifiers.pixels.values = values
+            modifiers.fused.modify(params[ParamType.BRIGHTNESS],
+                                       params[ParamType.CONTRAST],
+                                       params[ParamType.WARMTH],
+                                       params[ParamType.TINT],
+                                       params[ParamType.SATURATION],
+                                       params[ParamType.TWO_TONE_HUE],
+                                       params[ParamType.TWO_TONE_SATURATION],
+                                       self.inflectionPoint)
+        elif stage == 'lsrgb2lms':
+            modifiers.pixels.values = values
+            modifiers.lms.lsrgb2lms()
+        elif stage == 'brightnessContrastWb':
+            if (params[ParamType.BRIGHTNESS] == 1 and params[ParamType.CONTRAST] == 1 and
+                    params[ParamType.WARMTH] == 0 and params[ParamType.TINT] == 0):
+                return values
+            modifiers.pixels.values = values.copy()
+            modifiers.lms.adjust_brightness_contrast_wb(params[ParamType.BRIGHTNESS],
+                                                            params[ParamType.CONTRAST],
+                                                            params[ParamType.WARMTH],
+                                                            params[ParamType.TINT],
+                                                            self.inflectionPoint)
+        else:
+            modifiers.pixels.values = values
+            if params[ParamType.SATURATION] == 1 and params[ParamType.TWO_TONE_SATURATION] == 1:
+                modifiers.oklab.lms2srgb()
+            else:
+                modifiers.oklab.modify_hue_saturation(params[ParamType.SATURATION],
+                                                          params[ParamType.TWO_TONE_HUE],
+                                                          params[ParamType.TWO_TONE_SATURATION])
+        return modifiers.pixels.values
+
+
+class _LutProcessor:
+    # Samples the pipeline on an RGB lattice so that full resolution images can be processed with a single lookup
+    # per pixel. Equalization acts on each channel independently and is applied exactly through its 256 entry table
+    # before the 3D lookup, so the lattice only has to approximate the LMS and Oklab stages. The lattice stores
+    # unclipped linear sRGB; clipping and encoding happen per pixel after interpolation since they are not smooth.
+    _statisticsBinShift = 2
+
+    def __init__(self, image, latticeSize=65, interpolation='tetrahedral'):
+        if image.dtype != np.uint8:
+            raise TypeError('Can\'t build a LUT for image of type '+str(image.dtype))
+        if interpolation not in ('tetrahedral', 'trilinear'):
+            raise ValueError('Unknown interpolation method '+str(interpolation))
+        self.latticeSize = latticeSize
+        self.interpolation = interpolation
+        self._pixels = image.reshape((-1, 3))
+        self._inputShape = image.shape
+        histogram, binnedCounts = self._jit_image_statistics(self._pixels, self._statisticsBinShift)
+        binWidth = 2**self._statisticsBinShift
+        binsPerChannel = 256//binWidth
+        binCenters = np.arange(binsPerChannel)*binWidth+(binWidth-1)/2
+        occupied = np.flatnonzero(binnedCounts)
+        self._binValues = np.stack([binCenters[occupied//binsPerChannel**2],
+                                    binCenters[occupied//binsPerChannel % binsPerChannel],
+                                    binCenters[occupied % binsPerChannel]], axis=1)
+        self._binCounts = binnedCounts[occupied]
+        self._histogram = histogram
+        self._rgbModifier = _RgbModifier(None, histogram)
+        self._lmsModifier = _LmsModifier(None)
+        self._oklabModifier = _OklabModifier(None)
+        nodes = np.linspace(0, 255, latticeSize, dtype=np.float32)
+        grid = np.meshgrid(nodes, nodes, nodes, indexing='ij')
+        self._latticePoints = np.stack([axis.ravel() for axis in grid], axis=1)
+        self.lut = None
+        self.equalizationTable = None
+        self._inflectionPoint = None
+
+    def build(self, processingParams):
+        self.equalizationTable = self._rgbModifier.equalization_table(processingParams[ParamType.EQUALIZE])
+        equalizedBinValues = np.interp(self._binValues, np.arange(256), self.equalizationTable)
+        inflectionPoint = self._lmsModifier.estimate_inflection_point(
+            equalizedBinValues, self._binCounts, processingParams[ParamType.BRIGHTNESS])
+        latticePixels = _UniquePixelData.from_unique_values(self._latticePoints.copy())
+        self.lut = self._run_color_stages(latticePixels, processingParams, inflectionPoint).values.reshape(
+            (self.latticeSize,)*3+(3,)).astype(np.float32)
+        self._inflectionPoint = inflectionPoint
+
+    def process(self, processingParams):
+        self.build(processingParams)
+        return self.apply(self._pixels).reshape(self._inputShape)
+
+    def apply(self, pixels):
+        tetrahedral = self.interpolation == 'tetrahedral'
+        return self._jit_apply_lut(pixels.reshape((-1, 3)), self.equalizationTable, self.lut, tetrahedral,
+                                   _srgb_encoding_table())
+
+    def measure_error(self, processingParams, sampleSize=100000, seed=0):
+        # compares lattice interpolation against _ImageProcessor on the same pixels, given the LUT's own histogram
+        # and inflection point estimate so that only the interpolation differs, returning the maximum and mean
+        # absolute error in 8-bit levels
+        self.build(processingParams)
+        rng = np.random.default_rng(seed)
+        sample = self._pixels[rng.integers(self._pixels.shape[0], size=min(sampleSize, self._pixels.shape[0]))]
+        imageProcessor = _ImageProcessor(sample.reshape((-1, 1, 3)), self._histogram, fused=True)
+        imageProcessor.inflectionPoint = self._inflectionPoint
+        imageProcessor.change_processing_params(processingParams)
+        exact = imageProcessor.processedImage.reshape((-1, 3))
+        error = np.abs(exact.astype(np.int16)-self.apply(sample).astype(np.int16))
+        return int(error.max()), float(error.mean())
+
+    def _run_color_stages(self, pixels, processingParams, inflectionPoint, encode=False):
+        self._lmsModifier._modifiedPixels = pixels
+        self._oklabModifier._modifiedPixels = pixels
+        self._lmsModifier.modify_brightness_contrast_wb(processingParams[ParamType.BRIGHTNESS],
+                                                        processingParams[ParamType.CONTRAST],
+                                                        processingParams[ParamType.WARMTH],
+                                                        processingParams[ParamType.TINT],
+                                                        inflectionPoint)
+        self._oklabModifier.modify_hue_saturation(processingParams[ParamType.SATURATION],
+                                                  processingParams[ParamType.TWO_TONE_HUE],
+                                                  processingParams[ParamType.TWO_TONE_SATURATION],
+                                                  encode)
+        return pixels
+
+    @staticmethod
+    @_lazy_njit(cache=True)
+    def _jit_image_statistics(pixels, binShift):
+        histogram = np.zeros(256, dtype=np.int64)
+        binsPerChannel = 256 >> binShift
+        binnedCounts = np.zeros(binsPerChannel**3, dtype=np.int64)
+        for m in range(pixels.shape[0]):
+            r = pixels[m, 0]
+            g = pixels[m, 1]
+            b = pixels[m, 2]
+            histogram[r] += 1
+            histogram[g] += 1
+            histogram[b] += 1
+            binnedCounts[((r >> binShift)*binsPerChannel+(g >> binShift))*binsPerChannel+(b >> binShift)] += 1
+        return histogram, binnedCounts
+
+    @staticmethod
+    @_lazy_njit(parallel=True, cache=True)
+    def _jit_apply_lut(pixels, equalizationTable, lut, tetrahedral, encodingTable):
+        encodingScale = encodingTable.shape[0]-1
+        n = lut.shape[0]
+        scale = (n-1)/255
+        output = np.empty(pixels.shape, dtype=np.uint8)
+        for m in prange(pixels.shape[0]):
+            x = equalizationTable[pixels[m, 0]]*scale
+            y = equalizationTable[pixels[m, 1]]*scale
+            z = equalizationTable[pixels[m, 2]]*scale
+            i = min(int(x), n-2)
+            j = min(int(y), n-2)
+            k = min(int(z), n-2)
+            fx = x-i
+            fy = y-j
+            fz = z-k
+            for c in range(3):
+                c000 = lut[i, j, k, c]
+                c111 = lut[i+1, j+1, k+1, c]
+                if tetrahedral:
+                    if fx >= fy:
+                        if fy >= fz:
+                            v = (1-fx)*c000+(fx-fy)*lut[i+1, j, k, c]+(fy-fz)*lut[i+1, j+1, k, c]+fz*c111
+                        elif fx >= fz:
+                            v = (1-fx)*c000+(fx-fz)*lut[i+1, j, k, c]+(fz-fy)*lut[i+1, j, k+1, c]+fy*c111
+                        else:
+                            v = (1-fz)*c000+(fz-fx)*lut[i, j, k+1, c]+(fx-fy)*lut[i+1, j, k+1, c]+fy*c111
+                    else:
+                        if fz >= fy:
+                            v = (1-fz)*c000+(fz-fy)*lut[i, j, k+1, c]+(fy-fx)*lut[i, j+1, k+1, c]+fx*c111
+                        elif fz >= fx:
+                            v = (1-fy)*c000+(fy-fz)*lut[i, j+1, k, c]+(fz-fx)*lut[i, j+1, k+1, c]+fx*c111
+                        else:
+                            v = (1-fy)*c000+(fy-fx)*lut[i, j+1, k, c]+(fx-fz)*lut[i+1, j+1, k, c]+fz*c111
+                else:
+                    c00 = c000*(1-fx)+lut[i+1, j, k, c]*fx
+                    c01 = lut[i, j, k+1, c]*(1-fx)+lut[i+1, j, k+1, c]*fx
+                    c10 = lut[i, j+1, k, c]*(1-fx)+lut[i+1, j+1, k, c]*fx
+                    c11 = lut[i, j+1, k+1, c]*(1-fx)+c111*fx
+                    v = (c00*(1-fy)+c10*fy)*(1-fz)+(c01*(1-fy)+c11*fy)*fz
+                # clamp and encode, as in _OklabModifier._lsrgb2srgb
+                x = min(v, 1)*encodingScale if v > 0 else 0.
+                e = min(int(x), encodingScale-1)
+                output[m, c] = np.uint8((encodingTable[e]+(encodingTable[e+1]-encodingTable[e])*(x-e))*255+.5)
+        return output
+
+
+class _SaveCancelled(Exception):
+    # raised from a save's checkpoint once the save has been cancelled
+    pass
+
+
+class _StreamingExporter:
+    # Processes an image strip by strip so that the working memory stays within memoryBudget bytes regardless of the
+    # image size. The source may be a memory-mapped array. The first pass gathers the equalization histogram, the
+    # second the inflection point estimate of the equalized image, and the third processes and writes each strip.
+    # STREAMING_OUTPUT_EXTENSIONS are written strip by strip; other formats are assembled in a memory-mapped
+    # temporary file that the encoder reads from. Only the working memory is bounded: the source itself is held in
+    # memory in full unless it is memory mapped, see map_image. Strips are converted as open_image would with
+    # highBitDepth, so a mapped source needn't be.
+    # Working memory per pixel of a strip in the worst case, every pixel being its own unique colour: the strip's
+    # copy, its processed output and that output's channel swap (up to 6 bytes each at 16 bits), the reverse
+    # mapping, the counts and the sort's indices (8 bytes each), and the float32 RGB values of the decomposition, the
+    # equalization and the fused stage (12 bytes each), 86 bytes in all, rounded up for the kernels' temporaries
+    _bytesPerPixel = 96
+
+    def __init__(self, source, memoryBudget=256*2**20, highBitDepth=True):
+        self._source = source
+        self.highBitDepth = highBitDepth
+        height, width = source.shape[:2]
+        self.stripHeight = int(min(max(memoryBudget//(self._bytesPerPixel*width), 1), height))
+        self._stripDtype = _normalize_image(np.asarray(source[:0]), highBitDepth).dtype
+
+    def _strips(self):
+        for top in range(0, self._source.shape[0], self.stripHeight):
+            yield top, _normalize_image(np.ascontiguousarray(self._source[top:top+self.stripHeight]), self.highBitDepth)
+
+    def export(self, filePath, processingParams, checkpoint=None, exportOptions=None):
+        # checkpoint, if given, is called with the fraction of the work done after every strip of every pass; returns
+        # the seconds spent encoding the assembled image, 0 for formats written strip by strip
+        height = self._source.shape[0]
+        if checkpoint is None:
+            checkpoint = lambda fraction: None
+        histogram = np.zeros(256, dtype=np.int64)
+        for top, strip in self._strips():
+            histogram += np.bincount(_RgbModifier.histogram_bins(strip).ravel(), minlength=256)
+            checkpoint(.2*(top+strip.shape[0])/height)
+        rgbModifier = _RgbModifier(None, histogram)
+        lmsModifier = _LmsModifier(None)
+        equalizationTable = None
+        if processingParams[ParamType.EQUALIZE] != 0:
+            equalizationTable = rgbModifier.equalization_table(processingParams[ParamType.EQUALIZE])
+        valueSum = 0.
+        countSum = 0
+        for top, strip in self._strips():
+            stripHeight = strip.shape[0]
+            strip = strip.reshape((-1, 3))
+            sums = lmsModifier.inflection_point_sums(rgbModifier.apply_linearization_table(equalizationTable, strip),
+                                                     np.ones(strip.shape[0], dtype=np.int64),
+                                                     processingParams[ParamType.BRIGHTNESS])
+            valueSum += sums[0]
+            countSum += sums[1]
+            checkpoint(.2+.2*(top+stripHeight)/height)
+        inflectionPoint = lmsModifier.inflection_point_from_sums(valueSum, countSum)
+        outputDtype = _output_dtype(self._stripDtype, filePath)
+        with _StripWriter(filePath, self._source.shape, outputDtype, exportOptions) as writer:
+            for top, strip in self._strips():
+                stripPixels = _UniquePixelData(strip, None if strip.dtype != np.uint8 else 'lexsort')
+                stripProcessor = _ImageProcessor(stripPixels, histogram, outputDtype, fused=True)
+                stripProcessor.inflectionPoint = inflectionPoint
+                stripProcessor.change_processing_params(processingParams)
+                writer.write(top, stripProcessor.processedImage)
+                checkpoint(.4+.5*(top+strip.shape[0])/height)
+        return writer.encodeSeconds
+
+
+class _StripWriter:
+    def __init__(self, filePath, shape, dtype=np.uint8, exportOptions=None):
+        self._filePath = filePath
+        self._shape = shape
+        self._dtype = np.dtype(dtype)
+        self._extension = os.path.splitext(filePath)[1].lower()
+        self._exportOptions = exportOptions if exportOptions is not None else ExportOptions()
+        self.encodeSeconds = 0.
+        self._file = None
+        self._pngWriter = None
+        self._array = None
+        self._temporaryPath = None
+
+    def __enter__(self):
+        if self._extension == '.png':
+            # deflated as one stream as the strips arrive, always Up filtered as in the strip encoder
+            exportOptions = self._exportOptions
+            compressionLevel = 6 if exportOptions.pngCompression is None else exportOptions.pngCompression
+            self._file = open(self._filePath, 'wb')
+            self._pngWriter = _PngStreamWriter(self._file, self._shape[1], self._shape[0], 8*self._dtype.itemsize,
+                                               compressionLevel,
+                                               exportOptions.PNG_STRATEGIES.index(exportOptions.pngStrategy or 'rle'))
+        elif self._extension in ('.ppm', '.pnm'):
+            self._file = open(self._filePath, 'wb')
+            maxValue = _max_pixel_value(self._dtype)
+            self._file.write('P6\n{} {}\n{}\n'.format(self._shape[1], self._shape[0], maxValue).encode())
+        elif self._extension == '.npy':
+            self._array = np.lib.format.open_memmap(self._filePath, mode='w+', dtype=self._dtype, shape=self._shape)
+        else:
+            self._temporaryPath = self._filePath+'.strips.npy'
+            self._array = np.lib.format.open_memmap(self._temporaryPath, mode='w+', dtype=self._dtype,
+                                                    shape=self._shape)
+        return self
+
+    def write(self, top, strip):
+        # strips must be written in order from the top of the image
+        if self._pngWriter is not None:
+            startTime = time.perf_counter()
+            self._pngWriter.write(np.asarray(strip, dtype=self._dtype))
+            self.encodeSeconds += time.perf_counter()-startTime
+        elif self._file is not None:
+            # 16-bit PPM samples are big-endian
+            self._file.write(np.ascontiguousarray(strip, dtype=self._dtype.newbyteorder('>')).tobytes())
+        elif self._temporaryPath is None:
+            self._array[top:top+strip.shape[0]] = strip
+        else:
+            self._array[top:top+strip.shape[0]] = strip[:, :, [2, 1, 0]]
+
+    def __exit__(self, excType, excValue, traceback):
+        import cv2
+        try:
+            if self._file is not None:
+                if self._pngWriter is not None and excType is None:
+                    self._pngWriter.close()
+                self._file.close()
+            elif self._array is not None:
+                self._array.flush()
+                if self._temporaryPath is not None and excType is None:
+                    startTime = time.perf_counter()
+                    if not cv2.imwrite(self._filePath, self._array, self._exportOptions.opencv_params(self._extension)):
+                        raise ValueError('Can\'t write image '+self._filePath)
+                    self.encodeSeconds = time.perf_counter()-startTime
+        finally:
+            self._array = None
+            if self._temporaryPath is not None and os.path.exists(self._temporaryPath):
+                os.remove(self._temporaryPath)
+
+
+_SIXTEEN_BIT_EXTENSIONS = ('.png', '.tif', '.tiff', '.ppm', '.pnm', '.npy')
+
+
+class _ImagePyramid:
+    # level 0 is the image itself and each level after it halves the one before with downscale_image; levels are
+    # built on first use and kept, which costs at most a third of the image's memory
+    def __init__(self, image, levelCount, resampleFilter='box'):
+        self.levelCount = levelCount
+        self.resampleFilter = resampleFilter
+        self._levels = [image]
+        self._lock = threading.Lock()
+
+    def level(self, index):
+        with self._lock:
+            while len(self._levels) <= index:
+                self._levels.append(downscale_image(self._levels[-1], self.level_shape(len(self._levels)),
+                                                    self.resampleFilter))
+            return self._levels[index]
+
+    def memory_usage(self):
+        # level 0 is the caller's image, so only the levels built from it are counted
+        with self._lock:
+            return _resident_bytes(*self._levels[1:])
+
+    def level_shape(self, index):
+        height, width = self._levels[0].shape[:2]
+        for _ in range(index):
+            height, width = (height+1)//2, (width+1)//2
+        return height, width
+
+
+class _ViewportRenderer:
+    # Renders regions of any pyramid level through the processing parameters, one tile at a time. Tile
+    # decompositions and rendered tiles are kept in LRU caches, so panning only processes the tiles that come into
+    # view. Equalization and the brightness statistics come from statisticsPixels, the decomposed display image, so
+    # that every level matches the fitted view.
+    def __init__(self, pyramid, statisticsPixels, tileSize=256, maxTilePixels=128, maxRenderedTiles=256):
+        self.pyramid = pyramid
+        self.tileSize = tileSize
+        self.maxTilePixels = maxTilePixels
+        self.maxRenderedTiles = maxRenderedTiles
+        self._statisticsPixels = statisticsPixels
+        self._rgbModifier = _RgbModifier(statisticsPixels)
+        self._statisticsKey = None
+        self._equalizationTable = None
+        self._inflectionPoint = None
+        self._tilePixels: collections.OrderedDict = collections.OrderedDict()
+        self._renderedTiles: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def memory_usage(self):
+        with self._lock:
+            tilePixelsBytes = sum(sum(tilePixels.memory_usage().values()) for tilePixels in self._tilePixels.values())
+            return tilePixelsBytes+_resident_bytes(*self._renderedTiles.values())+self.pyramid.memory_usage()
+
+    def render(self, processingParams, level, top, left, height, width, original=False):
+        # returns the height by width region of level whose top left corner is at (top, left), black where it falls
+        # outside the level; with original, the region is returned unprocessed
+        with self._lock:
+            levelHeight, levelWidth = self.pyramid.level_shape(level)
+            output = np.zeros((height, width, 3), dtype=np.uint8)
+            bottom = min(top+height, levelHeight)
+            right = min(left+width, levelWidth)
+            tileSize = self.tileSize
+            for row in range(max(top, 0)//tileSize, (bottom-1)//tileSize+1):
+                for column in range(max(left, 0)//tileSize, (right-1)//tileSize+1):
+                    if original:
+                        tile = _convert_pixels(self._tile_source(level, row, column), np.uint8)
+                    else:
+                        tile = self._rendered_tile(processingParams, level, row, column)
+                    tileTop = row*tileSize
+                    tileLeft = column*tileSize
+                    y0 = max(top, tileTop)
+                    y1 = min(bottom, tileTop+tile.shape[0])
+                    x0 = max(left, tileLeft)
+                    x1 = min(right, tileLeft+tile.shape[1])
+                    output[y0-top:y1-top, x0-left:x1-left] = tile[y0-tileTop:y1-tileTop, x0-tileLeft:x1-tileLeft]
+            return output
+
+    def _tile_source(self, level, row, column):
+        tileSize = self.tileSize
+        return self.pyramid.level(level)[row*tileSize:(row+1)*tileSize, column*tileSize:(column+1)*tileSize]
+
+    def _tile_pixels(self, level, row, column):
+        key = (level, row, column)
+        tilePixels = self._tilePixels.get(key)
+        if tilePixels is None:
+            tilePixels = _UniquePixelData(np.ascontiguousarray(self._tile_source(level, row, column)))
+            self._tilePixels[key] = tilePixels
+            if len(self._tilePixels) > self.maxTilePixels:
+                self._tilePixels.popitem(last=False)
+        else:
+            self._tilePixels.move_to_end(key)
+        return tilePixels
+
+    def _rendered_tile(self, processingParams, level, row, column):
+        params = tuple(processingParams[param] for param in ParamType)
+        key = (level, row, column, params)
+        tile = self._renderedTiles.get(key)
+        if tile is not None:
+            self._renderedTiles.move_to_end(key)
+            return tile
+        self._update_statistics(processingParams)
+        tilePixels = self._tile_pixels(level, row, column)
+        linearPixels = tilePixels.with_values(
+            _RgbModifier.apply_linearization_table(self._equalizationTable, tilePixels.values))
+        _FusedModifier(linearPixels).modify(processingParams[ParamType.BRIGHTNESS],
+                                            processingParams[ParamType.CONTRAST],
+                                            processingParams[ParamType.WARMTH],
+                                            processingParams[ParamType.TINT],
+                                            processingParams[ParamType.SATURATION],
+                                            processingParams[ParamType.TWO_TONE_HUE],
+                                            processingParams[ParamType.TWO_TONE_SATURATION],
+                                            self._inflectionPoint)
+        tile = linearPixels.reverse()
+        self._renderedTiles[key] = tile
+        if len(self._renderedTiles) > self.maxRenderedTiles:
+            self._renderedTiles.popitem(last=False)
+        return tile
+
+    def _update_statistics(self, processingParams):
+        key = (processingParams[ParamType.EQUALIZE], processingParams[ParamType.BRIGHTNESS])
+        if key == self._statisticsKey:
+            return
+        equalize, brightness = key
+        self._equalizationTable = None if equalize == 0 else self._rgbModifier.equalization_table(equalize)
+        linearPixels = self._statisticsPixels.with_values(
+            _RgbModifier.apply_linearization_table(self._equalizationTable, self._statisticsPixels.values))
+        self._inflectionPoint = _FusedModifier(linearPixels).inflection_point(brightness)
+        self._statisticsKey = key
+
+
+def _output_dtype(imageDtype, filePath):
+    # high bit depth images are written with 16 bits wherever the format allows it
+    if imageDtype != np.uint8 and os.path.splitext(filePath)[1].lower() in _SIXTEEN_BIT_EXTENSIONS:
+        return np.uint16
+    return np.uint8
+
+
+class ExportOptions:
+    # encoder settings for saved and encoded images; None leaves a setting to the encoder's default. jpegSubsampling
+    # is one of JPEG_SUBSAMPLINGS and pngStrategy one of PNG_STRATEGIES. pngStripCount > 1 encodes PNGs in that many
+    # strips in parallel, or in one strip per CPU with 0, instead of with OpenCV; the strips are always delta filtered
+    # against the row above, which is much faster than OpenCV's adaptive filtering, and deflated with the 'rle'
+    # strategy unless pngStrategy says otherwise, which for photos is both faster and smaller than the default
+    JPEG_SUBSAMPLINGS = ('444', '422', '420', '411', '440')
+    PNG_STRATEGIES = ('default', 'filtered', 'huffman', 'rle', 'fixed')
+
+    def __init__(self, jpegQuality=None, jpegSubsampling=None, jpegProgressive=False, jpegOptimize=False,
+                 pngCompression=None, pngStrategy=None, pngStripCount=1, webpQuality=None):
+        if jpegSubsampling is not None and jpegSubsampling not in self.JPEG_SUBSAMPLINGS:
+            raise ValueError('Unknown subsampling '+str(jpegSubsampling))
+        if pngStrategy is not None and pngStrategy not in self.PNG_STRATEGIES:
+            raise ValueError('Unknown strategy '+str(pngStrategy))
+        self.jpegQuality = jpegQuality
+        self.jpegSubsampling = jpegSubsampling
+        self.jpegProgressive = jpegProgressive
+        self.jpegOptimize = jpegOptimize
+        # 0 (fastest, no compression) to 9 (smallest)
+        self.pngCompression = pngCompression
+        self.pngStrategy = pngStrategy
+        self.pngStripCount = pngStripCount
+        self.webpQuality = webpQuality
+
+    def opencv_params(self, extension):
+        import cv2
+        extension = extension.lower()
+        params = []
+        if extension in ('.jpg', '.jpeg', '.jpe'):
+            if self.jpegQuality is not None:
+                params += [cv2.IMWRITE_JPEG_QUALITY, int(self.jpegQuality)]
+            if self.jpegSubsampling is not None:
+                params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR,
+                           getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_'+self.jpegSubsampling)]
+            if self.jpegProgressive:
+                params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+            if self.jpegOptimize:
+                params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        elif extension == '.png':
+            if self.pngCompression is not None:
+                params += [cv2.IMWRITE_PNG_COMPRESSION, int(self.pngCompression)]
+            if self.pngStrategy is not None:
+                params += [cv2.IMWRITE_PNG_STRATEGY, self.PNG_STRATEGIES.index(self.pngStrategy)]
+        elif extension == '.webp' and self.webpQuality is not None:
+            params += [cv2.IMWRITE_WEBP_QUALITY, int(self.webpQuality)]
+        return params
+
+    def png_strip_count(self, extension):
+        # strips a PNG is encoded in by _encode_png_strips, or 0 if it is encoded by OpenCV
+        if extension.lower() != '.png' or self.pngStripCount == 1:
+            return 0
+        return self.pngStripCount or os.cpu_count() or 1
+
+
+def encode_image(image, extension, exportOptions=None):
+    # encodes an RGB image to the format of extension, e.g. '.jpg', returning the encoded bytes
+    import cv2
+    if exportOptions is None:
+        exportOptions = ExportOptions()
+    stripCount = exportOptions.png_strip_count(extension)
+    if stripCount:
+        return _encode_png_strips(image, 6 if exportOptions.pngCompression is None else exportOptions.pngCompression,
+                                  exportOptions.PNG_STRATEGIES.index(exportOptions.pngStrategy or 'rle'), stripCount)
+    isEncoded, encoded = cv2.imencode(extension, image[:, :, [2, 1, 0]], exportOptions.opencv_params(extension))
+    if not isEncoded:
+        raise ValueError('Can\'t encode image as '+extension)
+    return encoded.tobytes()
+
+
+def _encode_png_strips(image, compressionLevel, strategy, stripCount):
+    # each strip is filtered and deflated independently on its own thread, zlib releasing the GIL, and the raw
+    # deflate streams are joined with sync flushes into one zlib stream, as pigz does; image may be a view such as
+    # a channel reversed memory map, which is read one strip at a time
+    import concurrent.futures
+    height, width = image.shape[:2]
+    bitDepth = 16 if image.dtype == np.uint16 else 8
+    stripHeight = -(-height//stripCount)
+
+    def compress_strip(top):
+        previousRow = None if top == 0 else _png_row_bytes(image[top-1:top], bitDepth)[0]
+        filtered = _png_up_filter(_png_row_bytes(image[top:top+stripHeight], bitDepth), previousRow)
+        compressor = zlib.compressobj(compressionLevel, zlib.DEFLATED, -15, 9, strategy)
+        isLast = top+stripHeight >= height
+        compressed = (compressor.compress(filtered) +
+                      compressor.flush(zlib.Z_FINISH if isLast else zlib.Z_SYNC_FLUSH))
+        return compressed, zlib.adler32(filtered), filtered.size
+
+    with concurrent.futures.ThreadPoolExecutor(min(stripCount, os.cpu_count() or 1)) as executor:
+        strips = list(executor.map(compress_strip, range(0, height, stripHeight)))
+    # the checksum of the whole stream from those of the strips
+    adlerBase = 65521
+    a, b = 1, 0
+    for _, stripChecksum, length in strips:
+        stripA, stripB = stripChecksum & 0xffff, stripChecksum >> 16
+        b = (b+stripB+length*(a-1)) % adlerBase
+        a = (a+stripA-1) % adlerBase
+    parts = [_png_header(width, height, bitDepth)]
+    for i, (compressed, _, _) in enumerate(strips):
+        if i == 0:
+            compressed = b'\x78\x01'+compressed
+        if i == len(strips)-1:
+            compressed += struct.pack('>I', (b << 16) | a)
+        parts.append(_png_chunk(b'IDAT', compressed))
+    parts.append(_png_chunk(b'IEND', b''))
+    return b''.join(parts)
+
+
+class _PngStreamWriter:
+    # writes an RGB PNG to an open file a strip of rows at a time through a single deflate stream, holding on to
+    # nothing but the last row of the previous strip
+    def __init__(self, file, width, height, bitDepth=8, compressionLevel=6, strategy=zlib.Z_RLE):
+        self._file = file
+        self._bitDepth = bitDepth
+        self._compressor = zlib.compressobj(compressionLevel, zlib.DEFLATED, 15, 9, strategy)
+        self._previousRow = None
+        file.write(_png_header(width, height, bitDepth))
+
+    def write(self, rows):
+        rows = _png_row_bytes(rows, self._bitDepth)
+        compressed = self._compressor.compress(_png_up_filter(rows, self._previousRow))
+        self._previousRow = rows[-1].copy()
+        if compressed:
+            self._file.write(_png_chunk(b'IDAT', compressed))
+
+    def close(self):
+        self._file.write(_png_chunk(b'IDAT', self._compressor.flush())+_png_chunk(b'IEND', b''))
+
+
+def _png_header(width, height, bitDepth):
+    return b'\x89PNG\r\n\x1a\n'+_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bitDepth, 2, 0, 0, 0))
+
+
+def _png_chunk(chunkType, data):
+    return struct.pack('>I', len(data))+chunkType+data+struct.pack('>I', zlib.crc32(data, zlib.crc32(chunkType)))
+
+
+def _png_row_bytes(rows, bitDepth):
+    # rows as PNG samples, big-endian for 16 bits
+    rows = np.ascontiguousarray(rows, dtype='>u2' if bitDepth == 16 else np.uint8)
+    return rows.view(np.uint8).reshape((rows.shape[0], -1))
+
+
+def _png_up_filter(rows, previousRow=None):
+    # filter type 2 stores each row's difference from the row above, which is zero above the first row
+    filtered = np.empty((rows.shape[0], rows.shape[1]+1), dtype=np.uint8)
+    filtered[:, 0] = 2
+    filtered[0, 1:] = rows[0] if previousRow is None else rows[0]-previousRow
+    np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+    return filtered
+
+
+def open_image(filePath, highBitDepth=False):
+    # .npy files holding RGB images are memory mapped rather than read into memory, unless they need converting
+    if filePath.endswith('.npy'):
+        image = map_image(filePath)
+    else:
+        import cv2
+        image = cv2.imread(filePath, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError('Can\'t read image '+filePath)
+        if image.ndim == 3 and image.shape[2] == 3:
+            # in place, so that opening doesn't briefly take twice the decoded image's memory
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+        else:
+            image = image[:, :, [2, 1, 0]]
+    return _normalize_image(image, highBitDepth)
+
+
+def _normalize_image(image, highBitDepth=False):
+    # with highBitDepth, uint16 images are kept as they are and float32 images are clipped to [0, 1]; otherwise
+    # both are quantized to uint8
+    if not image.dtype.isnative:
+        image = image.astype(image.dtype.newbyteorder('='))
+    if image.dtype == np.uint16:
+        if not highBitDepth:
+            image = np.round(image/257).astype(np.uint8)
+    elif image.dtype == np.float32:
+        image = np.clip(image, 0, 1)
+        if not highBitDepth:
+            image = np.round(image*255).astype(np.uint8)
+    elif image.dtype != np.uint8:
+        raise TypeError('Can\'t handle image of type '+str(image.dtype))
+    return image
+
+
+STREAMING_SOURCE_EXTENSIONS = ('.npy', '.ppm', '.pnm')
+STREAMING_OUTPUT_EXTENSIONS = ('.npy', '.ppm', '.pnm', '.png')
+_PPM_HEADER = re.compile(rb'P6(?:\s+|#[^\n]*\n)+(\d+)(?:\s+|#[^\n]*\n)+(\d+)(?:\s+|#[^\n]*\n)+(\d+)\s')
+
+
+def map_image(filePath):
+    # memory maps an RGB image of one of STREAMING_SOURCE_EXTENSIONS without converting it; binary PPM samples are
+    # big-endian at 16 bits
+    extension = os.path.splitext(filePath)[1].lower()
+    if extension == '.npy':
+        image = np.load(filePath, mmap_mode='r')
+        if image.ndim != 3 or image.shape[2] != 3:
+            raise TypeError('Can\'t handle array of shape '+str(image.shape))
+        return image
+    if extension not in STREAMING_SOURCE_EXTENSIONS:
+        raise ValueError('Can\'t memory map {}, only {} files can be'.format(filePath,
+                                                                          ', '.join(STREAMING_SOURCE_EXTENSIONS)))
+    with open(filePath, 'rb') as file:
+        header = _PPM_HEADER.match(file.read(4096))
+    if header is None or int(header[3]) not in (255, 65535):
+        raise ValueError('Can\'t memory map {}, only binary PPM files with 8 or 16 bit samples can be'.format(filePath))
+    width, height, maxValue = (int(value) for value in header.groups())
+    return np.memmap(filePath, np.uint8 if maxValue == 255 else np.dtype('>u2'), 'r', header.end(),
+                     (height, width, 3))
+
+
+def export_image(sourcePath, filePath, processingParams, highBitDepth=False, exportOptions=None):
+    # processes the full resolution image whole, without building the display image and its decomposition as a Model
+    # would; returns the seconds spent encoding
+    image = open_image(sourcePath, highBitDepth)
+    params = _ImageProcessor.default_processing_params()
+    params.update(processingParams)
+    imageProcessor = _ImageProcessor(image, outputDtype=_output_dtype(image.dtype, filePath), fused=True)
+    imageProcessor.change_processing_params(params)
+    startTime = time.perf_counter()
+    encoded = encode_image(imageProcessor.processedImage, os.path.splitext(filePath)[1], exportOptions)
+    encodeSeconds = time.perf_counter()-startTime
+    with open(filePath, 'wb') as file:
+        file.write(encoded)
+    return encodeSeconds
+
+
+def export_image_streaming(sourcePath, filePath, processingParams, memoryBudget=256*2**20, highBitDepth=False,
+                           exportOptions=None):
+    # the source is memory mapped and the output written strip by strip, so that memory use stays within
+    # memoryBudget whatever the image size; the source must be one of STREAMING_SOURCE_EXTENSIONS and the output one
+    # of STREAMING_OUTPUT_EXTENSIONS. Returns the seconds spent encoding
+    if os.path.splitext(filePath)[1].lower() not in STREAMING_OUTPUT_EXTENSIONS:
+        raise ValueError('Can\'t stream to {}, only to {} files'.format(filePath,
+                                                                       ', '.join(STREAMING_OUTPUT_EXTENSIONS)))
+    params = _ImageProcessor.default_processing_params()
+    params.update(processingParams)
+    return _StreamingExporter(map_image(sourcePath), memoryBudget, highBitDepth).export(filePath, params,
+                                                                                        exportOptions=exportOptions)
 
 
 class Model:
-    def __init__(self, filePath: str, maxDisplayImageSize: tuple[int, int] = (780, 1525)) -> None:
+    def __init__(self, filePath: str, maxDisplayImageSize: tuple[int, int] = (780, 1525),
+                 exportLutSize: Optional[int] = None, previewScale: Optional[float] = None,
+                 exportMemoryBudget: Optional[int] = None, highBitDepth: bool = False,
+                 downscaleFilter: str = 'box', spillDirectory: Optional[str] = None,
+                 frameCacheBudget: int = 64*2**20, historyLength: int = 100,
+                 exportOptions: Optional['ExportOptions'] = None) -> None:
 
         def downscale_image_if_too_big(img: NDArray[np.uint8]) -> NDArray[np.uint8]:
             maxRelDim = np.maximum(img.shape[0]/maxDisplayImageSize[0], img.shape[1]/maxDisplayImageSize[1])
             if maxRelDim > 1:
-                # TODO: add anti-aliasing filter before downsampling, consider linearizing first
-                img = cv2.resize(img, None, fx=maxRelDim**-1, fy=maxRelDim**-1, interpolation=cv2.INTER_CUBIC)
+                shape = (max(round(img.shape[0]/maxRelDim), 1), max(round(img.shape[1]/maxRelDim), 1))
+                img = downscale_image(img, shape, downscaleFilter)
             return img
 
         self.filePath: str = filePath
+        # one of DOWNSCALE_FILTERS, used for the display image, its preview proxy and the zoom pyramid
+        self.downscaleFilter: str = downscaleFilter
+        # when set, full resolution exports are approximated with a 3D LUT of this many nodes per axis
+        self.exportLutSize: Optional[int] = exportLutSize
+        # when set, full resolution exports are processed in strips within this many bytes of working memory; this
+        # bounds the processing only, as the full resolution image is held in memory besides (memory mapped for .npy)
+        self.exportMemoryBudget: Optional[int] = exportMemoryBudget
+        # encoder settings of save_image and encode_image unless they are given their own
+        self.exportOptions: ExportOptions = exportOptions if exportOptions is not None else ExportOptions()
+        # seconds the last save_image or encode_image spent encoding
+        self.lastEncodeSeconds: Optional[float] = None
         self._existUnsavedChanges: _Observable[bool] = _Observable(False)
-        image = cv2.imread(filePath, cv2.IMREAD_UNCHANGED)
-        # TODO: add compatibility for 16 and 32 bit images
-        if image.dtype == np.uint16:
-            image = np.round(image/257).astype(np.uint8)
-        elif image.dtype == np.float32:
-            image = np.round(image*255).astype(np.uint8)
-        elif image.dtype != np.uint8:
-            raise TypeError('Can\'t handle image of type '+str(image.dtype))
-        image = image[:, :, [2, 1, 0]]
-        self._originalTrueImage: NDArray[np.uint8] = image
-        imageDownscaled = downscale_image_if_too_big(image)
+        # per-stage timings of renders, previews and saves, disabled until instrumentation.enabled is set
+        self.instrumentation: _Instrumentation = _Instrumentation()
+        # with highBitDepth, 16-bit and float images are processed and exported at full precision while the
+        # display image is always 8-bit
+        self.highBitDepth: bool = highBitDepth
+        image = open_image(filePath, highBitDepth)
+        # None once release_memory has dropped it, see _get_true_image
+        self._originalTrueImage: Optional[NDArray] = image
+        self._trueImageShape: tuple[int, ...] = image.shape
+        self._trueImageLock = threading.Lock()
+        # release_memory rereads the full resolution image from the source file only if the file is unchanged, and
+        # otherwise spills it to a memory mapped file in spillDirectory, the system's temporary directory when None
+        self.spillDirectory: Optional[str] = spillDirectory
+        self._sourceSignature = self._file_signature(filePath)
+        self._sourceModified = False
+        self._spillPath: Optional[str] = None
+        imageDownscaled = _convert_pixels(downscale_image_if_too_big(image), np.uint8)
         self.originalDisplayImage: NDArray[np.uint8] = imageDownscaled
-        self._displayImageProcessor: _ImageProcessor = _ImageProcessor(imageDownscaled)
+        # display frames are rendered into two persistent buffers in turn, so the frame being shown is not
+        # overwritten by the render that follows it, and the values of recent renders are cached within
+        # frameCacheBudget bytes so that undo, redo and going back to recent parameters skip the pipeline
+        self._displayImageProcessor: _ImageProcessor = _ImageProcessor(imageDownscaled,
+                                                                       instrumentation=self.instrumentation,
+                                                                       frameBufferCount=2,
+                                                                       frameCacheBudget=frameCacheBudget)
+        # coarse proxy of the display image with its own decomposition, used by render_preview
+        self._previewImageProcessor: Optional[_ImageProcessor] = None
+        self._previewFrames: list[NDArray[np.uint8]] = []
+        self._nextPreviewFrame = 0
+        if previewScale is not None and min(imageDownscaled.shape[:2])*previewScale >= 1:
+            previewImage = downscale_image(imageDownscaled, (round(imageDownscaled.shape[0]*previewScale),
+                                                             round(imageDownscaled.shape[1]*previewScale)),
+                                           downscaleFilter)
+            self._previewImageProcessor = _ImageProcessor(previewImage, instrumentation=self.instrumentation,
+                                                          operation='preview', frameBufferCount=1)
+            self._previewFrames = [np.empty(imageDownscaled.shape, dtype=np.uint8) for _ in range(2)]
+        # histograms and vectorscope of the last render, see scopes
+        self._scopeCalculator = _ScopeCalculator()
+        self._previewIsCurrent = False
+        # parameter snapshots added by record_history, the current one at _historyIndex; at most historyLength are
+        # kept, the oldest being dropped first
+        self.historyLength: int = historyLength
+        self._history: list[dict[ParamType, float]] = [dict(self._displayImageProcessor.processingParams)]
+        self._historyIndex = 0
+        self._historyLock = threading.Lock()
+        # zoomed views are rendered tile by tile from a pyramid of the full resolution image, set up on first use
+        self._viewportRenderer: Optional[_ViewportRenderer] = None
+        self._viewportRendererLock = threading.Lock()
+        # the full resolution decomposition is computed once in the background and reused by every save
+        self._trueImagePixels: Optional[_UniquePixelData] = None
+        self._trueImagePixelsLock = threading.Lock()
+        self._trueImagePixelsThread: Optional[threading.Thread] = None
+        if imageDownscaled is image:
+            self._trueImagePixels = self._displayImageProcessor._originalPixels
+        elif (exportLutSize is None or image.dtype != np.uint8) and exportMemoryBudget is None:
+            self._start_true_image_pixels_thread()
 
     @property
     def processedDisplayImage(self):
+        # a persistent frame that is overwritten two renders later, copy it to keep it
         return self._displayImageProcessor.processedImage
 
     @property
@@ -389,17 +2019,370 @@ class Model:
 
     def change_processing_params(self, paramDict):
         self._existUnsavedChanges.data = True
+        if self._previewImageProcessor is not None:
+            self._previewImageProcessor.processingParams.update(paramDict)
         self._displayImageProcessor.change_processing_params(paramDict)
+        self._previewIsCurrent = False
+
+    def render_preview(self, paramDict) -> NDArray[np.uint8]:
+        import cv2
+        # renders the coarse proxy and scales it to the display size, calling change_processing_params({})
+        # afterwards renders the same parameters at full display resolution; parameters with a cached display frame
+        # are rendered at full display resolution straight away
+        processingParams = {**self._displayImageProcessor.processingParams, **paramDict}
+        if (self._previewImageProcessor is None or
+                self._displayImageProcessor.has_cached_frame(processingParams)):
+            self.change_processing_params(paramDict)
+            return self.processedDisplayImage
+        self._previewIsCurrent = True
+        self._existUnsavedChanges.data = True
+        self._displayImageProcessor.processingParams.update(paramDict)
+        self._previewImageProcessor.change_processing_params(paramDict)
+        height, width = self.originalDisplayImage.shape[:2]
+        frame = self._previewFrames[self._nextPreviewFrame]
+        self._nextPreviewFrame = (self._nextPreviewFrame+1) % len(self._previewFrames)
+        return cv2.resize(self._previewImageProcessor.processedImage, (width, height), dst=frame,
+                          interpolation=cv2.INTER_LINEAR)
+
+    def prerender(self, paramDict, isCancelled: Optional[Callable[[], bool]] = None) -> bool:
+        # renders the display frame of the current parameters updated with paramDict into the frame cache, so that
+        # render_preview shows it at once if it is requested later; the current parameters and images are unchanged.
+        # Runs stage by stage and stops early once isCancelled returns True, returning whether a frame was added;
+        # must not run concurrently with the other rendering methods
+        return self._displayImageProcessor.prerender(paramDict, isCancelled)
+
+    def scopes(self) -> dict[str, NDArray[np.int64]]:
+        # RGB and luma histograms and an OKLAB a/b vectorscope of the last render, whether of the display image or of
+        # the preview proxy, counted from the unique colours of the render rather than its pixels
+        processor = self._previewImageProcessor if self._previewIsCurrent else self._displayImageProcessor
+        return self._scopeCalculator.compute(processor._modifiedPixels)
+
+    def record_history(self) -> None:
+        # adds the current parameters as the next undo step unless they already are the current step, discarding any
+        # steps that could be redone; call it once an adjustment is complete rather than on every render
+        with self._historyLock:
+            processingParams = dict(self._displayImageProcessor.processingParams)
+            if processingParams == self._history[self._historyIndex]:
+                return
+            del self._history[self._historyIndex+1:]
+            self._history.append(processingParams)
+            del self._history[:-self.historyLength]
+            self._historyIndex = len(self._history)-1
+
+    @property
+    def canUndo(self) -> bool:
+        return self._historyIndex > 0
+
+    @property
+    def canRedo(self) -> bool:
+        return self._historyIndex < len(self._history)-1
+
+    def undo(self) -> Optional[dict[ParamType, float]]:
+        # steps back through the history, returning the parameters to render, e.g. with change_processing_params,
+        # or None if there is nothing to undo; their display frame is usually still cached
+        with self._historyLock:
+            if self._historyIndex == 0:
+                return None
+            self._historyIndex -= 1
+            return dict(self._history[self._historyIndex])
+
+    def redo(self) -> Optional[dict[ParamType, float]]:
+        with self._historyLock:
+            if self._historyIndex == len(self._history)-1:
+                return None
+            self._historyIndex += 1
+            return dict(self._history[self._historyIndex])
+
+    @property
+    def zoomLevelCount(self) -> int:
+        # pyramid levels larger than the display image, level 0 being the full resolution image
+        height, width = self._trueImageShape[:2]
+        displayHeight, displayWidth = self.originalDisplayImage.shape[:2]
+        levelCount = 1
+        while (height+1)//2 > displayHeight or (width+1)//2 > displayWidth:
+            height, width = (height+1)//2, (width+1)//2
+            levelCount += 1
+        return levelCount
+
+    def zoom_level_shape(self, level) -> tuple[int, int]:
+        return self._get_viewport_renderer().pyramid.level_shape(level)
+
+    def render_viewport(self, level, top, left, height, width, original=False) -> NDArray[np.uint8]:
+        # renders the region of a zoom level with its top left corner at (top, left) through the current parameters,
+        # or unprocessed with original; may run on a worker thread while the display image renders on another
+        return self._get_viewport_renderer().render(dict(self._displayImageProcessor.processingParams), level, top,
+                                                    left, height, width, original)
 
-    def save_image(self, filePath):
+    def _get_viewport_renderer(self):
+        with self._viewportRendererLock:
+            if self._viewportRenderer is None:
+                pyramid = _ImagePyramid(self._get_true_image(), self.zoomLevelCount, self.downscaleFilter)
+                self._viewportRenderer = _ViewportRenderer(pyramid, self._displayImageProcessor._originalPixels)
+            return self._viewportRenderer
+
+    @property
+    def processingParams(self) -> dict[ParamType, float]:
+        # a snapshot of the current parameters
+        return dict(self._displayImageProcessor.processingParams)
+
+    def save_image(self, filePath, processingParams=None,
+                   progress: Optional[Callable[[float], None]] = None,
+                   isCancelled: Optional[Callable[[], bool]] = None,
+                   exportOptions: Optional['ExportOptions'] = None) -> bool:
+        # processingParams overrides the current parameters, e.g. with a preset or a snapshot taken earlier, and
+        # exportOptions overrides self.exportOptions; the format follows the extension of filePath
+        # progress, if given, is called with the fraction of the save done, and isCancelled is checked at the same
+        # points, the save giving up once it returns True; returns whether the image was saved. The image is written
+        # to a temporary file that replaces filePath once complete, so a cancelled or failed save leaves it as it was.
+        # Saving doesn't clear existUnsavedChanges, see mark_saved
+        processingParams = self._export_params(processingParams)
+
+        def checkpoint(fraction):
+            if isCancelled is not None and isCancelled():
+                raise _SaveCancelled()
+            if progress is not None:
+                progress(fraction)
+
+        directory, fileName = os.path.split(os.path.abspath(filePath))
+        name, extension = os.path.splitext(fileName)
+        # created with the mode a file written in place would get, the umask applying, rather than mkstemp's owner
+        # only mode
+        while True:
+            temporaryPath = os.path.join(directory, '.{}.{}{}'.format(name, os.urandom(4).hex(), extension))
+            try:
+                os.close(os.open(temporaryPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+                break
+            except FileExistsError:
+                pass
+        try:
+            checkpoint(0.)
+            self._write_image(temporaryPath, processingParams, checkpoint, exportOptions or self.exportOptions)
+            checkpoint(1.)
+            # a file written in place would keep the mode of the file it overwrites
+            if os.path.exists(filePath):
+                shutil.copymode(filePath, temporaryPath)
+            if os.path.abspath(filePath) == os.path.abspath(self.filePath):
+                # the source can no longer be reread by _get_true_image
+                self._sourceModified = True
+            os.replace(temporaryPath, filePath)
+        except _SaveCancelled:
+            return False
+        finally:
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+        return True
+
+    def encode_image(self, extension, processingParams=None, exportOptions: Optional['ExportOptions'] = None) -> bytes:
+        # the full resolution image encoded in memory in the format of extension, e.g. '.png', with the same
+        # overrides as save_image; the image is always processed whole, even with exportMemoryBudget
+        processingParams = self._export_params(processingParams)
+        trueImage = self._get_true_image()
+        outputDtype = _output_dtype(trueImage.dtype, extension)
+        processedImage = self._process_true_image(trueImage, processingParams, outputDtype, lambda fraction: None,
+                                                  'encode')
+        return self._encode(processedImage, extension, exportOptions or self.exportOptions, 'encode')
+
+    def _export_params(self, overrides):
         processingParams = copy.deepcopy(self._displayImageProcessor.processingParams)
-        self._existUnsavedChanges.data = False
-        trueImageProcessor = _ImageProcessor(self._originalTrueImage)
+        if overrides is not None:
+            processingParams.update(overrides)
+        return processingParams
+
+    def _write_image(self, filePath, processingParams, checkpoint, exportOptions):
+        trueImage = self._get_true_image()
+        instrumentation = self.instrumentation
+        measuring = instrumentation.enabled
+        saveStartTime = startTime = time.perf_counter()
+        usesLut = self.exportLutSize is not None and trueImage.dtype == np.uint8
+        if self.exportMemoryBudget is not None and not usesLut:
+            self.lastEncodeSeconds = _StreamingExporter(trueImage, self.exportMemoryBudget).export(
+                filePath, processingParams, checkpoint, exportOptions)
+            if measuring:
+                instrumentation.record('save', 'streaming', time.perf_counter()-startTime)
+                instrumentation.record('save', 'encode', self.lastEncodeSeconds)
+                instrumentation.record('save', 'total', time.perf_counter()-saveStartTime)
+            return
+        outputDtype = _output_dtype(trueImage.dtype, filePath)
+        processedImage = self._process_true_image(trueImage, processingParams, outputDtype, checkpoint, 'save')
+        checkpoint(.8)
+        encoded = self._encode(processedImage, os.path.splitext(filePath)[1], exportOptions, 'save')
+        startTime = time.perf_counter()
+        with open(filePath, 'wb') as file:
+            file.write(encoded)
+        if measuring:
+            instrumentation.record('save', 'write', time.perf_counter()-startTime, 0, len(encoded))
+            instrumentation.record('save', 'total', time.perf_counter()-saveStartTime)
+
+    def _process_true_image(self, trueImage, processingParams, outputDtype, checkpoint, operation):
+        instrumentation = self.instrumentation
+        measuring = instrumentation.enabled
+        startTime = time.perf_counter()
+        if self.exportLutSize is not None and trueImage.dtype == np.uint8:
+            processedImage = _LutProcessor(trueImage, self.exportLutSize).process(processingParams)
+            if measuring:
+                instrumentation.record(operation, 'lut', time.perf_counter()-startTime, 0, processedImage.nbytes)
+            return processedImage
+        # a hit means the background decomposition had already finished
+        decompositionReady = self._trueImagePixels is not None
+        trueImagePixels = self._get_true_image_pixels()
+        if measuring:
+            instrumentation.record(operation, 'decompose', time.perf_counter()-startTime,
+                                   trueImagePixels.values.shape[0], 0, decompositionReady)
+        checkpoint(.4)
+        trueImageProcessor = _ImageProcessor(trueImagePixels, outputDtype=outputDtype, instrumentation=instrumentation,
+                                             operation=operation, fused=True)
         trueImageProcessor.change_processing_params(processingParams)
-        cv2.imwrite(filePath, trueImageProcessor.processedImage[:, :, [2, 1, 0]])
+        return trueImageProcessor.processedImage
+
+    def _encode(self, processedImage, extension, exportOptions, operation):
+        startTime = time.perf_counter()
+        encoded = encode_image(processedImage, extension, exportOptions)
+        self.lastEncodeSeconds = time.perf_counter()-startTime
+        if self.instrumentation.enabled:
+            self.instrumentation.record(operation, 'encode', self.lastEncodeSeconds, 0, len(encoded))
+        return encoded
+
+    def mark_saved(self, processingParams) -> None:
+        # clears existUnsavedChanges if processingParams, those of a finished save, are still the current ones; call
+        # it from the thread that handles existUnsavedChanges callbacks rather than the one that saved
+        if processingParams == self._displayImageProcessor.processingParams:
+            self._existUnsavedChanges.data = False
 
     def add_processedImage_callback(self, func):
         self._displayImageProcessor.add_processedImage_callback(func)
 
+    def _start_true_image_pixels_thread(self):
+        with self._trueImagePixelsLock:
+            if self._trueImagePixelsThread is None and self._trueImagePixels is None:
+                self._trueImagePixelsThread = threading.Thread(target=self._compute_true_image_pixels, daemon=True)
+                self._trueImagePixelsThread.start()
+
+    def _compute_true_image_pixels(self):
+        self._trueImagePixels = _UniquePixelData(self._get_true_image())
+
+    def _get_true_image_pixels(self) -> _UniquePixelData:
+        # waits for the in-flight job rather than starting a duplicate
+        self._start_true_image_pixels_thread()
+        thread = self._trueImagePixelsThread
+        if thread is not None:
+            thread.join()
+        with self._trueImagePixelsLock:
+            if self._trueImagePixels is None:
+                # background job failed, so compute on the calling thread
+                self._trueImagePixels = _UniquePixelData(self._get_true_image())
+            return self._trueImagePixels
+
+    def _get_true_image(self) -> NDArray:
+        with self._trueImageLock:
+            if self._originalTrueImage is None:
+                if self._spillPath is not None:
+                    self._originalTrueImage = np.load(self._spillPath, mmap_mode='c')
+                else:
+                    self._originalTrueImage = open_image(self.filePath, self.highBitDepth)
+            return self._originalTrueImage
+
+    @staticmethod
+    def _file_signature(filePath):
+        try:
+            fileStatus = os.stat(filePath)
+        except OSError:
+            return None
+        return fileStatus.st_size, fileStatus.st_mtime_ns
+
+    def memory_usage(self) -> dict[str, int]:
+        # bytes held by each part of the model; memory mapped images count as nothing since their pages can be
+        # dropped by the OS at any time
+        trueImagePixels = self._trueImagePixels
+        if trueImagePixels is self._displayImageProcessor._originalPixels:
+            trueImagePixels = None
+        viewportRenderer = self._viewportRenderer
+        trueImage = self._originalTrueImage
+        return {'trueImage': 0 if trueImage is self.originalDisplayImage else _resident_bytes(trueImage),
+                'trueImagePixels': 0 if trueImagePixels is None else sum(trueImagePixels.memory_usage().values()),
+                'display': _resident_bytes(self.originalDisplayImage)+self._displayImageProcessor.memory_usage(),
+                'preview': (_resident_bytes(*self._previewFrames) + (0 if self._previewImageProcessor is None else
+                                                                      self._previewImageProcessor.memory_usage())),
+                'viewport': 0 if viewportRenderer is None else viewportRenderer.memory_usage()}
+
+    def release_memory(self):
+        # drops the full resolution image and everything derived from it, all of which is rebuilt when next needed;
+        # the display and preview images are kept so that the image can still be shown and edited
+        with self._trueImagePixelsLock:
+            thread = self._trueImagePixelsThread
+            if thread is None or not thread.is_alive():
+                if self._trueImagePixels is not self._displayImageProcessor._originalPixels:
+                    self._trueImagePixels = None
+                self._trueImagePixelsThread = None
+        with self._viewportRendererLock:
+            self._viewportRenderer = None
+        self._displayImageProcessor.clear_frame_cache()
+        with self._trueImageLock:
+            image = self._originalTrueImage
+            if image is None or image is self.originalDisplayImage:
+                return
+            if (self._spillPath is None and
+                    (self._sourceModified or self._file_signature(self.filePath) != self._sourceSignature)):
+                fileDescriptor, self._spillPath = tempfile.mkstemp(suffix='.npy', dir=self.spillDirectory)
+                with os.fdopen(fileDescriptor, 'wb') as file:
+                    np.save(file, image)
+            self._originalTrueImage = None
+
+    def close(self):
+        # deletes the spill file, if any; saves still running keep their own reference to the image
+        with self._trueImageLock:
+            self._originalTrueImage = None
+            spillPath = self._spillPath
+            self._spillPath = None
+        if spillPath is not None:
+            try:
+                os.remove(spillPath)
+            except OSError:
+                # still mapped, which Windows doesn't allow deleting
+                pass
+
     def add_existUnsavedChanges_callback(self, func):
         self._existUnsavedChanges.add_callback(func)
+
+    def add_instrumentation_callback(self, func):
+        self.instrumentation.add_callback(func)
+
+
+# argument types each kernel is called with on the 8-bit path used by the display, full resolution saves and
+# streaming exports; other types are still compiled on first use
+_KERNEL_SIGNATURES = (
+    (_jit_box_downscale, ('uint8[:, :, ::1], float32[::1], int64[::1], float32[:, ::1], int64[::1], float32[:, ::1], '
+                          'float32[::1]',)),
+    (_UniquePixelData._jit_reverse, ('uint8[:, ::1], uint16[::1], uint8[:, ::1]',
+                                     'uint8[:, ::1], uint32[::1], uint8[:, ::1]')),
+    (_UniquePixelData._jit_find_unique_rows_counting, ('uint8[:, ::1],', 'uint8[::1, :],')),
+    (_UniquePixelData._jit_map_rows_counting, ('uint8[:, ::1], int32[::1], uint16[::1]',
+                                               'uint8[:, ::1], int32[::1], uint32[::1]',
+                                               'uint8[::1, :], int32[::1], uint16[::1]',
+                                               'uint8[::1, :], int32[::1], uint32[::1]')),
+    (_UniquePixelData._jit_count_unique_rows, ('uint8[:, ::1], int64[::1]', 'uint8[::1, :], int64[::1]')),
+    (_UniquePixelData._jit_find_unique_rows, ('uint8[:, ::1], int64[::1], uint8[:, ::1], uint16[::1], int64[::1]',
+                                              'uint8[:, ::1], int64[::1], uint8[:, ::1], uint32[::1], int64[::1]',
+                                              'uint8[::1, :], int64[::1], uint8[:, ::1], uint16[::1], int64[::1]',
+                                              'uint8[::1, :], int64[::1], uint8[:, ::1], uint32[::1], int64[::1]')),
+    (_RgbModifier._generate_image_histogram, ('uint8[:, ::1], int64[::1]',)),
+    (_LmsModifier._srgb2lms, ('float32[:, ::1], float32[:, ::1]',)),
+    (_LmsModifier._jit_inflection_point_sums, ('float32[:, ::1], int64[::1], float64',)),
+    (_LmsModifier._determine_inflection_point, ('float32[:, ::1], int64[::1], float64',)),
+    (_LmsModifier._bezier_transform, ('float32[:, ::1], float64, float64[::1], float64',)),
+    (_OklabModifier._lms2lmsPrime, ('float32[:, ::1], float32[:, ::1]',)),
+    (_OklabModifier._lmsPrime2lsrgb, ('float32[:, ::1], float32[:, ::1]',)),
+    (_OklabModifier._lsrgb2srgb, ('float32[:, ::1], float32[::1]',)),
+    (_FusedModifier._jit_inflection_point, ('float32[:, ::1], int64[::1], float32[:, ::1], float64',)),
+    (_FusedModifier._jit_fused_pipeline, ('float32[:, ::1], float32[:, ::1], float32[:, ::1], boolean, float64, '
+                                          'float64[::1], float64, boolean, float32[:, ::1], float32[:, ::1], '
+                                          'float32[:, ::1], float32[:, ::1], boolean, float32[::1]',)),
+    (_ScopeCalculator._jit_scopes, ('float32[:, ::1], int64[::1], float32[:, ::1], float32[:, ::1], int64, int64, '
+                                    'float64, int64',)))
+
+
+def compile_kernels():
+    # compiles every kernel for _KERNEL_SIGNATURES, loading it from Numba's on disk cache when possible; kernels
+    # called from other threads meanwhile wait for the compilation in progress instead of starting their own
+    for kernel, signatures in _KERNEL_SIGNATURES:
+        for signature in signatures:
+            kernel.compile(signature)
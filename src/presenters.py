@@ -1,29 +1,48 @@
 import views
 import models
-import threading
-from math import exp, log
-from scipy import special
+import settings as stg
+import startup
+from render_scheduler import RenderScheduler
+from resource_manager import ResourceManager
+from save_queue import SaveQueue
+from math import copysign, exp, log, log2, sqrt
+from statistics import NormalDist
 
 
 class MasterPresenter:
     def __init__(self):
-        # allows numba code to compile before user is displayed GUI
-        models.Model('../assets/tile.png').change_processing_params({models.ParamType.BRIGHTNESS: 1.1})
         self._root = views.Root()
+        # numba code compiles once the GUI is displayed rather than delaying it
+        self._root.after_idle(self._window_shown)
         self._tabPresenters = []
         self._maxDisplayImageSize = None
+        # full resolution images of the tabs used least recently are released once this is exceeded
+        self._resourceManager = ResourceManager(stg.MEMORY_BUDGET)
+        # saves of every tab share one queue, so the number of full resolution exports running at once is bounded
+        self._saveQueue = SaveQueue(self._root.after, stg.MAX_CONCURRENT_SAVES)
         self._root.bind_exit_button(self.exit_button_callback)
+        self._root.bind_tab_changed(self.tab_changed_callback)
         self._root.menuBar.bind_button(self._root.menuBar.ButtonType.OPEN, self.open_button_callback)
         self._root.menuBar.bind_button(self._root.menuBar.ButtonType.SAVE, self.save_button_callback)
         self._root.menuBar.bind_button(self._root.menuBar.ButtonType.SAVE_AS, self.save_as_button_callback)
+        self._root.menuBar.bind_button(self._root.menuBar.ButtonType.CANCEL_SAVE, self.cancel_save_button_callback)
         self._root.menuBar.bind_button(self._root.menuBar.ButtonType.CLOSE, self.close_button_callback)
         self._root.menuBar.bind_button(self._root.menuBar.ButtonType.EXIT, self.exit_button_callback)
+        self._root.menuBar.bind_button(self._root.menuBar.ButtonType.UNDO, self.undo_button_callback)
+        self._root.menuBar.bind_button(self._root.menuBar.ButtonType.REDO, self.redo_button_callback)
         self._root.mainloop()
 
+    @staticmethod
+    def _window_shown():
+        startup.mark('firstWindow')
+        startup.warm_up_in_background(models.compile_kernels)
+
     def open_button_callback(self):
         filePath = views.open_file_dialog()
         if filePath:
-            self._tabPresenters.append(_TabPresenters(filePath, self._root.fileTabs, self._maxDisplayImageSize))
+            self._tabPresenters.append(_TabPresenters(filePath, self._root.fileTabs, self._maxDisplayImageSize,
+                                                      self._resourceManager, self._saveQueue))
+            self._tabPresenters[-1].bind_state_changed(self._update_tab_buttons)
             if self._maxDisplayImageSize is None:
                 self._maxDisplayImageSize = self._tabPresenters[0].maxDisplayImageSize
             self._root.switch_to_tab(len(self._tabPresenters) - 1)
@@ -31,6 +50,36 @@ class MasterPresenter:
             self._root.menuBar.enable_button(self._root.menuBar.ButtonType.SAVE_AS)
             self._root.menuBar.enable_button(self._root.menuBar.ButtonType.CLOSE)
 
+    def tab_changed_callback(self):
+        # also fires while a tab is being added, before its presenter is in the list
+        if self._tabPresenters and self._root.currentTab < len(self._tabPresenters):
+            self._tabPresenters[self._root.currentTab].activate()
+            self._update_tab_buttons()
+            if stg.REPORT_MEMORY_USAGE:
+                self._resourceManager.report()
+
+    def undo_button_callback(self):
+        self._tabPresenters[self._root.currentTab].undo()
+        self._update_tab_buttons()
+
+    def redo_button_callback(self):
+        self._tabPresenters[self._root.currentTab].redo()
+        self._update_tab_buttons()
+
+    def cancel_save_button_callback(self):
+        self._tabPresenters[self._root.currentTab].cancel_saves()
+
+    def _update_tab_buttons(self):
+        # the buttons that depend on the state of the current tab
+        tabPresenter = None
+        if self._tabPresenters and self._root.currentTab < len(self._tabPresenters):
+            tabPresenter = self._tabPresenters[self._root.currentTab]
+        menuBar = self._root.menuBar
+        menuBar.set_button_enabled(menuBar.ButtonType.UNDO, tabPresenter is not None and tabPresenter.canUndo)
+        menuBar.set_button_enabled(menuBar.ButtonType.REDO, tabPresenter is not None and tabPresenter.canRedo)
+        menuBar.set_button_enabled(menuBar.ButtonType.CANCEL_SAVE,
+                                   tabPresenter is not None and tabPresenter.isSaving)
+
     def save_as_button_callback(self):
         self._tabPresenters[self._root.currentTab].save_as_button_callback()
 
@@ -44,8 +93,9 @@ class MasterPresenter:
         if saveChanges is not None:
             if saveChanges:
                 self.save_button_callback()
-            self._tabPresenters.pop(self._root.currentTab)
+            self._tabPresenters.pop(self._root.currentTab).close()
             self._root.close_tab(self._root.currentTab)
+            self._update_tab_buttons()
             if not self._tabPresenters:
                 self._root.menuBar.disable_button(self._root.menuBar.ButtonType.SAVE)
                 self._root.menuBar.disable_button(self._root.menuBar.ButtonType.SAVE_AS)
@@ -59,11 +109,13 @@ class MasterPresenter:
             if len(self._tabPresenters)-1 == tabId:
                 break
         if not self._tabPresenters:
+            # saves still queued finish after the window has closed
+            self._saveQueue.close()
             self._root.destroy()
 
 
 class _TabPresenters:
-    def __init__(self, filePath, tabContainer, maxDisplayImageSize):
+    def __init__(self, filePath, tabContainer, maxDisplayImageSize, resourceManager, saveQueue):
         self._existUnsavedChanges = False
         self.fileName = filePath.split('/')[-1]
         self._tab = views.Tab(tabContainer, tabTitle=self.fileName)
@@ -71,8 +123,25 @@ class _TabPresenters:
             self.maxDisplayImageSize = self._tab.maxImageSize
         else:
             self.maxDisplayImageSize = maxDisplayImageSize
-        self._model = models.Model(filePath, self.maxDisplayImageSize)
+        self._model = models.Model(filePath, self.maxDisplayImageSize, exportLutSize=stg.EXPORT_LUT_SIZE,
+                                   exportMemoryBudget=stg.EXPORT_MEMORY_BUDGET,
+                                   previewScale=stg.PROGRESSIVE_PREVIEW_SCALE,
+                                   downscaleFilter=stg.DOWNSCALE_FILTER, spillDirectory=stg.SPILL_DIRECTORY,
+                                   frameCacheBudget=stg.FRAME_CACHE_BUDGET, historyLength=stg.HISTORY_LENGTH,
+                                   exportOptions=models.ExportOptions(jpegQuality=stg.JPEG_QUALITY,
+                                                                      jpegSubsampling=stg.JPEG_SUBSAMPLING,
+                                                                      pngCompression=stg.PNG_COMPRESSION,
+                                                                      pngStripCount=stg.PNG_STRIP_COUNT))
+        self._stateCommand = lambda: None
+        self._saveQueue = saveQueue
+        # saves of this tab that haven't finished, oldest first
+        self._saveJobs = []
+        self._isClosed = False
         self._tab.add_imageDisplay(self._model.processedDisplayImage)
+        if stg.SHOW_SCOPES:
+            self._tab.adjustmentsPanel.scopesPanel.update_scopes(self._model.scopes())
+        if startup.mark('firstRender') and stg.REPORT_STARTUP_TIMES:
+            startup.report()
         self._tab.adjustmentsPanel.equalizeSliderGroup.bind_callback(self.equalize_slider_callback)
         self._tab.adjustmentsPanel.brightnessSliderGroup.bind_callback(self.brightness_slider_callback)
         self._tab.adjustmentsPanel.contrastSliderGroup.bind_callback(self.contrast_slider_callback)
@@ -82,76 +151,310 @@ class _TabPresenters:
         self._tab.adjustmentsPanel.twoToneHueSliderGroup.bind_callback(self.two_tone_hue_callback)
         self._tab.adjustmentsPanel.twoToneSaturationSliderGroup.bind_callback(self.two_tone_saturation_callback)
         self._tab.adjustmentsPanel.bind_checkbox(self.checkbox_callback)
-        self._model.add_processedImage_callback(self.processed_image_callback)
+        self._renderScheduler = RenderScheduler(self._render,
+                                                self.rendered_callback,
+                                                self._tab.after,
+                                                stg.RENDER_COALESCING_WINDOW,
+                                                stg.RENDER_QUEUE_DEPTH,
+                                                stg.RENDER_POLL_INTERVAL,
+                                                self._refine,
+                                                stg.PROGRESSIVE_REFINE_DELAY,
+                                                self._model.prerender,
+                                                stg.SPECULATION_CPU_BUDGET)
+        # the slider moved last and its mapping to parameters, whose neighbouring values are prerendered when idle
+        self._lastSlider = None
+        # zoomed in, the image display shows a viewport of a pyramid level that is rendered on its own worker
+        self._zoomLevel = None
+        self._viewportOrigin = (0, 0)
+        self._viewportScheduler = RenderScheduler(self._render_viewport,
+                                                  self.viewport_callback,
+                                                  self._tab.after,
+                                                  stg.RENDER_COALESCING_WINDOW,
+                                                  stg.RENDER_QUEUE_DEPTH,
+                                                  stg.RENDER_POLL_INTERVAL)
+        self._tab.imageDisplay.bind_zoom(self.zoom_callback)
+        self._tab.imageDisplay.bind_pan(self.pan_callback)
         self._model.add_existUnsavedChanges_callback(self.unsaved_changes_callback)
+        self._resourceManager = resourceManager
+        self._resourceManager.add(self._model, self.fileName)
 
     @property
     def existUnsavedChanges(self):
         return self._model.existUnsavedChanges
 
+    @property
+    def canUndo(self):
+        return self._model.canUndo
+
+    @property
+    def canRedo(self):
+        return self._model.canRedo
+
+    @property
+    def isSaving(self):
+        return bool(self._saveJobs)
+
+    def bind_state_changed(self, command):
+        # command is called on the Tk thread whenever an undo step may have been added or a save has finished
+        self._stateCommand = command
+
+    def undo(self):
+        self._restore(self._model.undo())
+
+    def redo(self):
+        self._restore(self._model.redo())
+
+    def _restore(self, processingParams):
+        # the sliders are moved without calling their callbacks and the snapshot itself is rendered, so that the
+        # parameters match the snapshot's cached frame exactly
+        if processingParams is None:
+            return
+        panel = self._tab.adjustmentsPanel
+        ParamType = models.ParamType
+        equalize = sqrt(2)*processingParams[ParamType.EQUALIZE]/90
+        panel.equalizeSliderGroup.set_position((2*NormalDist().cdf(equalize)-1)/0.9998817874182897/2+.5)
+        panel.brightnessSliderGroup.set_position(log2(processingParams[ParamType.BRIGHTNESS])/4+.5)
+        panel.contrastSliderGroup.set_position(log2(processingParams[ParamType.CONTRAST])/2+.5)
+        panel.saturationSliderGroup.set_position(log((processingParams[ParamType.SATURATION]+.5)/1.5)/log(9)+.5)
+        panel.warmthSliderGroup.set_position(self._inverse_cubic(processingParams[ParamType.WARMTH])/2+.5)
+        panel.tintSliderGroup.set_position(self._inverse_cubic(processingParams[ParamType.TINT])/2+.5)
+        panel.twoToneHueSliderGroup.set_position(processingParams[ParamType.TWO_TONE_HUE]/180+.5)
+        panel.twoToneSaturationSliderGroup.set_position(
+            log((processingParams[ParamType.TWO_TONE_SATURATION]+.5)/1.5)/log(9)+.5)
+        self._renderScheduler.submit(processingParams)
+
+    @staticmethod
+    def _inverse_cubic(y):
+        # the real x with (x**3+x)/2 = y, by Cardano's formula
+        root = sqrt(y**2+1/27)
+
+        def cube_root(value):
+            return copysign(abs(value)**(1/3), value)
+
+        return cube_root(y+root)+cube_root(y-root)
+
     def equalize_slider_callback(self, event):
-        event = float(event)
-        event = 2*(event-.5)
-        t = 90*special.erfinv(event*0.9998817874182897)
-        self._model.change_processing_params({models.ParamType.EQUALIZE: t})
+        self._slider_moved(self._tab.adjustmentsPanel.equalizeSliderGroup, self._equalize_params, event)
 
     def brightness_slider_callback(self, event):
-        event = float(event)
-        brightness = 2**((event-.5)*4)
-        self._model.change_processing_params({models.ParamType.BRIGHTNESS: brightness})
+        self._slider_moved(self._tab.adjustmentsPanel.brightnessSliderGroup, self._brightness_params, event)
 
     def contrast_slider_callback(self, event):
-        event = float(event)
-        contrast = 2**((event-.5)*2)
-        self._model.change_processing_params({models.ParamType.CONTRAST: contrast})
+        self._slider_moved(self._tab.adjustmentsPanel.contrastSliderGroup, self._contrast_params, event)
 
     def saturation_slider_callback(self, event):
-        event = float(event)
-        saturation = 1.5*exp((event-.5)*log(9))-.5
-        self._model.change_processing_params({models.ParamType.SATURATION: saturation})
+        self._slider_moved(self._tab.adjustmentsPanel.saturationSliderGroup, self._saturation_params, event)
 
     def warmth_slider_callback(self, event):
-        event = float(event)
-        x = (event-.5)*2
-        warmth = (x**3+x)/2
-        self._model.change_processing_params({models.ParamType.WARMTH: warmth})
+        self._slider_moved(self._tab.adjustmentsPanel.warmthSliderGroup, self._warmth_params, event)
 
     def tint_slider_callback(self, event):
-        event = float(event)
-        x = (event-.5)*2
-        tintFactor = (x**3+x)/2
-        self._model.change_processing_params({models.ParamType.TINT: tintFactor})
+        self._slider_moved(self._tab.adjustmentsPanel.tintSliderGroup, self._tint_params, event)
 
     def two_tone_hue_callback(self, event):
-        event = float(event)
-        twoToneHue = (event-.5)*180
-        self._model.change_processing_params({models.ParamType.TWO_TONE_HUE: twoToneHue})
+        self._slider_moved(self._tab.adjustmentsPanel.twoToneHueSliderGroup, self._two_tone_hue_params, event)
 
     def two_tone_saturation_callback(self, event):
-        event = float(event)
-        twoToneSaturation = 1.5*exp((event-.5)*log(9))-.5
-        self._model.change_processing_params({models.ParamType.TWO_TONE_SATURATION: twoToneSaturation})
+        self._slider_moved(self._tab.adjustmentsPanel.twoToneSaturationSliderGroup, self._two_tone_saturation_params,
+                           event)
+
+    def _slider_moved(self, sliderGroup, mapping, event):
+        self._lastSlider = (sliderGroup, mapping)
+        self._renderScheduler.submit(mapping(float(event)))
+
+    @staticmethod
+    def _equalize_params(position):
+        event = 2*(position-.5)
+        # inverse error function, via the standard normal quantile to avoid importing scipy
+        t = 90*NormalDist().inv_cdf((1+event*0.9998817874182897)/2)/sqrt(2)
+        return {models.ParamType.EQUALIZE: t}
+
+    @staticmethod
+    def _brightness_params(position):
+        brightness = 2**((position-.5)*4)
+        return {models.ParamType.BRIGHTNESS: brightness}
+
+    @staticmethod
+    def _contrast_params(position):
+        contrast = 2**((position-.5)*2)
+        return {models.ParamType.CONTRAST: contrast}
+
+    @staticmethod
+    def _saturation_params(position):
+        saturation = 1.5*exp((position-.5)*log(9))-.5
+        return {models.ParamType.SATURATION: saturation}
+
+    @staticmethod
+    def _warmth_params(position):
+        x = (position-.5)*2
+        warmth = (x**3+x)/2
+        return {models.ParamType.WARMTH: warmth}
+
+    @staticmethod
+    def _tint_params(position):
+        x = (position-.5)*2
+        tintFactor = (x**3+x)/2
+        return {models.ParamType.TINT: tintFactor}
+
+    @staticmethod
+    def _two_tone_hue_params(position):
+        twoToneHue = (position-.5)*180
+        return {models.ParamType.TWO_TONE_HUE: twoToneHue}
+
+    @staticmethod
+    def _two_tone_saturation_params(position):
+        twoToneSaturation = 1.5*exp((position-.5)*log(9))-.5
+        return {models.ParamType.TWO_TONE_SATURATION: twoToneSaturation}
+
+    def _update_speculations(self):
+        # prerenders the neighbouring entry box values of the slider moved last, so that nudging it with the mouse
+        # wheel shows the full resolution frame at once
+        if self._lastSlider is not None:
+            sliderGroup, mapping = self._lastSlider
+            self._renderScheduler.set_speculations(
+                [mapping(position) for position in sliderGroup.neighbouring_positions(stg.SPECULATION_DISTANCE)])
 
     def checkbox_callback(self):
+        if self._zoomLevel is not None:
+            self._submit_viewport()
+            return
         if self._tab.adjustmentsPanel.checkboxChecked:
             displayImage = self._model.originalDisplayImage
         else:
             displayImage = self._model.processedDisplayImage
         self._tab.imageDisplay.update_image(displayImage)
 
+    def _render(self, paramDict):
+        # runs on the render scheduler's worker thread; the scopes are counted there too, from the same render
+        displayImage = self._model.render_preview(paramDict)
+        return displayImage, self._model.scopes() if stg.SHOW_SCOPES else None
+
+    def _refine(self):
+        # runs on the render scheduler's worker thread once the sliders are idle, which also completes an undo step
+        self._model.change_processing_params({})
+        self._model.record_history()
+        return self._model.processedDisplayImage, self._model.scopes() if stg.SHOW_SCOPES else None
+
+    def _render_viewport(self, request):
+        # runs on the viewport scheduler's worker thread
+        height, width = self._tab.imageDisplay.viewportShape
+        return self._model.render_viewport(request['level'], request['top'], request['left'], height, width,
+                                           request['original'])
+
+    def activate(self):
+        self._resourceManager.activate(self._model)
+
+    def close(self):
+        self._renderScheduler.close()
+        self._viewportScheduler.close()
+        self._resourceManager.remove(self._model)
+        self._isClosed = True
+        # the spill file may still be needed by the saves of the tab
+        if not self._saveJobs:
+            self._model.close()
+
+    def rendered_callback(self, result):
+        displayImage, scopes = result
+        self.processed_image_callback(displayImage)
+        if scopes is not None:
+            self._tab.adjustmentsPanel.scopesPanel.update_scopes(scopes)
+        self._stateCommand()
+        self._update_speculations()
+
     def processed_image_callback(self, displayImage):
-        if not self._tab.adjustmentsPanel.checkboxChecked:
+        if self._zoomLevel is not None:
+            # the parameters changed, so the viewport is rendered again with them
+            self._submit_viewport()
+        elif not self._tab.adjustmentsPanel.checkboxChecked:
             self._tab.imageDisplay.update_image(displayImage)
 
+    def viewport_callback(self, viewportImage):
+        if self._zoomLevel is not None:
+            self._tab.imageDisplay.update_image(viewportImage)
+
+    def zoom_callback(self, steps, x, y):
+        # zooms by whole pyramid levels, keeping the point under the pointer in place; zooming out of the smallest
+        # level returns to the fitted view
+        displayHeight, displayWidth = self._tab.imageDisplay.viewportShape
+        if self._zoomLevel is None:
+            trueHeight, trueWidth = self._model.zoom_level_shape(0)
+            pointY, pointX = y*trueHeight/displayHeight, x*trueWidth/displayWidth
+            level = self._model.zoomLevelCount
+        else:
+            scale = 2**self._zoomLevel
+            pointY, pointX = (self._viewportOrigin[0]+y)*scale, (self._viewportOrigin[1]+x)*scale
+            level = self._zoomLevel
+        level = min(max(level-steps, 0), self._model.zoomLevelCount)
+        if level == self._zoomLevel:
+            return
+        if level == self._model.zoomLevelCount:
+            self._zoomLevel = None
+            self.checkbox_callback()
+            return
+        self._zoomLevel = level
+        self._set_viewport_origin(pointY/2**level-y, pointX/2**level-x)
+
+    def pan_callback(self, dx, dy):
+        if self._zoomLevel is not None:
+            self._set_viewport_origin(self._viewportOrigin[0]-dy, self._viewportOrigin[1]-dx)
+
+    def _set_viewport_origin(self, top, left):
+        displayHeight, displayWidth = self._tab.imageDisplay.viewportShape
+        levelHeight, levelWidth = self._model.zoom_level_shape(self._zoomLevel)
+        top = round(min(max(top, 0), max(levelHeight-displayHeight, 0)))
+        left = round(min(max(left, 0), max(levelWidth-displayWidth, 0)))
+        self._viewportOrigin = (top, left)
+        self._submit_viewport()
+
+    def _submit_viewport(self):
+        self._viewportScheduler.submit({'level': self._zoomLevel,
+                                        'top': self._viewportOrigin[0],
+                                        'left': self._viewportOrigin[1],
+                                        'original': self._tab.adjustmentsPanel.checkboxChecked})
+
     def unsaved_changes_callback(self, existUnsavedChanges):
         self._tab.update_tab_title_to_save_state(existUnsavedChanges)
 
     def save_as_button_callback(self):
         filePath = views.save_file_dialog(self._model.filePath.split('/')[-1])
         if filePath:
-            thread = threading.Thread(target=self._model.save_image, args=(filePath,))
-            thread.start()
+            self._save(filePath)
 
     def save_button_callback(self):
-        thread = threading.Thread(target=self._model.save_image, args=(self._model.filePath,))
-        thread.start()
+        self._save(self._model.filePath)
+
+    def cancel_saves(self):
+        for job in list(self._saveJobs):
+            job.cancel()
+
+    def _save(self, filePath):
+        # the parameters are taken now, so edits made while the save is queued or running aren't saved
+        processingParams = self._model.processingParams
+
+        def save(progress, isCancelled):
+            return self._model.save_image(filePath, processingParams, progress, isCancelled)
+
+        job = self._saveQueue.submit(filePath, processingParams, save, self.save_progress_callback,
+                                     self.save_done_callback)
+        if job not in self._saveJobs:
+            self._saveJobs.append(job)
+        self._stateCommand()
+
+    def save_progress_callback(self, job):
+        if job.status == 'running':
+            self._tab.update_save_progress(job.progress)
+
+    def save_done_callback(self, job):
+        if job in self._saveJobs:
+            self._saveJobs.remove(job)
+        if job.status == 'failed':
+            views.save_failed_dialog(job.target.split('/')[-1], job.error)
+        if self._isClosed:
+            if not self._saveJobs:
+                self._model.close()
+            return
+        if job.status == 'saved':
+            self._model.mark_saved(job.key)
+        runningJobs = [saveJob for saveJob in self._saveJobs if saveJob.status == 'running']
+        self._tab.update_save_progress(runningJobs[0].progress if runningJobs else None)
+        self._stateCommand()
@@ -0,0 +1,150 @@
+import threading
+import collections
+import time
+import traceback
+
+
+class RenderScheduler:
+    # Runs renders on a worker thread and hands finished frames back on the Tk thread. render is called on the
+    # worker with a dict of parameter updates and returns a frame, deliver is called on the Tk thread with that
+    # frame, and callLater is a Tk style after(ms, func) used to poll for finished frames. If refine is given it is
+    # called on the worker once no new request has arrived for refineDelay seconds after a render, and its frame is
+    # delivered the same way; this is used to replace a coarse preview with the full resolution frame.
+    # If speculate is given, it is called on the worker with each dict passed to set_speculations once there is
+    # nothing else to do, together with a function returning True once a render is waiting, at which point it should
+    # return as soon as it can; nothing is delivered. speculationCpuBudget is the fraction of the worker's time that
+    # speculation may take, with 0 disabling it.
+    def __init__(self, render, deliver, callLater, coalescingWindow=.01, queueDepth=1, pollInterval=5,
+                 refine=None, refineDelay=.15, speculate=None, speculationCpuBudget=.5):
+        self._render = render
+        self._deliver = deliver
+        self._callLater = callLater
+        self.coalescingWindow = coalescingWindow
+        self.queueDepth = max(queueDepth, 1)
+        self._pollInterval = pollInterval
+        self._refine = refine
+        self.refineDelay = refineDelay
+        self._refineDueTime = None
+        self._speculate = speculate
+        self.speculationCpuBudget = speculationCpuBudget
+        self._speculations = collections.deque()
+        self._speculationResumeTime = 0.
+        self._condition = threading.Condition()
+        self._pending = collections.deque()
+        self._firstPendingTime = 0.
+        self._isRendering = False
+        self._finishedFrame = None
+        self._isPolling = False
+        self._isClosed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    @property
+    def isIdle(self):
+        with self._condition:
+            return (not self._pending and not self._isRendering and self._finishedFrame is None and
+                    self._refineDueTime is None)
+
+    def submit(self, paramDict):
+        with self._condition:
+            if not self._pending:
+                self._firstPendingTime = time.perf_counter()
+            self._pending.append(dict(paramDict))
+            # speculation was about the state this request changes
+            self._speculations.clear()
+            while len(self._pending) > self.queueDepth:
+                # drop the stale request but keep any parameters the newer one doesn't override
+                staleParams = self._pending.popleft()
+                staleParams.update(self._pending[0])
+                self._pending[0] = staleParams
+            self._condition.notify()
+        if not self._isPolling:
+            self._isPolling = True
+            self._callLater(self._pollInterval, self._poll)
+
+    def set_speculations(self, paramDicts):
+        # replaces the speculations still to run, most useful first
+        with self._condition:
+            self._speculations.clear()
+            if self._speculate is not None and self.speculationCpuBudget > 0:
+                self._speculations.extend(dict(paramDict) for paramDict in paramDicts)
+                self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._isClosed = True
+            self._pending.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._isClosed:
+                    if self._refineDueTime is not None:
+                        remainingDelay = self._refineDueTime-time.perf_counter()
+                    elif self._speculations:
+                        remainingDelay = self._speculationResumeTime-time.perf_counter()
+                    else:
+                        self._condition.wait()
+                        continue
+                    if remainingDelay <= 0:
+                        break
+                    self._condition.wait(remainingDelay)
+                if self._isClosed:
+                    return
+                if self._pending:
+                    remainingWindow = self._firstPendingTime+self.coalescingWindow-time.perf_counter()
+                    while remainingWindow > 0 and not self._isClosed:
+                        self._condition.wait(remainingWindow)
+                        remainingWindow = self._firstPendingTime+self.coalescingWindow-time.perf_counter()
+                    if self._isClosed:
+                        return
+                    paramDict = self._pending.popleft()
+                    self._firstPendingTime = time.perf_counter()
+                    job = lambda: self._render(paramDict)
+                    jobType = 'render'
+                elif self._refineDueTime is not None:
+                    job = self._refine
+                    jobType = 'refine'
+                else:
+                    speculation = self._speculations.popleft()
+                    job = lambda: self._speculate(speculation, self._has_pending)
+                    jobType = 'speculation'
+                self._refineDueTime = None
+                # speculation is invisible to the Tk thread
+                self._isRendering = jobType != 'speculation'
+            startTime = time.perf_counter()
+            frame = None
+            try:
+                frame = job()
+            except Exception:
+                # a failed job only loses its own frame; the worker carries on with the next request
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._isRendering = False
+                    if jobType == 'speculation':
+                        # idles long enough after each speculation to stay within the CPU budget
+                        elapsedTime = time.perf_counter()-startTime
+                        self._speculationResumeTime = (time.perf_counter() +
+                                                       elapsedTime*(1/self.speculationCpuBudget-1))
+                    else:
+                        if frame is not None:
+                            self._finishedFrame = frame
+                        if self._refine is not None and jobType == 'render':
+                            self._refineDueTime = time.perf_counter()+self.refineDelay
+
+    def _has_pending(self):
+        return bool(self._pending) or self._isClosed
+
+    def _poll(self):
+        with self._condition:
+            frame = self._finishedFrame
+            self._finishedFrame = None
+            isBusy = bool(self._pending) or self._isRendering or self._refineDueTime is not None
+        if frame is not None and not self._isClosed:
+            self._deliver(frame)
+        if isBusy and not self._isClosed:
+            self._callLater(self._pollInterval, self._poll)
+        else:
+            self._isPolling = False
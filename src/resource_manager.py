@@ -0,0 +1,58 @@
+import collections
+import sys
+import threading
+
+
+class ResourceManager:
+    # Keeps the memory held by the open models within budget bytes by releasing the models used least recently.
+    # Models need memory_usage(), returning the bytes held by each of their parts, and release_memory(), dropping
+    # whatever can be rebuilt when it is next needed. The active model, the one activated last, is never released,
+    # and a budget of None only tracks usage.
+    def __init__(self, budget=None):
+        self.budget = budget
+        # least recently activated first
+        self._models = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, model, name):
+        # a model is added as the active one since it is usually shown straight away
+        with self._lock:
+            self._models[model] = name
+        self.enforce()
+
+    def remove(self, model):
+        with self._lock:
+            self._models.pop(model, None)
+
+    def activate(self, model):
+        with self._lock:
+            if model in self._models:
+                self._models.move_to_end(model)
+        self.enforce()
+
+    def usage(self):
+        # memory_usage of every model by name, least recently activated first
+        with self._lock:
+            models = list(self._models.items())
+        return {name: model.memory_usage() for model, name in models}
+
+    def total(self):
+        return sum(sum(modelUsage.values()) for modelUsage in self.usage().values())
+
+    def enforce(self):
+        if self.budget is None:
+            return
+        with self._lock:
+            inactiveModels = list(self._models)[:-1]
+        total = self.total()
+        for model in inactiveModels:
+            if total <= self.budget:
+                break
+            usageBefore = sum(model.memory_usage().values())
+            model.release_memory()
+            total -= usageBefore-sum(model.memory_usage().values())
+
+    def report(self, file=sys.stderr):
+        for name, modelUsage in self.usage().items():
+            parts = ', '.join('{} {:.1f}'.format(part, size/2**20) for part, size in modelUsage.items())
+            print('{}: {:.1f} MB ({})'.format(name, sum(modelUsage.values())/2**20, parts), file=file)
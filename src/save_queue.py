@@ -0,0 +1,155 @@
+import collections
+import os
+import threading
+import traceback
+
+
+class SaveJob:
+    # A save submitted to a SaveQueue. status is one of 'queued', 'running', 'saved', 'cancelled' and 'failed', and
+    # progress the fraction of the save done. Only cancel is meant to be called by users of the queue.
+    def __init__(self, target, key, save, progressCallback, doneCallback):
+        self.target = target
+        self.key = key
+        self.status = 'queued'
+        self.progress = 0.
+        self.error = None
+        self._save = save
+        self._progressCallback = progressCallback
+        self._doneCallback = doneCallback
+        self._cancelRequested = False
+        self._queue = None
+
+    @property
+    def isFinished(self):
+        return self.status in ('saved', 'cancelled', 'failed')
+
+    def cancel(self):
+        if self._queue is not None:
+            self._queue.cancel(self)
+
+
+class SaveQueue:
+    # Runs saves on at most maxConcurrentSaves worker threads, so that the memory taken by full resolution exports
+    # stays predictable, and reports on the Tk thread. save is called on a worker with a progress function, taking
+    # the fraction done, and an isCancelled function, and returns whether it saved; progressCallback and
+    # doneCallback are called on the Tk thread with the job, polled for through callLater, a Tk style
+    # after(ms, func). Saves to the same target never run at the same time and a save submitted while another to the
+    # same target is still queued replaces it, taking over its place in the queue; one whose key matches the save
+    # already running for the target is dropped as redundant. close lets the queued saves finish, the workers not
+    # being daemon threads so that the process waits for them.
+    def __init__(self, callLater, maxConcurrentSaves=1, pollInterval=50):
+        self._callLater = callLater
+        self._pollInterval = pollInterval
+        self._condition = threading.Condition()
+        self._queued = collections.deque()
+        self._running = {}
+        # jobs whose progress or status changed since the last poll
+        self._changedJobs = {}
+        self._isPolling = False
+        self._isClosed = False
+        self._workers = [threading.Thread(target=self._run) for _ in range(max(maxConcurrentSaves, 1))]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, target, key, save, progressCallback=None, doneCallback=None):
+        # target identifies the file written, key the content, e.g. the parameters, for spotting redundant saves;
+        # returns the job that will do the save, which may be one submitted earlier
+        target = os.path.abspath(target)
+        with self._condition:
+            runningJob = self._running.get(target)
+            if runningJob is not None and runningJob.key == key and not runningJob._cancelRequested:
+                return runningJob
+            job = SaveJob(target, key, save, progressCallback, doneCallback)
+            job._queue = self
+            for i, queuedJob in enumerate(self._queued):
+                if queuedJob.target == target:
+                    self._queued[i] = job
+                    queuedJob.status = 'cancelled'
+                    self._changedJobs[id(queuedJob)] = queuedJob
+                    break
+            else:
+                self._queued.append(job)
+            self._changedJobs[id(job)] = job
+            self._condition.notify_all()
+        self._start_polling()
+        return job
+
+    def cancel(self, job):
+        with self._condition:
+            if job.status == 'queued':
+                self._queued.remove(job)
+                job.status = 'cancelled'
+                self._changedJobs[id(job)] = job
+            elif job.status == 'running':
+                job._cancelRequested = True
+        self._start_polling()
+
+    def jobs(self):
+        # the jobs that haven't finished, running ones first
+        with self._condition:
+            return list(self._running.values())+list(self._queued)
+
+    def close(self):
+        with self._condition:
+            self._isClosed = True
+            self._condition.notify_all()
+
+    def _next_job(self):
+        # the first queued job whose target isn't being saved already
+        for job in self._queued:
+            if job.target not in self._running:
+                return job
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    if self._isClosed and not self._queued:
+                        return
+                    self._condition.wait()
+                    job = self._next_job()
+                self._queued.remove(job)
+                self._running[job.target] = job
+                job.status = 'running'
+                self._changedJobs[id(job)] = job
+            status = 'failed'
+            try:
+                saved = job._save(lambda fraction: self._set_progress(job, fraction), lambda: job._cancelRequested)
+                status = 'saved' if saved else 'cancelled'
+            except Exception as exception:
+                traceback.print_exc()
+                job.error = exception
+            finally:
+                with self._condition:
+                    del self._running[job.target]
+                    job.status = status
+                    self._changedJobs[id(job)] = job
+                    self._condition.notify_all()
+
+    def _set_progress(self, job, fraction):
+        with self._condition:
+            job.progress = fraction
+            self._changedJobs[id(job)] = job
+
+    def _start_polling(self):
+        if not self._isPolling:
+            self._isPolling = True
+            self._callLater(self._pollInterval, self._poll)
+
+    def _poll(self):
+        with self._condition:
+            changedJobs = list(self._changedJobs.values())
+            self._changedJobs.clear()
+            isBusy = bool(self._queued) or bool(self._running)
+        for job in changedJobs:
+            if job.isFinished:
+                if job._doneCallback is not None:
+                    job._doneCallback(job)
+            elif job._progressCallback is not None:
+                job._progressCallback(job)
+        if isBusy and not self._isClosed:
+            self._callLater(self._pollInterval, self._poll)
+        else:
+            self._isPolling = False
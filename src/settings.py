@@ -0,0 +1,67 @@
+# Render scheduling. Slider updates that arrive within the coalescing window (in seconds) of the first pending
+# update are merged into a single render. The queue depth is how many pending renders are kept; once it is
+# exceeded the oldest pending update is merged into the next one, so the latest values always win.
+RENDER_COALESCING_WINDOW = .01
+RENDER_QUEUE_DEPTH = 1
+RENDER_POLL_INTERVAL = 5  # milliseconds between checks for a finished frame on the Tk thread
+
+# Progressive rendering. While a slider is moving, a proxy scaled by this factor per side is rendered and shown
+# first; the full display resolution image is rendered once no update has arrived for the refine delay (seconds).
+# Set the scale to None to always render at full display resolution.
+PROGRESSIVE_PREVIEW_SCALE = .25
+PROGRESSIVE_REFINE_DELAY = .15
+
+# Downscaling of the display image, its preview proxy and the zoom levels. 'box' averages in linear light, which
+# avoids aliasing and darkened fine detail; 'area' averages the encoded values and 'cubic' interpolates without
+# anti-aliasing, both of which are faster.
+DOWNSCALE_FILTER = 'box'
+
+# Scopes. With SHOW_SCOPES, a histogram and a vectorscope of the rendered image are shown above the sliders and
+# updated with every render, counted from the unique colours of the render on the render worker.
+SHOW_SCOPES = True
+
+# Undo history. Up to HISTORY_LENGTH parameter snapshots are kept per tab, one for each adjustment once the sliders
+# come to rest. The display frames of recent parameters are cached within FRAME_CACHE_BUDGET bytes per tab, so undo,
+# redo and returning to recent parameters show them without running the pipeline again.
+HISTORY_LENGTH = 100
+FRAME_CACHE_BUDGET = 64*2**20
+
+# Speculative rendering. Once rendering is idle, the display frames for the values up to SPECULATION_DISTANCE steps
+# either side of the slider moved last are rendered into the frame cache, so that nudging it shows them at once.
+# Speculation stops as soon as a real update arrives and takes at most SPECULATION_CPU_BUDGET of the render
+# worker's time; 0 disables it.
+SPECULATION_DISTANCE = 2
+SPECULATION_CPU_BUDGET = .5
+
+# Saving. Saves run in the background, at most MAX_CONCURRENT_SAVES at a time across all tabs since each holds a
+# processed copy of the full resolution image. Saving again to a file whose save hasn't started yet replaces it.
+MAX_CONCURRENT_SAVES = 1
+
+# Encoding. None leaves a setting to OpenCV's default. JPEG_SUBSAMPLING is one of '444', '422', '420', '411' and
+# '440', PNG_COMPRESSION goes from 0 (fastest) to 9 (smallest), and PNG_STRIP_COUNT > 1 encodes PNGs in that many
+# strips in parallel, 0 meaning one per CPU, with a simpler filter that is several times faster than OpenCV's.
+JPEG_QUALITY = None
+JPEG_SUBSAMPLING = None
+PNG_COMPRESSION = None
+PNG_STRIP_COUNT = 0
+
+# Exporting. With EXPORT_MEMORY_BUDGET (in bytes), the full resolution image is processed in strips within that much
+# working memory rather than whole; the image itself stays in memory either way. With EXPORT_LUT_SIZE, 8-bit images
+# are exported through a 3D LUT of that many nodes per axis, which is faster but approximate. None disables either.
+EXPORT_MEMORY_BUDGET = None
+EXPORT_LUT_SIZE = None
+
+# Memory. Once the open tabs hold more than the budget (in bytes), the full resolution images and decompositions of
+# the tabs used least recently are released and reloaded when next needed, from the source file if it is unchanged
+# or else from a memory mapped spill file in SPILL_DIRECTORY (the system's temporary directory when None). None
+# disables the budget. With REPORT_MEMORY_USAGE, the memory held by each tab is printed to stderr on every tab change.
+MEMORY_BUDGET = 2*2**30
+SPILL_DIRECTORY = None
+REPORT_MEMORY_USAGE = False
+
+# Startup. Compiled Numba kernels are cached in this directory, which defaults to ~/.cache/image_editor/numba when
+# None; the cache is cleared whenever models.py, Python, Numba, NumPy or the CPU architecture changes. The kernels
+# are compiled (or loaded from the cache) in the background once the window is shown. With REPORT_STARTUP_TIMES, the
+# times to the first window, the compiled kernels and the first render are printed to stderr.
+JIT_CACHE_DIR = None
+REPORT_STARTUP_TIMES = False
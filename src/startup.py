@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+# seconds since launch of each startup milestone, measured from when this module is first imported
+_launchTime = time.perf_counter()
+_milestones = {}
+_milestonesLock = threading.Lock()
+_STAMP_FILE_NAME = 'cache_stamp.json'
+
+
+def default_cache_dir():
+    cacheHome = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cacheHome, 'image_editor', 'numba')
+
+
+def cache_stamp():
+    # cached kernels are only valid for the models source, toolchain and CPU they were compiled with; versions are
+    # read from the package metadata so that neither numba nor numpy is imported here
+    import importlib.metadata
+    modelsPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models.py')
+    with open(modelsPath, 'rb') as file:
+        modelsHash = hashlib.sha256(file.read()).hexdigest()
+    return {'models': modelsHash,
+            'python': sys.version,
+            'numba': importlib.metadata.version('numba'),
+            'numpy': importlib.metadata.version('numpy'),
+            'cpu': platform.machine()}
+
+
+def validate_cache_dir(cacheDir):
+    # clears cacheDir if it was written for a different cache_stamp and checks that it can be written, raising
+    # OSError otherwise
+    os.makedirs(cacheDir, exist_ok=True)
+    stampPath = os.path.join(cacheDir, _STAMP_FILE_NAME)
+    stamp = cache_stamp()
+    try:
+        with open(stampPath) as file:
+            isValid = json.load(file) == stamp
+    except (OSError, ValueError):
+        isValid = False
+    if not isValid:
+        # only Numba's index and data files are removed in case cacheDir is shared with anything else
+        for directory, _, fileNames in os.walk(cacheDir):
+            for fileName in fileNames:
+                if fileName.endswith(('.nbi', '.nbc')):
+                    os.remove(os.path.join(directory, fileName))
+    # rewriting the stamp doubles as the write check
+    temporaryPath = stampPath+'.tmp'
+    with open(temporaryPath, 'w') as file:
+        json.dump(stamp, file)
+    os.replace(temporaryPath, stampPath)
+
+
+def configure_jit_cache(cacheDir=None):
+    # must be called before the first kernel is compiled since Numba reads the cache location when it creates a
+    # kernel's dispatcher; falls back to a temporary directory if cacheDir can't be used and returns the directory in
+    # use, or None if kernels will be compiled on every launch
+    for candidate in (cacheDir or default_cache_dir(), os.path.join(tempfile.gettempdir(), 'image_editor_numba')):
+        try:
+            validate_cache_dir(candidate)
+        except OSError:
+            continue
+        os.environ['NUMBA_CACHE_DIR'] = candidate
+        if 'numba' in sys.modules:
+            sys.modules['numba'].config.CACHE_DIR = candidate
+        return candidate
+    return None
+
+
+def mark(milestone):
+    # records the first time milestone is reached, returning whether this call recorded it
+    with _milestonesLock:
+        if milestone in _milestones:
+            return False
+        _milestones[milestone] = time.perf_counter()-_launchTime
+        return True
+
+
+def milestones():
+    with _milestonesLock:
+        return dict(_milestones)
+
+
+def report(file=sys.stderr):
+    for milestone, seconds in sorted(milestones().items(), key=lambda item: item[1]):
+        print('{}: {:.3f}s'.format(milestone, seconds), file=file)
+
+
+def warm_up_in_background(compileKernels):
+    # compiles the kernels while the window is already responsive; images opened meanwhile still render, their
+    # first render just waits for the kernels it needs
+    def warm_up():
+        compileKernels()
+        mark('kernelsCompiled')
+
+    thread = threading.Thread(target=warm_up, daemon=True)
+    thread.start()
+    return thread
@@ -1,9 +1,9 @@
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageTk
 from tkinter import filedialog
 from tkinter import messagebox
 import enum
+import numpy as np
 import linkable_widgets as lw
 import styling as stl
 
@@ -25,6 +25,10 @@ def unsaved_changes_dialog(fileName):
     return response
 
 
+def save_failed_dialog(fileName, error):
+    messagebox.showerror('', 'Couldn\'t save {}: {}'.format(fileName, error))
+
+
 class Root(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -57,6 +61,9 @@ class Root(tk.Tk):
     def bind_exit_button(self, command):
         self.protocol("WM_DELETE_WINDOW", command)
 
+    def bind_tab_changed(self, command):
+        self.fileTabs.bind('<<NotebookTabChanged>>', lambda event: command())
+
     def _on_mouse_wheel(self, event):
         widgetWithFocus = self.focus_get()
         widgetWithFocus.event_generate('<<VirtualMouseWheel>>', state=event.delta)
@@ -65,49 +72,70 @@ class Root(tk.Tk):
 class _MenuBar(tk.Menu):
     def __init__(self, container):
         super().__init__(container)
-        self._fileMenu = tk.Menu(self, tearoff=False)
-        self._add_fileMenu_buttons()
-        self.add_cascade(label='File', menu=self._fileMenu)
+        self._menus = {}
+        for typeOfButton in self.ButtonType:
+            menuLabel = typeOfButton.value[2]
+            if menuLabel not in self._menus:
+                self._menus[menuLabel] = tk.Menu(self, tearoff=False)
+                self.add_cascade(label=menuLabel, menu=self._menus[menuLabel])
+            self._add_menu_button(typeOfButton)
         self.disable_button(self.ButtonType.SAVE)
         self.disable_button(self.ButtonType.SAVE_AS)
+        self.disable_button(self.ButtonType.CANCEL_SAVE)
         self.disable_button(self.ButtonType.CLOSE)
+        self.disable_button(self.ButtonType.UNDO)
+        self.disable_button(self.ButtonType.REDO)
         for typeOfButton in self.ButtonType:
             self._key_bind(typeOfButton.value[1], typeOfButton)
 
     def disable_button(self, typeOfButton):
-        self._fileMenu.entryconfigure(self._return_button_type_index(typeOfButton), state=tk.DISABLED)
+        self._menu(typeOfButton).entryconfigure(self._return_button_type_index(typeOfButton), state=tk.DISABLED)
 
     def enable_button(self, typeOfButton):
-        self._fileMenu.entryconfigure(self._return_button_type_index(typeOfButton), state=tk.NORMAL)
+        self._menu(typeOfButton).entryconfigure(self._return_button_type_index(typeOfButton), state=tk.NORMAL)
+
+    def set_button_enabled(self, typeOfButton, enabled):
+        if enabled:
+            self.enable_button(typeOfButton)
+        else:
+            self.disable_button(typeOfButton)
 
     def bind_button(self, typeOfButton, command):
-        self._fileMenu.entryconfigure(self._return_button_type_index(typeOfButton), command=command)
+        self._menu(typeOfButton).entryconfigure(self._return_button_type_index(typeOfButton), command=command)
+
+    def _menu(self, typeOfButton):
+        return self._menus[typeOfButton.value[2]]
 
     def _return_button_type_index(self, typeOfButton):
-        return list(self.ButtonType).index(typeOfButton)
+        # index within the button's own menu
+        return [button for button in self.ButtonType if button.value[2] == typeOfButton.value[2]].index(typeOfButton)
 
-    def _add_fileMenu_buttons(self):
-        for typeOfButton in self.ButtonType:
-            shortCut = typeOfButton.value[1]
-            shortCut = shortCut.replace('Control', 'Ctrl')
-            shortCut = shortCut.replace('-', '+')
-            shortCut = shortCut[:-1]+shortCut[-1].upper()
-            label = typeOfButton.value[0]+' '*5+shortCut
-            self._fileMenu.add_command(label=label)
+    def _add_menu_button(self, typeOfButton):
+        shortCut = typeOfButton.value[1]
+        shortCut = shortCut.replace('Control', 'Ctrl')
+        shortCut = shortCut.replace('-', '+')
+        shortCut = shortCut[:-1]+shortCut[-1].upper()
+        label = typeOfButton.value[0]+' '*5+shortCut
+        self._menu(typeOfButton).add_command(label=label)
 
     def _key_bind(self, keySequence, typeOfButton):
         keySequenceList = [keySequence, keySequence[:-1]+keySequence[-1].swapcase()]
+        menu = self._menu(typeOfButton)
         buttonIndex = self._return_button_type_index(typeOfButton)
         for sequence in keySequenceList:
-            self.master.bind('<{}>'.format(sequence), lambda event: self._fileMenu.invoke(buttonIndex))
+            self.master.bind('<{}>'.format(sequence), lambda event: menu.invoke(buttonIndex))
 
     class ButtonType(enum.Enum):
-        # first element in tuple is label that appears in file menu, second element is key sequence used for shortcut
-        OPEN = ('Open...', 'Control-o')
-        SAVE = ('Save', 'Control-s')
-        SAVE_AS = ('Save As...', 'Control-Shift-s')
-        CLOSE = ('Close', 'Control-w')
-        EXIT = ('Exit', 'Control-q')
+        # first element in tuple is label that appears in the menu, second element is key sequence used for shortcut,
+        # third element is the menu the button appears in
+        OPEN = ('Open...', 'Control-o', 'File')
+        SAVE = ('Save', 'Control-s', 'File')
+        SAVE_AS = ('Save As...', 'Control-Shift-s', 'File')
+        CANCEL_SAVE = ('Cancel Saving', 'Control-Shift-c', 'File')
+        CLOSE = ('Close', 'Control-w', 'File')
+        EXIT = ('Exit', 'Control-q', 'File')
+        UNDO = ('Undo', 'Control-z', 'Edit')
+        REDO = ('Redo', 'Control-y', 'Edit')
 
 
 class Tab(stl.FrameAutoStyle):
@@ -131,6 +159,8 @@ class Tab(stl.FrameAutoStyle):
         self.adjustmentsPanel = _AdjustmentsPanel(self)
         self.adjustmentsPanel.pack(side=tk.RIGHT, fill=tk.Y)
         self._tabTitle = tabTitle
+        self._existUnsavedChanges = False
+        self._saveProgress = None
         container.add(self, text=tabTitle)
         self.maxImageSize = determine_max_image_size()  # only accurate if tab is selected when called
 
@@ -140,17 +170,33 @@ class Tab(stl.FrameAutoStyle):
             self.imageDisplay.pack(side=tk.LEFT, expand=True)
 
     def update_tab_title_to_save_state(self, existUnsavedChanges):
-        if existUnsavedChanges:
+        self._existUnsavedChanges = existUnsavedChanges
+        self._update_tab_title()
+
+    def update_save_progress(self, saveProgress):
+        # saveProgress is the fraction of the current save done, or None when nothing is being saved
+        self._saveProgress = saveProgress
+        self._update_tab_title()
+
+    def _update_tab_title(self):
+        if self._existUnsavedChanges:
             tabTitle = self._tabTitle + '*'
         else:
             tabTitle = self._tabTitle
+        if self._saveProgress is not None:
+            tabTitle += ' (saving {:.0%})'.format(self._saveProgress)
         self.master.tab(self, text=tabTitle)
 
 
 class _ImageDisplay(stl.FrameAutoStyle):
     def __init__(self, container, displayImage):
+        # PIL is imported once an image is shown rather than when the window is built
+        from PIL import Image, ImageTk
         super().__init__(container)
-        self._displayImage = ImageTk.PhotoImage(image=Image.fromarray(displayImage))
+        # frames are copied into this one image and pasted from it, rather than wrapping each in a new image
+        self._frame = Image.new('RGB', (displayImage.shape[1], displayImage.shape[0]))
+        self._frame.frombytes(np.ascontiguousarray(displayImage))
+        self._displayImage = ImageTk.PhotoImage(image=self._frame)
         self._canvas = tk.Canvas(self,
                                  height=displayImage.shape[0],
                                  width=displayImage.shape[1],
@@ -158,9 +204,48 @@ class _ImageDisplay(stl.FrameAutoStyle):
                                  highlightthickness=0)
         self._canvas.create_image(0, 0, anchor='nw', image=self._displayImage)
         self._canvas.pack()
+        self._zoomCommand = None
+        self._panCommand = None
+        self._dragPosition = None
+        self._canvas.bind('<<VirtualMouseWheel>>', self._on_mouse_wheel)
+        self._canvas.bind('<ButtonPress-1>', self._on_press)
+        self._canvas.bind('<B1-Motion>', self._on_drag)
+
+    @property
+    def viewportShape(self):
+        return self._frame.height, self._frame.width
 
     def update_image(self, displayImage):
-        self._displayImage.paste(Image.fromarray(displayImage))
+        self._frame.frombytes(np.ascontiguousarray(displayImage))
+        self._displayImage.paste(self._frame)
+
+    def bind_zoom(self, command):
+        # command is called with +1 to zoom in or -1 to zoom out and the canvas coordinates of the pointer
+        self._zoomCommand = command
+
+    def bind_pan(self, command):
+        # command is called with how far the image was dragged, in canvas pixels
+        self._panCommand = command
+
+    def _on_mouse_wheel(self, event):
+        if self._zoomCommand is not None:
+            if event.delta == 0:
+                delta = event.state
+            else:
+                delta = event.delta
+            x = self._canvas.winfo_pointerx()-self._canvas.winfo_rootx()
+            y = self._canvas.winfo_pointery()-self._canvas.winfo_rooty()
+            self._zoomCommand(1 if delta > 0 else -1, x, y)
+
+    def _on_press(self, event):
+        self._dragPosition = (event.x, event.y)
+
+    def _on_drag(self, event):
+        if self._panCommand is not None and self._dragPosition is not None:
+            dx = event.x-self._dragPosition[0]
+            dy = event.y-self._dragPosition[1]
+            self._dragPosition = (event.x, event.y)
+            self._panCommand(dx, dy)
 
 
 class _AdjustmentsPanel(stl.FrameAutoStyle):
@@ -171,6 +256,7 @@ class _AdjustmentsPanel(stl.FrameAutoStyle):
                               foreground=stl.FONT_COLOR_1,
                               font=stl.FONT_1)
         self._frame = stl.FrameAutoStyle(self)
+        self.scopesPanel = _ScopesPanel(self._frame)
         self.equalizeSliderGroup = _SliderGroup(self._frame, title='Equalize')
         self.brightnessSliderGroup = _SliderGroup(self._frame, title='Brightness')
         self.contrastSliderGroup = _SliderGroup(self._frame, title='Contrast')
@@ -187,6 +273,7 @@ class _AdjustmentsPanel(stl.FrameAutoStyle):
         self._style.configure_font_size(self.beforeAfterCheckbox.cget('style'), fontSize=10)
         self._frame.pack(expand=True, padx=7)
         sliderPadding = (0, 10)
+        self.scopesPanel.pack(pady=(0, 14))
         self.equalizeSliderGroup.pack(pady=sliderPadding)
         self.brightnessSliderGroup.pack(pady=sliderPadding)
         self.contrastSliderGroup.pack(pady=sliderPadding)
@@ -210,6 +297,66 @@ class _AdjustmentsPanel(stl.FrameAutoStyle):
         self.focus_set()
 
 
+class _ScopesPanel(stl.FrameAutoStyle):
+    # a histogram of luma and the RGB channels beside a vectorscope; each plot is only redrawn when its data changed
+    _HISTOGRAM_COLORS = {'red': '#e05050', 'green': '#50c050', 'blue': '#5080f0'}
+
+    def __init__(self, container, histogramSize=(96, 138), vectorscopeSize=96):
+        super().__init__(container)
+        self._histogramSize = histogramSize
+        self._histogramCanvas = tk.Canvas(self, height=histogramSize[0], width=histogramSize[1], bd=0,
+                                          highlightthickness=0, bg=stl.BACKGROUND_COLOR_1)
+        self._lumaPolygon = self._histogramCanvas.create_polygon(0, 0, 0, 0, fill='#777777', outline='')
+        self._channelLines = [self._histogramCanvas.create_line(0, 0, 0, 0, fill=color)
+                              for color in self._HISTOGRAM_COLORS.values()]
+        self._vectorscopeCanvas = tk.Canvas(self, height=vectorscopeSize, width=vectorscopeSize, bd=0,
+                                            highlightthickness=0, bg=stl.BACKGROUND_COLOR_1)
+        self._vectorscopeSize = vectorscopeSize
+        self._vectorscopeImage = None
+        self._histogramCanvas.pack(side=tk.LEFT)
+        self._vectorscopeCanvas.pack(side=tk.RIGHT, padx=(6, 0))
+        self._scopes = {}
+
+    def update_scopes(self, scopes):
+        # scopes as returned by Model.scopes
+        histogramChanged = any(not np.array_equal(scopes[key], self._scopes.get(key)) for key in ('rgb', 'luma'))
+        vectorscopeChanged = not np.array_equal(scopes['vectorscope'], self._scopes.get('vectorscope'))
+        self._scopes = scopes
+        if histogramChanged:
+            self._draw_histogram()
+        if vectorscopeChanged:
+            self._draw_vectorscope()
+
+    def _draw_histogram(self):
+        height, width = self._histogramSize
+        rgb, luma = self._scopes['rgb'], self._scopes['luma']
+        x = np.linspace(0, width-1, luma.shape[0])
+        scale = (height-1)/max(rgb.max(), luma.max(), 1)
+
+        def points(counts):
+            return np.column_stack((x, height-1-counts*scale)).ravel().tolist()
+
+        self._histogramCanvas.coords(self._lumaPolygon, [0, height-1]+points(luma)+[width-1, height-1])
+        for line, counts in zip(self._channelLines, rgb):
+            self._histogramCanvas.coords(line, points(counts))
+
+    def _draw_vectorscope(self):
+        from PIL import Image, ImageTk
+        vectorscope = self._scopes['vectorscope']
+        # log scaled, so that sparse colours remain visible next to the dominant ones
+        intensities = np.log1p(vectorscope)
+        intensities = (255*intensities/max(intensities.max(), 1)).astype(np.uint8)
+        image = Image.fromarray(intensities).resize((self._vectorscopeSize, self._vectorscopeSize))
+        if self._vectorscopeImage is None:
+            self._vectorscopeImage = ImageTk.PhotoImage(image=image)
+            self._vectorscopeCanvas.create_image(0, 0, anchor='nw', image=self._vectorscopeImage)
+            centre = self._vectorscopeSize/2
+            self._vectorscopeCanvas.create_line(centre, 0, centre, self._vectorscopeSize, fill='#555555')
+            self._vectorscopeCanvas.create_line(0, centre, self._vectorscopeSize, centre, fill='#555555')
+        else:
+            self._vectorscopeImage.paste(image)
+
+
 class _SliderGroup(stl.FrameAutoStyle):
     def __init__(self, container, title, valueRange=(-100, 100), initialValue=0):
         super().__init__(container)
@@ -232,5 +379,25 @@ class _SliderGroup(stl.FrameAutoStyle):
         self._entryBox.focus_set()
         self._command(event)
 
+    def neighbouring_positions(self, distance):
+        # slider positions of the entry box values up to distance steps from the current one, nearest first
+        sliderRange, entryRange = self._slider.range, self._entryBox.range
+        value = lw.range_converter(float(self._slider.get()), sliderRange, entryRange)
+        positions = []
+        for step in range(1, distance+1):
+            for neighbour in (value+step, value-step):
+                if entryRange[0] <= neighbour <= entryRange[1]:
+                    positions.append(lw.range_converter(neighbour, entryRange, sliderRange))
+        return positions
+
+    def set_position(self, position):
+        # moves the slider and its entry box to position, in [0, 1], without calling the bound command
+        command = self._command
+        self._command = lambda *args, **kwargs: None
+        self._slider.set_value(position, isDriving=False)
+        self._entryBox.set_value(lw.range_converter(position, self._slider.range, self._entryBox.range),
+                                 isDriving=False)
+        self._command = command
+
     def bind_callback(self, command):
         self._command = command
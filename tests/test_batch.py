@@ -0,0 +1,80 @@
+import os
+import sys
+import cv2
+import numba
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import batch  # noqa: E402
+import models  # noqa: E402
+
+_process_file = batch.process_file
+
+
+def crashing_process_file(inputPath, *args):
+    # stands in for a native crash in the worker
+    if 'crash' in os.path.basename(inputPath):
+        os._exit(1)
+    return _process_file(inputPath, *args)
+
+
+def write_image(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cv2.imwrite(str(path), np.random.randint(256, size=(20, 30, 3), dtype=np.uint8))
+    return str(path)
+
+
+class TestBatch:
+    def test_parse_params(self):
+        assert batch.parse_params({'Brightness': '1.2', 'two_tone_hue': 10}) == {
+            models.ParamType.BRIGHTNESS: 1.2, models.ParamType.TWO_TONE_HUE: 10.}
+        with pytest.raises(ValueError):
+            batch.parse_params({'sharpness': 1})
+
+    def test_find_input_files(self, tmp_path):
+        first = write_image(tmp_path/'a'/'x.png')
+        second = write_image(tmp_path/'a'/'y.jpg')
+        third = write_image(tmp_path/'b'/'x.png')
+        assert batch.find_input_files([str(tmp_path/'a'), str(tmp_path/'*'/'x.png')]) == [first, second, third]
+        assert batch.find_input_files([str(tmp_path/'missing'/'*.png')]) == []
+
+    def test_plan_outputs(self, tmp_path):
+        first = write_image(tmp_path/'a'/'x.png')
+        second = write_image(tmp_path/'b'/'x.png')
+        plan = batch.plan_outputs([first, second], str(tmp_path/'out'))
+        assert plan == {first: (str(tmp_path/'out'/'a'/'x.png'), None),
+                        second: (str(tmp_path/'out'/'b'/'x.png'), None)}
+        # writing next to the inputs only works with a new name
+        assert batch.plan_outputs([first], str(tmp_path/'a'))[first][1] is not None
+        assert batch.plan_outputs([first], str(tmp_path/'a'), suffix='_edited')[first][1] is None
+        third = write_image(tmp_path/'a'/'x.jpg')
+        plan = batch.plan_outputs([first, third], str(tmp_path/'out'), extension='png')
+        assert plan[first][1] is None and plan[third][1] is not None
+
+    def test_run_batch(self, tmp_path, monkeypatch):
+        # the workers compile into their own cache rather than that of the tests' src.models
+        monkeypatch.setattr(numba.config, 'CACHE_DIR', str(tmp_path/'numba'))
+        monkeypatch.setattr(batch, '_initialize_worker', lambda numbaThreads: None)
+        monkeypatch.setattr(batch, 'process_file', crashing_process_file)
+        good = write_image(tmp_path/'in'/'good.png')
+        corrupt = str(tmp_path/'in'/'corrupt.png')
+        with open(corrupt, 'wb') as file:
+            file.write(b'not an image')
+        crash = write_image(tmp_path/'in'/'crash.png')
+        others = [write_image(tmp_path/'in'/'other{}.png'.format(i)) for i in range(4)]
+        results = batch.run_batch([good, corrupt, crash, *others], str(tmp_path/'out'),
+                                  {models.ParamType.BRIGHTNESS: 1.2}, workers=2)
+        errors = {os.path.basename(result['input']): result['error'] for result in results}
+        assert len(results) == 7 and all(errors['other{}.png'.format(i)] is None for i in range(4))
+        assert errors['good.png'] is None and os.path.exists(tmp_path/'out'/'good.png')
+        assert errors['corrupt.png'].startswith('ValueError') and errors['crash.png'].startswith('BrokenProcessPool')
+        assert batch.main([good, '-o', str(tmp_path/'again'), '-j', '1']) == 0
+        assert batch.main([good, corrupt, '-o', str(tmp_path/'again'), '-j', '1']) == 1
+        # a budget can't be kept decoding a PNG whole
+        with pytest.raises(SystemExit):
+            batch.main([good, '-o', str(tmp_path/'again'), '--memory-budget', '1'])
+        # last, since forking once the parallel kernels' threads have started can deadlock the workers
+        expected = models._ImageProcessor(models.open_image(good), fused=True)
+        expected.change_processing_params({models.ParamType.BRIGHTNESS: 1.2})
+        assert np.array_equal(models.open_image(str(tmp_path/'out'/'good.png')), expected.processedImage)
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+# cumulative import time budgets in seconds, generous enough for a loaded machine but well below the cost of
+# importing numba, scipy or cv2, which are only loaded once an image is processed
+IMPORT_TIME_BUDGETS = {'models': .3, 'presenters': .45, 'batch': .3, 'startup': .15}
+HEAVY_MODULES = ('numba', 'scipy', 'cv2', 'PIL')
+
+
+def import_seconds(moduleName):
+    # best of three fresh interpreters, as reported by -X importtime
+    times = []
+    for _ in range(3):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import '+moduleName], cwd=SRC_DIR,
+                                 capture_output=True, text=True, check=True)
+        for line in process.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].rstrip() == ' '+moduleName:
+                times.append(int(fields[1])/1e6)
+    return min(times)
+
+
+class TestImportTime:
+    def test_budgets(self):
+        for moduleName, budget in IMPORT_TIME_BUDGETS.items():
+            assert import_seconds(moduleName) < budget, moduleName
+
+    def test_heavy_modules_not_imported(self):
+        code = 'import sys, presenters, batch; print(" ".join(sorted(sys.modules)))'
+        process = subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, capture_output=True, text=True,
+                                 check=True)
+        importedModules = set(process.stdout.split())
+        assert not importedModules.intersection(HEAVY_MODULES)
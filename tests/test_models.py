@@ -1,5 +1,13 @@
-from src.models import _UniquePixelData
+from src.models import _UniquePixelData, _ImageProcessor, _LutProcessor, _StreamingExporter, Model, ParamType
+from src.models import _KERNEL_SIGNATURES, compile_kernels, _RgbModifier, _srgb_decode, _srgb_encoding_table
+from src.models import downscale_image, _ScopeCalculator, ExportOptions, encode_image, open_image, map_image
+from src.models import export_image_streaming
+from src import models
 import numpy as np
+import cv2
+import os
+import stat
+import pytest
 
 
 class TestUniquePixelData:
@@ -18,3 +26,453 @@ class TestUniquePixelData:
         pixels = np.random.randint(256, size=(10000, 3), dtype=np.uint8)
         uniquePixelData = _UniquePixelData(pixels)
         assert np.array_equal(pixels, uniquePixelData.reverse())
+
+    def test_counting_engine(self):
+        pixels = np.random.randint(256, size=(10000, 3), dtype=np.uint8)
+        countingPixelData = _UniquePixelData(pixels, engine='counting')
+        lexsortPixelData = _UniquePixelData(pixels, engine='lexsort')
+        assert np.array_equal(pixels, countingPixelData.reverse())
+        assert countingPixelData.values.shape == lexsortPixelData.values.shape
+        assert countingPixelData.counts.sum() == pixels.shape[0]
+
+    def test_high_bit_depth(self):
+        pixels = np.random.randint(65536, size=(2**17, 3), dtype=np.uint16)
+        assert _UniquePixelData._select_engine(pixels) == 'identity'
+        for engine in ('identity', 'lexsort'):
+            uniquePixelData = _UniquePixelData(pixels, engine)
+            assert np.array_equal(pixels, uniquePixelData.reverse(np.uint16))
+
+    def test_compact_layout(self):
+        pixels = np.random.randint(16, size=(100, 100, 3), dtype=np.uint8)
+        for engine in ('counting', 'lexsort'):
+            uniquePixelData = _UniquePixelData(pixels, engine)
+            assert uniquePixelData.memory_usage()['reverseMapping'] == 2*100*100
+            view = uniquePixelData.with_values(uniquePixelData.values.astype(np.float32)/255)
+            assert view.counts is uniquePixelData.counts
+            assert np.array_equal(pixels, view.reverse())
+        identityPixelData = _UniquePixelData(pixels, 'identity')
+        assert identityPixelData.memory_usage()['reverseMapping'] == 0
+        assert identityPixelData.memory_usage()['counts'] == 8 and identityPixelData.counts.sum() == 100*100
+        assert np.array_equal(pixels, identityPixelData.reverse())
+
+
+class TestDownscaleImage:
+    def test_box(self):
+        # alternating black and white pixels average to half the linear intensity, not half the encoded value
+        image = np.zeros((60, 90, 3), dtype=np.uint8)
+        image[::2, ::2] = 255
+        image[1::2, 1::2] = 255
+        assert np.all(np.abs(downscale_image(image, (30, 45)).astype(np.int16)-188) <= 1)
+        image = np.random.randint(256, size=(61, 89, 3), dtype=np.uint8)
+        areaImage = downscale_image(image, (17, 23), 'area')
+        boxImage = downscale_image(image, (17, 23))
+        assert boxImage.shape == areaImage.shape and boxImage.dtype == np.uint8
+        assert np.all(boxImage.astype(np.int16) >= areaImage.astype(np.int16)-1)
+
+    def test_high_bit_depth(self):
+        image = np.full((40, 50, 3), 30000, dtype=np.uint16)
+        assert np.all(np.abs(downscale_image(image, (13, 17)).astype(np.int32)-30000) <= 2)
+
+
+class TestRgbModifier:
+    def test_apply_linearization_table(self):
+        table = np.sqrt(np.arange(256, dtype=np.float32))*np.float32(np.sqrt(255))
+        for dtype in (np.uint8, np.uint16):
+            values = np.random.randint(np.iinfo(dtype).max+1, size=(10000, 3)).astype(dtype)
+            expected = _srgb_decode(_RgbModifier.apply_equalization_table(table, values))
+            assert np.allclose(_RgbModifier.apply_linearization_table(table, values), expected, atol=1e-6)
+
+    def test_srgb_encoding_table(self):
+        table = _srgb_encoding_table()
+        values = np.random.rand(100000)
+        exact = np.where(values <= .0031308, values*12.92, 1.055*values**(1/2.4)-.055)
+        interpolated = np.interp(values, np.linspace(0, 1, table.shape[0]), table)
+        assert np.abs(interpolated-exact).max()*255 < 1e-3
+
+
+class TestImageProcessor:
+    def test_change_processing_params(self):
+        image = np.random.randint(256, size=(100, 100, 3), dtype=np.uint8)
+        imageProcessor = _ImageProcessor(image)
+        imageProcessor.change_processing_params({ParamType.EQUALIZE: 10., ParamType.BRIGHTNESS: 1.2})
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.4})
+        imageProcessor.change_processing_params({ParamType.CONTRAST: 1.3})
+        freshImageProcessor = _ImageProcessor(image)
+        freshImageProcessor.change_processing_params(dict(imageProcessor.processingParams))
+        assert np.array_equal(imageProcessor.processedImage, freshImageProcessor.processedImage)
+
+    def test_identity_params(self):
+        image = np.random.randint(256, size=(100, 100, 3), dtype=np.uint8)
+        imageProcessor = _ImageProcessor(image)
+        imageProcessor.change_processing_params({})
+        assert np.abs(imageProcessor.processedImage.astype(np.int16)-image).max() <= 1
+
+    def test_frame_buffers(self):
+        image = np.random.randint(256, size=(30, 40, 3), dtype=np.uint8)
+        imageProcessor = _ImageProcessor(image, frameBufferCount=2)
+        firstFrame = imageProcessor.processedImage
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.5})
+        secondFrame = imageProcessor.processedImage
+        expected = secondFrame.copy()
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.2})
+        assert imageProcessor.processedImage is firstFrame
+        assert np.array_equal(secondFrame, expected)
+        freshImageProcessor = _ImageProcessor(image)
+        freshImageProcessor.change_processing_params({ParamType.SATURATION: 1.2})
+        assert np.array_equal(imageProcessor.processedImage, freshImageProcessor.processedImage)
+
+    def test_frame_cache(self):
+        image = np.random.randint(256, size=(30, 40, 3), dtype=np.uint8)
+        imageProcessor = _ImageProcessor(image, frameBufferCount=2, frameCacheBudget=2**20)
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.5})
+        expected = imageProcessor.processedImage.copy()
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.2})
+        assert imageProcessor.has_cached_frame({**imageProcessor.processingParams, ParamType.SATURATION: 1.5})
+        imageProcessor._stageCache.clear()
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.5})
+        # served from the frame cache, which leaves the cleared stage cache empty
+        assert not imageProcessor._stageCache
+        assert np.array_equal(imageProcessor.processedImage, expected)
+        imageProcessor.frameCacheBudget = imageProcessor._frameCacheBytes
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.1})
+        assert imageProcessor._frameCacheBytes <= imageProcessor.frameCacheBudget
+        assert not imageProcessor.has_cached_frame({**imageProcessor.processingParams, ParamType.SATURATION: 1.2})
+
+    def test_prerender(self):
+        image = np.random.randint(256, size=(30, 40, 3), dtype=np.uint8)
+        imageProcessor = _ImageProcessor(image, frameBufferCount=2, frameCacheBudget=2**20)
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.5})
+        expected = imageProcessor.processedImage.copy()
+        assert not imageProcessor.prerender({ParamType.SATURATION: 1.2}, isCancelled=lambda: True)
+        assert imageProcessor.prerender({ParamType.SATURATION: 1.2})
+        assert imageProcessor.processingParams[ParamType.SATURATION] == 1.5
+        assert np.array_equal(imageProcessor.processedImage, expected)
+        assert imageProcessor.has_cached_frame({**imageProcessor.processingParams, ParamType.SATURATION: 1.2})
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.2})
+        freshImageProcessor = _ImageProcessor(image)
+        freshImageProcessor.change_processing_params({ParamType.SATURATION: 1.2})
+        assert np.array_equal(imageProcessor.processedImage, freshImageProcessor.processedImage)
+
+    def test_fused(self):
+        image = np.random.randint(256, size=(100, 100, 3), dtype=np.uint8)
+        fusedImageProcessor = _ImageProcessor(image, fused=True)
+        stagedImageProcessor = _ImageProcessor(image)
+        for paramDict in ({},
+                          {ParamType.BRIGHTNESS: 1.3, ParamType.CONTRAST: .8, ParamType.WARMTH: -.3},
+                          {ParamType.EQUALIZE: 10., ParamType.SATURATION: 1.4, ParamType.TWO_TONE_HUE: 20.},
+                          {ParamType.TINT: .2, ParamType.TWO_TONE_SATURATION: .5}):
+            fusedImageProcessor.change_processing_params(paramDict)
+            stagedImageProcessor.change_processing_params(paramDict)
+            error = np.abs(fusedImageProcessor.processedImage.astype(np.int16)-stagedImageProcessor.processedImage)
+            assert error.max() <= 1 and error.mean() < .01
+
+
+class TestScopeCalculator:
+    def test_compute(self):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        imageProcessor = _ImageProcessor(image)
+        imageProcessor.change_processing_params({ParamType.BRIGHTNESS: 1.3, ParamType.SATURATION: 1.4})
+        scopes = _ScopeCalculator().compute(imageProcessor._modifiedPixels)
+        values = imageProcessor._modifiedPixels.reverse(np.float32).reshape(-1, 3)
+        for channel in range(3):
+            bins = np.minimum((np.clip(values[:, channel], 0, 1)*256).astype(np.int64), 255)
+            assert np.array_equal(scopes['rgb'][channel], np.bincount(bins, minlength=256))
+        assert scopes['luma'].sum() == scopes['vectorscope'].sum() == image.shape[0]*image.shape[1]
+
+    def test_grey(self):
+        image = np.repeat(np.random.randint(256, size=(60, 80, 1), dtype=np.uint8), 3, axis=2)
+        scopes = _ScopeCalculator(vectorscopeSize=32).compute(_ImageProcessor(image)._modifiedPixels)
+        # neutral colours have a = b = 0, the centre of the vectorscope
+        assert scopes['vectorscope'][15:17, 15:17].sum() == image.shape[0]*image.shape[1]
+        assert np.array_equal(scopes['luma'], scopes['rgb'][0])
+
+
+class TestLutProcessor:
+    processingParams = {ParamType.EQUALIZE: 10.,
+                        ParamType.BRIGHTNESS: 1.2,
+                        ParamType.CONTRAST: 1.3,
+                        ParamType.SATURATION: 1.4,
+                        ParamType.WARMTH: .2,
+                        ParamType.TINT: -.1,
+                        ParamType.TWO_TONE_HUE: 20.,
+                        ParamType.TWO_TONE_SATURATION: 1.1}
+
+    def test_process(self):
+        image = np.random.randint(256, size=(100, 100, 3), dtype=np.uint8)
+        imageProcessor = _ImageProcessor(image)
+        imageProcessor.change_processing_params(dict(self.processingParams))
+        for interpolation in ('tetrahedral', 'trilinear'):
+            lutImage = _LutProcessor(image, interpolation=interpolation).process(self.processingParams)
+            error = np.abs(lutImage.astype(np.int16)-imageProcessor.processedImage.astype(np.int16))
+            assert error.max() <= 4 and error.mean() < .1
+
+    def test_measure_error(self):
+        image = np.random.randint(256, size=(100, 100, 3), dtype=np.uint8)
+        coarseError = _LutProcessor(image, latticeSize=9).measure_error(self.processingParams)
+        lutProcessor = _LutProcessor(image, latticeSize=65)
+        fineError = lutProcessor.measure_error(self.processingParams)
+        assert fineError[1] < coarseError[1] and fineError[0] <= 2
+        # the sample's error is bounded by that of the whole image against the exact pipeline with the same statistics
+        imageProcessor = _ImageProcessor(image, lutProcessor._histogram, fused=True)
+        imageProcessor.inflectionPoint = lutProcessor._inflectionPoint
+        imageProcessor.change_processing_params(dict(self.processingParams))
+        lutImage = lutProcessor.process(self.processingParams)
+        error = np.abs(lutImage.astype(np.int16)-imageProcessor.processedImage.astype(np.int16))
+        assert fineError[0] <= error.max() <= 2
+
+
+class TestStreamingExporter:
+    def test_export(self, tmp_path):
+        image = np.random.randint(256, size=(90, 60, 3), dtype=np.uint8)
+        processingParams = _ImageProcessor.default_processing_params()
+        processingParams.update({ParamType.EQUALIZE: 10., ParamType.BRIGHTNESS: 1.3, ParamType.SATURATION: 1.2})
+        imageProcessor = _ImageProcessor(image, fused=True)
+        imageProcessor.change_processing_params(processingParams)
+        streamingExporter = _StreamingExporter(np.lib.format.open_memmap(str(tmp_path/'input.npy'), mode='w+',
+                                                                         dtype=np.uint8, shape=image.shape),
+                                               memoryBudget=96*60*10)
+        streamingExporter._source[:] = image
+        assert streamingExporter.stripHeight == 10
+        for fileName in ('output.png', 'output.ppm', 'output.npy'):
+            streamingExporter.export(str(tmp_path/fileName), processingParams)
+        assert np.array_equal(cv2.imread(str(tmp_path/'output.png'))[:, :, [2, 1, 0]], imageProcessor.processedImage)
+        assert np.array_equal(cv2.imread(str(tmp_path/'output.ppm'))[:, :, [2, 1, 0]], imageProcessor.processedImage)
+        assert np.array_equal(np.load(str(tmp_path/'output.npy')), imageProcessor.processedImage)
+
+    def test_export_streaming(self, tmp_path):
+        processingParams = {ParamType.BRIGHTNESS: 1.3, ParamType.SATURATION: 1.2}
+        image = np.random.randint(65536, size=(40, 30, 3)).astype(np.uint16)
+        cv2.imwrite(str(tmp_path/'input.ppm'), image)
+        assert np.array_equal(map_image(str(tmp_path/'input.ppm')), image[:, :, [2, 1, 0]])
+        for highBitDepth in (False, True):
+            imageProcessor = _ImageProcessor(open_image(str(tmp_path/'input.ppm'), highBitDepth),
+                                             outputDtype=np.uint16 if highBitDepth else np.uint8, fused=True)
+            imageProcessor.change_processing_params(processingParams)
+            export_image_streaming(str(tmp_path/'input.ppm'), str(tmp_path/'output.png'), processingParams,
+                                   memoryBudget=96*30*7, highBitDepth=highBitDepth,
+                                   exportOptions=ExportOptions(pngStrategy='default'))
+            output = cv2.imread(str(tmp_path/'output.png'), cv2.IMREAD_UNCHANGED)[:, :, [2, 1, 0]]
+            assert output.dtype == imageProcessor.processedImage.dtype
+            # the inflection point summed strip by strip can round a 16-bit sample differently
+            assert np.abs(output.astype(np.int64)-imageProcessor.processedImage).max() <= highBitDepth
+        # headers may carry comments
+        with open(tmp_path/'comment.ppm', 'wb') as file:
+            file.write(b'P6\n# made by hand\n30 40\n255\n'+image[:, :, [2, 1, 0]].astype(np.uint8).tobytes())
+        assert np.array_equal(map_image(str(tmp_path/'comment.ppm')), image.astype(np.uint8)[:, :, [2, 1, 0]])
+        # formats that can only be read or written whole are refused
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        with pytest.raises(ValueError):
+            export_image_streaming(str(tmp_path/'input.png'), str(tmp_path/'output.ppm'), processingParams)
+        with pytest.raises(ValueError):
+            export_image_streaming(str(tmp_path/'input.ppm'), str(tmp_path/'output.jpg'), processingParams)
+
+
+class TestEncodeImage:
+    def test_png_strips(self):
+        for dtype, maxValue in ((np.uint8, 256), (np.uint16, 65536)):
+            image = np.random.randint(maxValue, size=(37, 23, 3)).astype(dtype)
+            for stripCount in (2, 5, 40):
+                for strategy in ('rle', 'default'):
+                    encoded = encode_image(image, '.png', ExportOptions(pngStripCount=stripCount, pngStrategy=strategy))
+                    decoded = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_UNCHANGED)
+                    assert decoded.dtype == dtype and np.array_equal(decoded[:, :, [2, 1, 0]], image)
+
+    def test_jpeg_quality(self):
+        image = cv2.GaussianBlur(np.random.randint(256, size=(64, 64, 3), dtype=np.uint8), (5, 5), 0)
+        sizes = [len(encode_image(image, '.jpg', ExportOptions(jpegQuality=quality, jpegSubsampling='420')))
+                 for quality in (30, 95)]
+        assert sizes[0] < sizes[1]
+
+
+class TestModel:
+    def test_save_image(self, tmp_path):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'), maxDisplayImageSize=(30, 40))
+        model.change_processing_params({ParamType.SATURATION: 1.5})
+        model.save_image(str(tmp_path/'first.png'))
+        trueImagePixels = model._trueImagePixels
+        model.save_image(str(tmp_path/'second.png'))
+        imageProcessor = _ImageProcessor(image[:, :, [2, 1, 0]], fused=True)
+        imageProcessor.change_processing_params({ParamType.SATURATION: 1.5})
+        assert model._trueImagePixels is trueImagePixels
+        assert np.array_equal(cv2.imread(str(tmp_path/'second.png'))[:, :, [2, 1, 0]], imageProcessor.processedImage)
+
+    def test_encode_image(self, tmp_path):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'), maxDisplayImageSize=(30, 40),
+                      exportOptions=ExportOptions(pngStripCount=3))
+        model.change_processing_params({ParamType.SATURATION: 1.5})
+        model.save_image(str(tmp_path/'output.png'))
+        assert model.lastEncodeSeconds is not None
+        encoded = model.encode_image('.png', exportOptions=ExportOptions(pngCompression=1))
+        assert np.array_equal(cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_UNCHANGED),
+                              cv2.imread(str(tmp_path/'output.png')))
+
+    def test_save_image_mode(self, tmp_path):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'), maxDisplayImageSize=(30, 40))
+        umask = os.umask(0o027)
+        try:
+            model.save_image(str(tmp_path/'output.png'))
+        finally:
+            os.umask(umask)
+        assert stat.S_IMODE(os.stat(tmp_path/'output.png').st_mode) == 0o640
+        os.chmod(tmp_path/'output.png', 0o604)
+        model.save_image(str(tmp_path/'output.png'))
+        assert stat.S_IMODE(os.stat(tmp_path/'output.png').st_mode) == 0o604
+
+    def test_save_image_progress(self, tmp_path):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'), maxDisplayImageSize=(30, 40))
+        model.change_processing_params({ParamType.SATURATION: 1.5})
+        processingParams = model.processingParams
+        fractions = []
+        assert not model.save_image(str(tmp_path/'output.png'), processingParams, fractions.append,
+                                    lambda: len(fractions) > 1)
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['input.png']
+        assert model.save_image(str(tmp_path/'output.png'), processingParams, fractions.append)
+        assert fractions[2:] == sorted(fractions[2:]) and fractions[-1] == 1.
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['input.png', 'output.png']
+        model.change_processing_params({ParamType.SATURATION: 1.2})
+        model.mark_saved(processingParams)
+        assert model.existUnsavedChanges
+        model.mark_saved(model.processingParams)
+        assert not model.existUnsavedChanges
+
+    def test_render_preview(self, tmp_path):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'), previewScale=.25)
+        previewImage = model.render_preview({ParamType.BRIGHTNESS: 1.5})
+        assert previewImage.shape == model.originalDisplayImage.shape
+        assert model._previewImageProcessor._originalPixels.values.shape[0] <= 15*20
+        model.change_processing_params({})
+        imageProcessor = _ImageProcessor(image[:, :, [2, 1, 0]])
+        imageProcessor.change_processing_params({ParamType.BRIGHTNESS: 1.5})
+        assert np.array_equal(model.processedDisplayImage, imageProcessor.processedImage)
+
+    def test_prerender(self, tmp_path):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'))
+        model.change_processing_params({ParamType.SATURATION: 1.5})
+        displayImage = model.processedDisplayImage.copy()
+        seenParams = []
+
+        def is_cancelled():
+            # what another thread would see during the prerender
+            seenParams.append(model.processingParams)
+            return False
+
+        assert model.prerender({ParamType.SATURATION: 1.7}, is_cancelled)
+        assert seenParams and all(params[ParamType.SATURATION] == 1.5 for params in seenParams)
+        assert np.array_equal(model._displayImageProcessor._modifiedPixels.reverse(), displayImage)
+
+    def test_history(self, tmp_path):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'), previewScale=.25, historyLength=3)
+        assert not model.canUndo and model.undo() is None
+        for brightness in (1.2, 1.4, 1.6):
+            model.change_processing_params({ParamType.BRIGHTNESS: brightness})
+            model.record_history()
+        model.record_history()
+        expected = model.processedDisplayImage.copy()
+        # the oldest step, the default parameters, was dropped
+        assert model.undo()[ParamType.BRIGHTNESS] == 1.4
+        params = model.undo()
+        assert params[ParamType.BRIGHTNESS] == 1.2 and model.undo() is None
+        # a cached frame is rendered at full display resolution
+        assert model.render_preview(params) is model.processedDisplayImage
+        assert model.redo()[ParamType.BRIGHTNESS] == 1.4
+        model.render_preview(model.redo())
+        assert np.array_equal(model.processedDisplayImage, expected) and not model.canRedo
+        model.undo()
+        model.change_processing_params({ParamType.CONTRAST: 1.3})
+        model.record_history()
+        assert not model.canRedo
+
+    def test_save_image_high_bit_depth(self, tmp_path):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image.astype(np.uint16)*257)
+        model = Model(str(tmp_path/'input.png'), maxDisplayImageSize=(30, 40), highBitDepth=True)
+        assert model.originalDisplayImage.dtype == np.uint8
+        model.change_processing_params({ParamType.EQUALIZE: 10., ParamType.BRIGHTNESS: 1.2})
+        model.save_image(str(tmp_path/'output.png'))
+        savedImage = cv2.imread(str(tmp_path/'output.png'), cv2.IMREAD_UNCHANGED)[:, :, [2, 1, 0]]
+        imageProcessor = _ImageProcessor(image[:, :, [2, 1, 0]])
+        imageProcessor.change_processing_params({ParamType.EQUALIZE: 10., ParamType.BRIGHTNESS: 1.2})
+        assert savedImage.dtype == np.uint16
+        assert np.abs(savedImage/257-imageProcessor.processedImage).max() <= 1
+
+    def test_instrumentation(self, tmp_path):
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'), maxDisplayImageSize=(30, 40))
+        model.change_processing_params({ParamType.SATURATION: 1.5})
+        assert model.instrumentation.samples() == []
+        samples = []
+        model.add_instrumentation_callback(samples.append)
+        model.instrumentation.enabled = True
+        model.change_processing_params({ParamType.SATURATION: 1.2})
+        model.save_image(str(tmp_path/'output.png'))
+        summary = model.instrumentation.summary()
+        assert summary['render']['equalize']['cacheHitRate'] == 1
+        assert summary['render']['hueSaturation']['cacheHitRate'] == 0
+        # display frames are rendered into persistent buffers
+        assert summary['render']['reverse']['meanBytesAllocated'] == 0
+        assert {'decompose', 'equalize', 'color', 'reverse', 'write', 'total'} <= set(summary['save'])
+        model.instrumentation.dump(str(tmp_path/'samples.jsonl'))
+        assert len((tmp_path/'samples.jsonl').read_text().splitlines()) == len(samples)
+
+    def test_render_viewport(self, tmp_path):
+        image = np.random.randint(256, size=(300, 400, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image[:, :, [2, 1, 0]])
+        model = Model(str(tmp_path/'input.png'), maxDisplayImageSize=(70, 90))
+        assert model.zoomLevelCount == 3
+        assert model.zoom_level_shape(2) == (75, 100)
+        assert np.array_equal(model.render_viewport(0, 100, 150, 70, 90, original=True), image[100:170, 150:240])
+        model.change_processing_params({ParamType.BRIGHTNESS: 1.3, ParamType.SATURATION: 1.4})
+        viewport = model.render_viewport(0, 250, 350, 70, 90)
+        # the parts outside the image are black
+        assert not viewport[50:, :].any() and not viewport[:, 50:].any()
+        histogram = model._displayImageProcessor._modifiers.rgb._histogram
+        tileProcessor = _ImageProcessor(image[250:, 350:].copy(), histogram, fused=True)
+        tileProcessor.inflectionPoint = model._get_viewport_renderer()._inflectionPoint
+        tileProcessor.change_processing_params(model._displayImageProcessor.processingParams)
+        assert np.abs(viewport[:50, :50].astype(np.int16)-tileProcessor.processedImage).max() <= 1
+
+    def test_release_memory(self, tmp_path):
+        image = np.random.randint(256, size=(300, 400, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'), maxDisplayImageSize=(30, 40), spillDirectory=str(tmp_path))
+        model.change_processing_params({ParamType.SATURATION: 1.5})
+        model.save_image(str(tmp_path/'before.png'))
+        assert model.memory_usage()['trueImage'] == image.nbytes
+        assert model.memory_usage()['trueImagePixels'] > 0
+        model.release_memory()
+        assert model.memory_usage()['trueImage'] == 0 and model.memory_usage()['trueImagePixels'] == 0
+        assert not list(tmp_path.glob('*.npy'))
+        # once the source has been overwritten, the image can only be reloaded from a spill file
+        model.save_image(str(tmp_path/'input.png'))
+        model.release_memory()
+        assert len(list(tmp_path.glob('*.npy'))) == 1
+        model.save_image(str(tmp_path/'after.png'))
+        assert np.array_equal(cv2.imread(str(tmp_path/'before.png')), cv2.imread(str(tmp_path/'after.png')))
+        model.close()
+
+    def test_compile_kernels(self, tmp_path):
+        compile_kernels()
+        signatureCounts = [len(kernel.signatures) for kernel, _ in _KERNEL_SIGNATURES]
+        image = np.random.randint(256, size=(60, 80, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path/'input.png'), image)
+        model = Model(str(tmp_path/'input.png'), maxDisplayImageSize=(30, 40), previewScale=.5)
+        model.render_preview({ParamType.EQUALIZE: 10., ParamType.BRIGHTNESS: 1.2, ParamType.SATURATION: 1.2})
+        model.save_image(str(tmp_path/'output.png'))
+        assert [len(kernel.signatures) for kernel, _ in _KERNEL_SIGNATURES] == signatureCounts
+        # compiling leaves the module's prange alone
+        assert models.prange is range
@@ -0,0 +1,95 @@
+from src.render_scheduler import RenderScheduler
+import threading
+import time
+
+
+def call_later(ms, func):
+    threading.Timer(ms/1000, func).start()
+
+
+class TestRenderScheduler:
+    def test_submit(self):
+        renderedParams = []
+        deliveredFrames = []
+        delivered = threading.Event()
+
+        def render(paramDict):
+            time.sleep(.01)
+            renderedParams.append(paramDict)
+            return paramDict
+
+        def deliver(frame):
+            deliveredFrames.append(frame)
+            if frame.get('b') == 49:
+                delivered.set()
+
+        renderScheduler = RenderScheduler(render, deliver, call_later, coalescingWindow=.02, queueDepth=1)
+        renderScheduler.submit({'a': 1})
+        for i in range(50):
+            renderScheduler.submit({'b': i})
+        assert delivered.wait(2)
+        renderScheduler.close()
+        assert len(renderedParams) < 50
+        assert renderedParams[-1]['b'] == 49
+
+    def test_render_error(self, capsys):
+        delivered = threading.Event()
+
+        def render(paramDict):
+            if paramDict['a'] == 1:
+                raise ValueError('bad parameters')
+            return paramDict
+
+        def deliver(frame):
+            if frame['a'] == 2:
+                delivered.set()
+
+        renderScheduler = RenderScheduler(render, deliver, call_later, coalescingWindow=0)
+        renderScheduler.submit({'a': 1})
+        time.sleep(.05)
+        renderScheduler.submit({'a': 2})
+        assert delivered.wait(2)
+        renderScheduler.close()
+        assert 'bad parameters' in capsys.readouterr().err
+
+    def test_refine(self):
+        deliveredFrames = []
+        refined = threading.Event()
+
+        def deliver(frame):
+            deliveredFrames.append(frame)
+            if frame == 'full':
+                refined.set()
+
+        renderScheduler = RenderScheduler(lambda paramDict: 'preview', deliver, call_later,
+                                          refine=lambda: 'full', refineDelay=.05)
+        renderScheduler.submit({'a': 1})
+        assert refined.wait(2)
+        renderScheduler.close()
+        assert deliveredFrames == ['preview', 'full']
+
+    def test_speculate(self):
+        speculated = []
+        speculatedAll = threading.Event()
+        delivered = threading.Event()
+
+        def speculate(paramDict, isCancelled):
+            speculated.append((paramDict, time.perf_counter()))
+            time.sleep(.02)
+            if len(speculated) == 3:
+                speculatedAll.set()
+
+        renderScheduler = RenderScheduler(lambda paramDict: paramDict, lambda frame: delivered.set(), call_later,
+                                          speculate=speculate, speculationCpuBudget=.5)
+        renderScheduler.set_speculations([{'a': 2}, {'a': 0}, {'a': 3}])
+        assert speculatedAll.wait(2)
+        assert [paramDict for paramDict, _ in speculated] == [{'a': 2}, {'a': 0}, {'a': 3}]
+        # each speculation is followed by at least as long an idle time
+        assert all(later-earlier >= .04 for (_, earlier), (_, later) in zip(speculated, speculated[1:]))
+        renderScheduler.set_speculations([{'a': 4}, {'a': 5}])
+        renderScheduler.submit({'a': 1})
+        assert delivered.wait(2)
+        time.sleep(.1)
+        renderScheduler.close()
+        # a request discards the speculations queued before it
+        assert len(speculated) <= 4
@@ -0,0 +1,29 @@
+from src.resource_manager import ResourceManager
+
+
+class FakeModel:
+    def __init__(self, size):
+        self.size = size
+
+    def memory_usage(self):
+        return {'trueImage': self.size, 'display': 1}
+
+    def release_memory(self):
+        self.size = 0
+
+
+class TestResourceManager:
+    def test_enforce(self):
+        resourceManager = ResourceManager(budget=250)
+        models = [FakeModel(100) for _ in range(3)]
+        for i, model in enumerate(models):
+            resourceManager.add(model, str(i))
+        # the least recently activated model is released first, and the active one never
+        assert [model.size for model in models] == [0, 100, 100]
+        resourceManager.activate(models[0])
+        models[0].size = 400
+        resourceManager.enforce()
+        assert [model.size for model in models] == [400, 0, 0]
+        resourceManager.remove(models[0])
+        assert resourceManager.total() == 2
+        assert list(resourceManager.usage()) == ['1', '2']
@@ -0,0 +1,66 @@
+from src.save_queue import SaveQueue
+import threading
+import time
+
+
+def call_later(ms, func):
+    threading.Timer(ms/1000, func).start()
+
+
+class TestSaveQueue:
+    def test_submit(self):
+        started = threading.Event()
+        release = threading.Event()
+        saves = []
+        finishedJobs = []
+        allFinished = threading.Event()
+
+        def save_function(name):
+            def save(progress, isCancelled):
+                started.set()
+                release.wait(2)
+                progress(1.)
+                saves.append(name)
+                return True
+            return save
+
+        def done(job):
+            finishedJobs.append(job)
+            if len(finishedJobs) == 4:
+                allFinished.set()
+
+        saveQueue = SaveQueue(call_later, maxConcurrentSaves=2, pollInterval=5)
+        firstJob = saveQueue.submit('a.png', 1, save_function('a1'), doneCallback=done)
+        assert started.wait(2)
+        # redundant with the running save
+        assert saveQueue.submit('a.png', 1, save_function('a1 again'), doneCallback=done) is firstJob
+        # waits for the running save of the same target, then the second replaces the first
+        replacedJob = saveQueue.submit('a.png', 2, save_function('a2'), doneCallback=done)
+        secondJob = saveQueue.submit('a.png', 3, save_function('a3'), doneCallback=done)
+        otherJob = saveQueue.submit('b.png', 1, save_function('b1'), doneCallback=done)
+        release.set()
+        assert allFinished.wait(2)
+        saveQueue.close()
+        assert sorted(saves) == ['a1', 'a3', 'b1']
+        assert replacedJob.status == 'cancelled'
+        assert firstJob.status == secondJob.status == otherJob.status == 'saved' and firstJob.progress == 1.
+
+    def test_cancel(self):
+        started = threading.Event()
+        finished = threading.Event()
+
+        def save(progress, isCancelled):
+            started.set()
+            while not isCancelled():
+                time.sleep(.001)
+            return False
+
+        saveQueue = SaveQueue(call_later, pollInterval=5)
+        runningJob = saveQueue.submit('a.png', 1, save, doneCallback=lambda job: finished.set())
+        queuedJob = saveQueue.submit('b.png', 1, save)
+        assert started.wait(2)
+        queuedJob.cancel()
+        runningJob.cancel()
+        assert finished.wait(2)
+        saveQueue.close()
+        assert runningJob.status == queuedJob.status == 'cancelled'
@@ -0,0 +1,29 @@
+from src import startup
+import json
+import numba
+
+
+class TestStartup:
+    def test_validate_cache_dir(self, tmp_path):
+        cacheDir = tmp_path/'cache'
+        startup.validate_cache_dir(str(cacheDir))
+        (cacheDir/'models.Kernel-1.py311.nbi').write_bytes(b'')
+        (cacheDir/'notes.txt').write_text('')
+        startup.validate_cache_dir(str(cacheDir))
+        assert (cacheDir/'models.Kernel-1.py311.nbi').exists()
+        stamp = json.loads((cacheDir/'cache_stamp.json').read_text())
+        stamp['numba'] = '0.0'
+        (cacheDir/'cache_stamp.json').write_text(json.dumps(stamp))
+        startup.validate_cache_dir(str(cacheDir))
+        assert not (cacheDir/'models.Kernel-1.py311.nbi').exists()
+        assert (cacheDir/'notes.txt').exists()
+        assert json.loads((cacheDir/'cache_stamp.json').read_text()) == startup.cache_stamp()
+
+    def test_configure_jit_cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(numba.config, 'CACHE_DIR', numba.config.CACHE_DIR)
+        # configure_jit_cache sets the variable, which monkeypatch restores afterwards
+        monkeypatch.delenv('NUMBA_CACHE_DIR', raising=False)
+        (tmp_path/'file').write_text('')
+        cacheDir = startup.configure_jit_cache(str(tmp_path/'file'/'cache'))
+        assert cacheDir is not None and cacheDir != str(tmp_path/'file'/'cache')
+        assert numba.config.CACHE_DIR == cacheDir